@@ -0,0 +1,284 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+from flask import current_app, request, jsonify
+from flask_babel import _
+
+from metrics_utils import ADMISSION_DECISIONS
+
+# Result of an admission check; retry_after is in seconds
+Decision = namedtuple('Decision', ['allowed', 'retry_after', 'reason'])
+ALLOWED = Decision(True, 0, 'allowed')
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+class MemoryBackend:
+    """
+    Per-process state for token buckets and failure counters.
+
+    At most max_keys keys are kept; the least recently used ones are dropped so
+    a flood of spoofed addresses cannot grow memory without bound.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _touch(self, table, key, value):
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.max_keys:
+            table.popitem(last=False)
+
+    def take(self, key, rate, burst, now):
+        """Take one token from the bucket; returns seconds to wait (0 if a token was taken)"""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._touch(self._buckets, key, (tokens - 1, now))
+                return 0
+            self._touch(self._buckets, key, (tokens, now))
+            return (1 - tokens) / rate
+
+    def blocked_until(self, key):
+        with self._lock:
+            return self._failures.get(key, (0, 0))[1]
+
+    def add_failure(self, key, delay_for):
+        """Count a failure and block the key for delay_for(failure count) seconds"""
+        with self._lock:
+            count = self._failures.get(key, (0, 0))[0] + 1
+            self._touch(self._failures, key, (count, time.time() + delay_for(count)))
+            return count
+
+    def clear_failures(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._failures.clear()
+
+
+class SQLiteBackend:
+    """
+    State shared by every process on a node through a small SQLite file.
+
+    Stands in for a networked store (e.g. Redis) in multi-worker deployments:
+    all workers see the same buckets and backoff. Each operation is one short
+    IMMEDIATE transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS admission_buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS admission_failures (key TEXT PRIMARY KEY, count INTEGER, blocked_until REAL)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        # Connections must not be shared with a forked parent
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return _Transaction(connection)
+
+    def take(self, key, rate, burst, now):
+        with self._connection() as connection:
+            row = connection.execute("SELECT tokens, updated FROM admission_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            connection.execute("INSERT OR REPLACE INTO admission_buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            return wait
+
+    def blocked_until(self, key):
+        with self._connection() as connection:
+            row = connection.execute("SELECT blocked_until FROM admission_failures WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def add_failure(self, key, delay_for):
+        with self._connection() as connection:
+            row = connection.execute("SELECT count FROM admission_failures WHERE key = ?", (key,)).fetchone()
+            count = (row[0] if row else 0) + 1
+            connection.execute(
+                "INSERT OR REPLACE INTO admission_failures (key, count, blocked_until) VALUES (?, ?, ?)",
+                (key, count, time.time() + delay_for(count))
+            )
+            return count
+
+    def clear_failures(self, key):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM admission_failures WHERE key = ?", (key,))
+
+    def reset(self):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM admission_buckets")
+            connection.execute("DELETE FROM admission_failures")
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT around a block, so read-modify-write is atomic across processes"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def create_backend(spec):
+    """Backend from a spec: 'memory' or 'sqlite:///path/to/admission.db'"""
+    if not spec or spec == 'memory':
+        return MemoryBackend()
+    if spec.startswith('sqlite:///'):
+        path = spec[len('sqlite:///'):]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQLiteBackend(path)
+    raise ValueError(f"Unknown admission backend: {spec}")
+
+
+class AdmissionController:
+    """
+    Decides whether a password check may run, before any bcrypt work is done.
+
+    Token buckets limit attempts per client IP and per file id (the latter
+    caps credential stuffing spread over many addresses). After
+    failure_threshold wrong passwords for the same IP and file, further
+    attempts are refused for an exponentially growing delay, capped at
+    backoff_max; a correct password clears it.
+    """
+
+    def __init__(self, backend=None, ip_rate=2.0, ip_burst=20, file_rate=1.0, file_burst=20,
+                 failure_threshold=5, backoff_base=1.0, backoff_max=300.0):
+        self.backend = backend or MemoryBackend()
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.file_rate = file_rate
+        self.file_burst = file_burst
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def backoff_delay(self, failures):
+        if failures < self.failure_threshold:
+            return 0
+        return min(self.backoff_max, self.backoff_base * 2 ** (failures - self.failure_threshold))
+
+    def check(self, ip, file_id=None, charge_ip=True):
+        """
+        Admit or refuse one password attempt.
+
+        charge_ip=False checks backoff and the per-file bucket only, for
+        further files covered by a password check the IP was already charged for.
+        """
+        now = time.time()
+        blocked_until = self.backend.blocked_until(f"fail:{ip}:{file_id}") if file_id else 0
+        if blocked_until > now:
+            return self._decide(Decision(False, blocked_until - now, 'backoff'))
+
+        if charge_ip:
+            wait = self.backend.take(f"ip:{ip}", self.ip_rate, self.ip_burst, now)
+            if wait:
+                return self._decide(Decision(False, wait, 'ip_limited'))
+        if file_id:
+            wait = self.backend.take(f"file:{file_id}", self.file_rate, self.file_burst, now)
+            if wait:
+                return self._decide(Decision(False, wait, 'file_limited'))
+        return self._decide(ALLOWED)
+
+    def record_result(self, ip, file_id, success):
+        """Feed back the outcome of the password check"""
+        key = f"fail:{ip}:{file_id}"
+        if success:
+            self.backend.clear_failures(key)
+        else:
+            self.backend.add_failure(key, self.backoff_delay)
+
+    def reset(self):
+        self.backend.reset()
+
+    @staticmethod
+    def _decide(decision):
+        ADMISSION_DECISIONS.labels(decision.reason).inc()
+        return decision
+
+
+def init_app(app):
+    """
+    Attach an AdmissionController configured from ADMISSION_* environment variables.
+
+    Like the event bus, buckets are kept in memory with a single worker and
+    in a SQLite file shared by all workers when GUNICORN_WORKERS > 1, so a
+    client cannot multiply its budget by the number of workers.
+
+    Args:
+        app: Flask application instance
+
+    Returns:
+        AdmissionController: The controller, also stored in app.extensions['admission']
+    """
+    app.config.setdefault('ADMISSION_ENABLED', os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true')
+    app.config.setdefault('ADMISSION_TRUST_FORWARDED', os.environ.get('ADMISSION_TRUST_FORWARDED', 'false').lower() == 'true')
+    workers = int(os.environ.get('GUNICORN_WORKERS') or 1)
+    default_backend = f"sqlite:///{os.path.abspath('admission.db')}" if workers > 1 else 'memory'
+    controller = AdmissionController(
+        backend=create_backend(os.environ.get('ADMISSION_BACKEND', default_backend)),
+        ip_rate=_env_float('ADMISSION_IP_RATE', 2.0),
+        ip_burst=_env_float('ADMISSION_IP_BURST', 20),
+        file_rate=_env_float('ADMISSION_FILE_RATE', 1.0),
+        file_burst=_env_float('ADMISSION_FILE_BURST', 20),
+        failure_threshold=int(_env_float('ADMISSION_FAILURE_THRESHOLD', 5)),
+        backoff_base=_env_float('ADMISSION_BACKOFF_BASE', 1.0),
+        backoff_max=_env_float('ADMISSION_BACKOFF_MAX', 300.0)
+    )
+    app.extensions['admission'] = controller
+    return controller
+
+
+def client_ip():
+    """Client address; the first X-Forwarded-For hop only when ADMISSION_TRUST_FORWARDED is set"""
+    if current_app.config.get('ADMISSION_TRUST_FORWARDED') and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or 'unknown'
+
+
+def admit(file_id=None, charge_ip=True):
+    """Check the current request; returns None when admitted, otherwise a 429 response"""
+    if not current_app.config.get('ADMISSION_ENABLED', True):
+        return None
+    decision = current_app.extensions['admission'].check(client_ip(), file_id, charge_ip=charge_ip)
+    if decision.allowed:
+        return None
+    current_app.logger.warning(f"Password attempt refused ({decision.reason}) for file: {file_id}")
+    retry_after = max(1, int(decision.retry_after + 0.999))
+    response = jsonify({'success': False, 'message': _("Too many attempts, try again later"), 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def record_attempt(file_id, success):
+    """Report whether the password for file_id was correct"""
+    if current_app.config.get('ADMISSION_ENABLED', True):
+        current_app.extensions['admission'].record_result(client_ip(), file_id, success)
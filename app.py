@@ -1,47 +1,95 @@
 import os
 import uuid
 import re
+import time
 import logging
 import glob
 import shutil
+import tempfile
+import importlib.util
 from logging.handlers import RotatingFileHandler
 import datetime
 import functools
-from flask import Flask, request, redirect, url_for, render_template, send_from_directory, flash, jsonify, Response, after_this_request
-from flask_sqlalchemy import SQLAlchemy
+import hashlib
+import hmac
+import click
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Blueprint, current_app, has_request_context, request, redirect, url_for, render_template, send_file, send_from_directory, flash, jsonify, Response, stream_with_context
+from db_utils import ProfiledSQLAlchemy
+from db_utils import migrations as db_migrations
 from flask_bcrypt import Bcrypt
 from werkzeug.utils import secure_filename
 import mimetypes
 from flask_babel import Babel, _
 from urllib.parse import quote
+from sqlalchemy import text, event, func, inspect as sa_inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 
 from flask_cors import CORS
-app = Flask(__name__)
-CORS(app, resources={r"/*": {
-    "origins": "*",
-    "methods": ["GET", "POST", "OPTIONS"],
-    "allow_headers": ["Content-Type", "Content-Disposition", "Authorization", "X-Requested-With"],
-    "expose_headers": ["Content-Disposition", "Content-Type", "Content-Length", "X-Content-Transfer-Id"],
-    "supports_credentials": True,
-    "max_age": 86400
-}})  # Enhanced CORS for all routes
-app.secret_key = 'your-secret-key'  # Change this in production
+from static_utils import send_static_asset, send_spa_shell, preload_spa_shell
+from zip_utils import stream_zip, iter_file
+from sniff_utils import UploadSniffer, UploadRejected, copy_sniffed, MIME_TYPES
+from crypto_utils import get_master_key, encrypt_db_field, decrypt_db_field, encrypt_file, decrypt_file, iter_decrypt_file
+from cryptography.fernet import InvalidToken
+from crypto_utils import generate_data_key, wrap_data_key, unwrap_data_key, rewrap_data_key, rotate_db_field
+from metrics_utils import REGISTRY, STAGE_SECONDS, UPLOAD_BYTES, DOWNLOAD_BYTES, BOOTSTRAP_SECONDS, DECRYPTS_COALESCED, generate_latest, CONTENT_TYPE_LATEST
+from metrics_utils import flask_metrics
+import profiling_utils
+import admission_utils
+import job_queue
+import events_utils
+import plaintext_cache
+import transfer_utils
+from events_utils import format_sse
+from admission_utils import admit, record_attempt
+from transfer_utils import admit_transfer
+from flight_utils import SingleFlight, SharedBuffer
 
 # Configuration for cleanup on startup/restart
 ENABLE_STARTUP_CLEANUP = os.environ.get('ENABLE_STARTUP_CLEANUP', 'true').lower() == 'true'
 CLEANUP_STRATEGY = os.environ.get('CLEANUP_STRATEGY', 'all')  # Options: all, files, db, logs
 
+# Run bootstrap() when the module is imported (tests and tooling turn this off and call it explicitly)
+BOOTSTRAP_ON_IMPORT = os.environ.get('BOOTSTRAP_ON_IMPORT', 'true').lower() == 'true'
+BOOTSTRAP_STEPS = ('schema', 'cleanup', 'warmup')
+
+# Define upload folder – using an absolute path within the container.
+UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
+
+# Define allowed file extensions and max file size
+ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'xls', 'xlsx', 'zip'}
+MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB
+
+# All routes, request hooks and CLI commands live on this blueprint; create_app() registers it
+main = Blueprint('main', __name__, cli_group=None)
+
+# Extensions are bound to an application in create_app()
+# Engine options (pooling, SQLite WAL/pragmas, PostgreSQL timeouts) come from db_utils.engine_profile
+db = ProfiledSQLAlchemy()
+bcrypt = Bcrypt()
+babel = Babel()
+
+# Define the default locale
+@babel.localeselector
+def get_locale():
+    # Make sure we prioritize the cookie language
+    lang = request.cookies.get('lang')
+    if lang in ['hr', 'en']:
+        return lang
+    return request.accept_languages.best_match(['hr', 'en'], default='hr')
+
 # Function to clean up on application startup
 def cleanup_on_startup():
     """Performs cleanup based on environment settings"""
     if not ENABLE_STARTUP_CLEANUP:
-        app.logger.info("Startup cleanup disabled via environment variable")
+        current_app.logger.info("Startup cleanup disabled via environment variable")
         return
     
-    app.logger.info(f"Starting cleanup process with strategy: {CLEANUP_STRATEGY}")
+    current_app.logger.info(f"Starting cleanup process with strategy: {CLEANUP_STRATEGY}")
     
     # Create required directories
-    uploads_dir = os.path.join(os.getcwd(), 'uploads')
+    uploads_dir = current_app.config['UPLOAD_FOLDER']
     logs_dir = os.path.join(os.getcwd(), 'logs')
     os.makedirs(uploads_dir, exist_ok=True)
     os.makedirs(logs_dir, exist_ok=True)
@@ -49,30 +97,29 @@ def cleanup_on_startup():
     # Clean database records
     if CLEANUP_STRATEGY in ['all', 'db']:
         try:
-            with app.app_context():
-                # Ensure database is initialized
-                db.create_all()
-                # Count records before deletion
-                record_count = UploadedFile.query.count()
-                if record_count > 0:
-                    app.logger.info(f"Cleaning {record_count} records from database")
-                    UploadedFile.query.delete()
-                    db.session.commit()
-                else:
-                    app.logger.info("No database records to clean")
+            # Count records before deletion
+            record_count = UploadedFile.query.count()
+            if record_count > 0:
+                current_app.logger.info(f"Cleaning {record_count} records from database")
+                UploadedFile.query.delete()
+                next_change_seq(db.session, deletion=True)
+                # Bulk deletes bypass the flush listener that maintains the storage stats
+                recompute_storage_stats()
+                db.session.commit()
+            else:
+                current_app.logger.info("No database records to clean")
         except Exception as e:
-            app.logger.error(f"Error cleaning database records: {str(e)}")
+            current_app.logger.error(f"Error cleaning database records: {str(e)}")
             try:
                 # Rollback in case of error
                 db.session.rollback()
             except:
-                app.logger.error("Error rolling back session after database cleanup failure")
+                current_app.logger.error("Error rolling back session after database cleanup failure")
     
     # Clean uploaded files
     if CLEANUP_STRATEGY in ['all', 'files']:
         try:
             # First approach: Use glob to find all files
-            import glob
             file_paths = glob.glob(os.path.join(uploads_dir, '*'))
             files_removed = 0
             
@@ -81,24 +128,24 @@ def cleanup_on_startup():
                     os.remove(file_path)
                     files_removed += 1
                 except Exception as e:
-                    app.logger.error(f"Error removing file {file_path}: {str(e)}")
+                    current_app.logger.error(f"Error removing file {file_path}: {str(e)}")
             
             # If glob didn't find files or failed, try system commands as fallback
             if files_removed == 0:
-                app.logger.info("Using alternative cleanup method for uploads directory")
+                current_app.logger.info("Using alternative cleanup method for uploads directory")
                 try:
                     # Alternative approach with system command
                     if os.name == 'nt':  # Windows
                         os.system(f'del /Q /F "{uploads_dir}\\*"')
                     else:  # Unix/Linux/Mac
                         os.system(f'rm -f {uploads_dir}/*')
-                    app.logger.info("Alternative file cleanup completed")
+                    current_app.logger.info("Alternative file cleanup completed")
                 except Exception as e:
-                    app.logger.error(f"Error in alternative file cleanup: {str(e)}")
+                    current_app.logger.error(f"Error in alternative file cleanup: {str(e)}")
             else:
-                app.logger.info(f"Removed {files_removed} files from uploads directory")
+                current_app.logger.info(f"Removed {files_removed} files from uploads directory")
         except Exception as e:
-            app.logger.error(f"Error cleaning upload files: {str(e)}")
+            current_app.logger.error(f"Error cleaning upload files: {str(e)}")
     
     # Clean logs
     if CLEANUP_STRATEGY in ['all', 'logs']:
@@ -112,16 +159,16 @@ def cleanup_on_startup():
                     # Open file in write mode to truncate content
                     with open(log_file, 'w') as f:
                         f.write(f"--- Log reset at {datetime.datetime.now()} ---\n")
-                    app.logger.info(f"Reset log file: {os.path.basename(log_file)}")
+                    current_app.logger.info(f"Reset log file: {os.path.basename(log_file)}")
                 except Exception as e:
-                    app.logger.error(f"Error resetting log file {log_file}: {str(e)}")
+                    current_app.logger.error(f"Error resetting log file {log_file}: {str(e)}")
         except Exception as e:
-            app.logger.error(f"Error cleaning logs: {str(e)}")
+            current_app.logger.error(f"Error cleaning logs: {str(e)}")
     
-    app.logger.info("Cleanup process completed")
+    current_app.logger.info("Cleanup process completed")
 
 # Force HTTPS middleware - only on production
-@app.before_request
+@main.before_app_request
 def force_https():
     # Only force HTTPS on Heroku or other production environments using X-Forwarded-Proto
     # Skip this in Docker or local environments
@@ -130,7 +177,7 @@ def force_https():
         return redirect(url, code=301)
 
 # Add middleware to set security headers for all responses
-@app.after_request
+@main.after_app_request
 def add_security_headers(response):
     # Only add these headers in production, not in Docker or local dev
     if not request.host.startswith('127.0.0.1') and not request.host.startswith('localhost') and 'herokuapp.com' in request.host:
@@ -139,7 +186,11 @@ def add_security_headers(response):
     return response
 
 # Configure logging
-def setup_logging():
+def setup_logging(app):
+    # Handlers are attached to the logger named after the app; configure them only once per process
+    if getattr(app.logger, '_file_handlers_installed', False):
+        return
+    
     # Create logs directory if it doesn't exist
     logs_dir = os.path.join(os.getcwd(), 'logs')
     os.makedirs(logs_dir, exist_ok=True)
@@ -151,8 +202,6 @@ def setup_logging():
     class RequestFilter(logging.Filter):
         def filter(self, record):
             # Safely check for request context
-            from flask import has_request_context
-            
             if has_request_context():
                 record.ip = request.remote_addr
                 record.user_agent = request.user_agent.string if hasattr(request, 'user_agent') else 'N/A'
@@ -196,79 +245,123 @@ def setup_logging():
         console_handler.setFormatter(log_formatter)
         console_handler.addFilter(RequestFilter())
         app.logger.addHandler(console_handler)
+    app.logger._file_handlers_installed = True
 
-# Initialize Flask-Bcrypt
-bcrypt = Bcrypt(app)
-
-# Initialize Flask-Babel
-babel = Babel(app)
-
-# Define the default locale
-@babel.localeselector
-def get_locale():
-    # Make sure we prioritize the cookie language
-    lang = request.cookies.get('lang')
-    if lang in ['hr', 'en']:
-        return lang
-    return request.accept_languages.best_match(['hr', 'en'], default='hr')
+def sqlite_database_url():
+    database_path = os.path.join(os.getcwd(), 'fileupload.db')
+    # Ensure parent directory exists
+    os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+    return f'sqlite:///{database_path}'
 
-# Modify your database configuration
-database_url = os.environ.get('DATABASE_URL')
-if database_url:
+def resolve_database_url(logger):
+    """DATABASE_URL if its driver is installed, SQLite otherwise"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        # Use SQLite for demonstration
+        return sqlite_database_url()
+    
     # Fix for Heroku PostgreSQL URL format (if needed)
     database_url = re.sub(r'^postgres:', 'postgresql:', database_url)
     
-    # Check if psycopg2 is available
+    # Check if psycopg2 is available without importing it; the engine loads it on first connect
+    if importlib.util.find_spec('psycopg2') is not None:
+        logger.info("PostgreSQL support available, using PostgreSQL database")
+        return database_url
+    logger.warning("PostgreSQL support not available, falling back to SQLite")
+    return sqlite_database_url()
+
+def create_app(config=None):
+    """
+    Create and configure the Flask application.
+
+    Only configuration happens here: no database access, cleanup or warmup.
+    Those are the separate bootstrap() steps.
+
+    Args:
+        config: Optional mapping applied on top of the environment-derived configuration
+
+    Returns:
+        Flask: The configured application
+    """
+    start = time.perf_counter()
+    app = Flask(__name__)
+    CORS(app, resources={r"/*": {
+        "origins": "*",
+        "methods": ["GET", "HEAD", "POST", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Content-Disposition", "Authorization", "X-Requested-With"],
+        "expose_headers": ["Content-Disposition", "Content-Type", "Content-Length", "ETag", "Last-Modified", "X-Content-Transfer-Id"],
+        "supports_credentials": True,
+        "max_age": 86400
+    }})  # Enhanced CORS for all routes
+    app.secret_key = 'your-secret-key'  # Change this in production
+    
+    # Initialize logging
+    setup_logging(app)
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = resolve_database_url(app.logger)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    # Return from uploads once the bytes are on disk; encryption and hashing run on the job queue
+    app.config['ASYNC_UPLOADS'] = os.environ.get('ASYNC_UPLOADS', 'false').lower() == 'true'
+    app.config.update(config or {})
+    
+    # Ensure the uploads folder exists
     try:
-        import psycopg2
-        app.logger.info("PostgreSQL support available, using PostgreSQL database")
-    except ImportError:
-        app.logger.warning("PostgreSQL support not available, falling back to SQLite")
-        # Use SQLite for fallback
-        database_path = os.path.join(os.getcwd(), 'fileupload.db')
-        # Ensure parent directory exists
-        os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
-        database_url = f'sqlite:///{database_path}'
-else:
-    # Use SQLite for demonstration
-    database_path = os.path.join(os.getcwd(), 'fileupload.db')
-    # Ensure parent directory exists
-    os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
-    database_url = f'sqlite:///{database_path}'
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        app.logger.info(f"Uploads directory created at {app.config['UPLOAD_FOLDER']}")
+    except Exception as e:
+        app.logger.error(f"Error creating uploads directory: {e}")
+    
+    db.init_app(app)
+    bcrypt.init_app(app)
+    babel.init_app(app)
+    app.register_blueprint(main)
+    
+    # Request timing, DB commit timing and pool gauges for /metrics
+    flask_metrics.init_app(app, db)
+    # On-demand cProfile of requests (X-Profile header with admin key, or PROFILE_SAMPLE_RATE)
+    profiling_utils.init_app(app, is_admin_request)
+    # Token buckets and failure backoff in front of every password check
+    admission_utils.init_app(app)
+    # Durable local queue for post-upload processing
+    jobs = job_queue.init_app(app)
+    jobs.register('process_upload', process_upload_job, on_give_up=upload_processing_failed)
+    # Storage stats are maintained per change; the periodic recompute corrects any drift
+    jobs.register('recompute_stats', recompute_storage_stats_job)
+    jobs.schedule('recompute_stats', float(os.environ.get('STATS_RECOMPUTE_INTERVAL', 3600)))
+    # Listings trust UploadedFile.storage_status; the reconciler keeps it in line with the disk
+    jobs.register('reconcile_storage', reconcile_storage_job)
+    jobs.schedule('reconcile_storage', float(os.environ.get('STORAGE_RECONCILE_INTERVAL', 600)))
+    # Live upload/download/delete events for /api/events subscribers
+    events_utils.init_app(app)
+    # Opt-in decrypted copies of hot files (PLAINTEXT_CACHE_DIR), swept of expired entries by a job
+    if plaintext_cache.init_app(app, popularity=download_counts) is not None:
+        jobs.register('sweep_plaintext_cache', sweep_plaintext_cache_job)
+        jobs.schedule('sweep_plaintext_cache', max(1.0, app.extensions['plaintext_cache'].ttl / 2))
+    # Separate slots for small and large uploads/downloads, so large ones cannot starve the rest
+    transfer_utils.init_app(app)
+    
+    BOOTSTRAP_SECONDS.labels('create_app').set(time.perf_counter() - start)
+    return app
 
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# Define upload folder – using an absolute path within the container.
-UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
-# Ensure the uploads folder exists
-try:
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    app.logger.info(f"Uploads directory created at {UPLOAD_FOLDER}")
-except Exception as e:
-    app.logger.error(f"Error creating uploads directory: {e}")
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-# Initialize logging
-setup_logging()
-
-# Call cleanup function at startup
-if __name__ == '__main__':
-    # Call cleanup function on startup when run directly
-    with app.app_context():
-        cleanup_on_startup()
-        
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)  # Set debug=False for production
-else:  # When imported by WSGI server
-    with app.app_context():
-        cleanup_on_startup()
+def configure_worker_layout(app):
+    """
+    Rebuild the extensions sized from the gunicorn worker layout.
 
-# Define allowed file extensions and max file size
-ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'xls', 'xlsx', 'zip'}
-MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB
+    Their defaults come from GUNICORN_WORKERS, GUNICORN_THREADS and
+    GUNICORN_WORKER_CLASS. A preloaded app is created before gunicorn
+    exports those (on_starting), so gunicorn.conf.py calls this before
+    forking the workers. Only run it while no requests are being served.
 
-db = SQLAlchemy(app)
+    Args:
+        app: Flask application instance
+    """
+    admission_utils.init_app(app)
+    events_utils.init_app(app)
+    transfer_utils.configure(app)
+    app.logger.info(f"Sized for {os.environ.get('GUNICORN_WORKERS')} {os.environ.get('GUNICORN_WORKER_CLASS')} workers "
+                    f"with {os.environ.get('GUNICORN_THREADS')} threads")
 
 # Define the database model
 class UploadedFile(db.Model):
@@ -277,153 +370,571 @@ class UploadedFile(db.Model):
     _file_path = db.Column('file_path_encrypted', db.Text, nullable=False)  # Encrypted filepath
     password_hash = db.Column(db.String(255), nullable=False)  # Store hashed password
     password = db.Column(db.String(255), nullable=False)  # This might be the missing column
-    upload_date = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    upload_date = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
     download_count = db.Column(db.Integer, default=0)
     is_encrypted = db.Column(db.Boolean, default=True)  # Flag to indicate if file is encrypted
     encryption_salt = db.Column(db.LargeBinary, nullable=True)  # Salt for encryption (if used)
+    wrapped_key = db.Column(db.LargeBinary, nullable=True)  # Per-file data key, encrypted with the master key
+    status = db.Column(db.String(16), nullable=False, default='ready', server_default='ready')  # processing, ready or failed
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)  # Change number of the last insert/update
+    file_size = db.Column(db.BigInteger, nullable=True)  # Plaintext size in bytes (None for uploads older than the storage stats)
+    file_type = db.Column(db.String(16), nullable=True)  # Lower-case extension, the key of the per-type storage stats
+    stored_size = db.Column(db.BigInteger, nullable=True)  # Bytes on disk (the encrypted size once encrypted)
+    mime_type = db.Column(db.String(100), nullable=True)  # Content type detected when the upload was sniffed
+    sha256 = db.Column(db.String(64), nullable=True)  # Hex SHA-256 of the plaintext
+    storage_status = db.Column(db.String(16), nullable=False, default='present', server_default='present')  # present or missing, kept up to date by reconcile_storage()
+    
+    def data_key(self):
+        """Unwrapped per-file data key, or None for files encrypted directly with the master key"""
+        if not self.wrapped_key:
+            return None
+        return unwrap_data_key(self.wrapped_key)
     
     @property
     def file_name(self):
         """Get decrypted file name"""
         try:
-            from crypto_utils import decrypt_db_field
             if self.is_encrypted and self._file_name:
                 decrypted = decrypt_db_field(self._file_name)
                 if decrypted:
                     return decrypted
-                app.logger.warning(f"Failed to decrypt file_name, using raw value for: {self.id}")
+                current_app.logger.warning(f"Failed to decrypt file_name, using raw value for: {self.id}")
             return self._file_name
         except Exception as e:
-            app.logger.error(f"Error in file_name getter: {str(e)} for file: {self.id}")
+            current_app.logger.error(f"Error in file_name getter: {str(e)} for file: {self.id}")
             return self._file_name or "unknown_file"
         
     @file_name.setter
     def file_name(self, value):
         """Set encrypted file name"""
         try:
-            from crypto_utils import encrypt_db_field
             if value and self.is_encrypted:
                 encrypted = encrypt_db_field(value)
                 if encrypted:
                     self._file_name = encrypted
                 else:
-                    app.logger.warning(f"Failed to encrypt file_name, using raw value for: {value}")
+                    current_app.logger.warning(f"Failed to encrypt file_name, using raw value for: {value}")
                     self._file_name = value
             else:
                 self._file_name = value
         except Exception as e:
-            app.logger.error(f"Error in file_name setter: {str(e)}")
+            current_app.logger.error(f"Error in file_name setter: {str(e)}")
             self._file_name = value
     
     @property
     def file_path(self):
         """Get decrypted file path"""
         try:
-            from crypto_utils import decrypt_db_field
             if self.is_encrypted and self._file_path:
                 decrypted = decrypt_db_field(self._file_path)
                 if decrypted:
                     return decrypted
-                app.logger.warning(f"Failed to decrypt file_path, using raw value for: {self.id}")
+                current_app.logger.warning(f"Failed to decrypt file_path, using raw value for: {self.id}")
             return self._file_path
         except Exception as e:
-            app.logger.error(f"Error in file_path getter: {str(e)} for file: {self.id}")
+            current_app.logger.error(f"Error in file_path getter: {str(e)} for file: {self.id}")
             return self._file_path
         
     @file_path.setter
     def file_path(self, value):
         """Set encrypted file path"""
         try:
-            from crypto_utils import encrypt_db_field
             if value and self.is_encrypted:
                 encrypted = encrypt_db_field(value)
                 if encrypted:
                     self._file_path = encrypted
                 else:
-                    app.logger.warning(f"Failed to encrypt file_path, using raw value for: {value}")
+                    current_app.logger.warning(f"Failed to encrypt file_path, using raw value for: {value}")
                     self._file_path = value
             else:
                 self._file_path = value
         except Exception as e:
-            app.logger.error(f"Error in file_path setter: {str(e)}")
+            current_app.logger.error(f"Error in file_path setter: {str(e)}")
             self._file_path = value
 
-# Create database tables (if they don't exist)
-with app.app_context():
+class ChangeCounter(db.Model):
+    """Single row counting changes to uploaded files; /api/logs cursors and ETags are derived from it"""
+    __tablename__ = 'change_counter'
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    last_delete = db.Column(db.Integer, nullable=False, default=0)  # Change number of the last deletion
+
+def next_change_seq(session, deletion=False):
+    """Increment the change counter inside the session's transaction; returns the new value"""
+    values = {'value': ChangeCounter.value + 1}
+    if deletion:
+        values['last_delete'] = ChangeCounter.value + 1
+    # The row lock taken by the UPDATE orders concurrent writers until they commit
+    if not session.query(ChangeCounter).filter_by(id=1).update(values, synchronize_session=False):
+        # Inside before_flush the new row joins the flush in progress
+        session.add(ChangeCounter(id=1, value=1, last_delete=1 if deletion else 0))
+        return 1
+    return session.query(ChangeCounter.value).filter_by(id=1).scalar()
+
+def current_changes():
+    """(change counter, change number of the last deletion)"""
+    row = db.session.query(ChangeCounter.value, ChangeCounter.last_delete).filter_by(id=1).first()
+    return (row.value, row.last_delete) if row else (0, 0)
+
+def note_change(deletion=False):
+    """Record a change that is not an UploadedFile flush, e.g. a bulk delete or a download event in the log"""
+    next_change_seq(db.session, deletion)
+    db.session.commit()
+
+class StorageStat(db.Model):
+    """
+    Upload aggregates maintained in the same transaction as every upload, download and delete.
+
+    scope 'total' (key ''): files and bytes stored, downloads of those files
+    scope 'type' (key file type): the same per file type
+    scope 'day' (key YYYY-MM-DD): files and bytes stored per upload day, downloads made on that day
+    """
+    __tablename__ = 'storage_stats'
+    scope = db.Column(db.String(8), primary_key=True)
+    key = db.Column(db.String(16), primary_key=True)
+    files = db.Column(db.Integer, nullable=False, default=0)
+    file_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {'files': self.files, 'bytes': self.file_bytes, 'downloads': self.downloads}
+
+def file_type_of(filename):
+    """Lower-case extension of a file name, '' without one"""
+    return filename.rsplit('.', 1)[1].lower()[:16] if '.' in filename else ''
+
+def _day_key(value):
+    return (value or datetime.datetime.utcnow()).strftime('%Y-%m-%d')
+
+def _history_delta(obj, attribute):
+    """Change of a numeric attribute since it was loaded, for a flushed-but-dirty object"""
+    history = sa_inspect(obj).attrs[attribute].history
+    if not history.added:
+        return 0
+    return (history.added[0] or 0) - (history.deleted[0] if history.deleted and history.deleted[0] else 0)
+
+def storage_stat_deltas(session):
+    """{(scope, key): [files, bytes, downloads]} changes implied by the UploadedFile objects about to be flushed"""
+    deltas = {}
+    
+    def add(record, files, size, downloads, day_downloads=None):
+        for scope, key in (('total', ''), ('type', record.file_type or 'unknown')):
+            delta = deltas.setdefault((scope, key), [0, 0, 0])
+            delta[0] += files
+            delta[1] += size
+            delta[2] += downloads
+        delta = deltas.setdefault(('day', _day_key(record.upload_date)), [0, 0, 0])
+        delta[0] += files
+        delta[1] += size
+        if day_downloads:
+            today = deltas.setdefault(('day', _day_key(None)), [0, 0, 0])
+            today[2] += day_downloads
+    
+    for obj in session.new:
+        if isinstance(obj, UploadedFile):
+            add(obj, 1, obj.file_size or 0, obj.download_count or 0)
+    for obj in session.deleted:
+        if isinstance(obj, UploadedFile):
+            # Downloads stay counted on the day they were made
+            add(obj, -1, -(obj.file_size or 0), -(obj.download_count or 0))
+    for obj in session.dirty:
+        if isinstance(obj, UploadedFile) and obj not in session.new:
+            downloads = _history_delta(obj, 'download_count')
+            size = _history_delta(obj, 'file_size')
+            if downloads or size:
+                add(obj, 0, size, downloads, day_downloads=downloads)
+    return {key: delta for key, delta in deltas.items() if any(delta)}
+
+def apply_storage_stats(session, deltas):
+    """Add deltas to the storage_stats rows inside the session's transaction"""
+    for (scope, key), (files, size, downloads) in sorted(deltas.items()):
+        updated = session.query(StorageStat).filter_by(scope=scope, key=key).update({
+            'files': StorageStat.files + files,
+            'file_bytes': StorageStat.file_bytes + size,
+            'downloads': StorageStat.downloads + downloads
+        }, synchronize_session=False)
+        if not updated:
+            # No concurrent insert of the same key: the change counter row lock is already held
+            session.add(StorageStat(scope=scope, key=key, files=files, file_bytes=size, downloads=downloads))
+
+def _stamp_changed_files(session, flush_context, instances):
+    """Give inserted and updated uploads the next change number and update the storage stats; deletions force full /api/logs reloads"""
+    changed = [obj for obj in list(session.new) + list(session.dirty)
+               if isinstance(obj, UploadedFile) and (obj in session.new or session.is_modified(obj))]
+    deleted = any(isinstance(obj, UploadedFile) for obj in session.deleted)
+    if not changed and not deleted:
+        return
+    seq = next_change_seq(session, deleted)
+    for obj in changed:
+        obj.change_seq = seq
+    apply_storage_stats(session, storage_stat_deltas(session))
+
+def recompute_storage_stats():
+    """
+    Rebuild the storage stats from uploaded_file in the current transaction, correcting drift.
+
+    Per-day download counts have no other source and are kept. The caller commits.
+
+    Returns:
+        dict: The recomputed totals
+    """
+    session = db.session
+    # A no-op update takes the change counter lock, so uploads cannot commit between the scan and the write
+    session.query(ChangeCounter).filter_by(id=1).update({'value': ChangeCounter.value}, synchronize_session=False)
+    
+    columns = (func.count(UploadedFile.id), func.coalesce(func.sum(UploadedFile.file_size), 0), func.coalesce(func.sum(UploadedFile.download_count), 0))
+    expected = {('total', ''): tuple(session.query(*columns).one())}
+    for file_type, files, size, downloads in session.query(UploadedFile.file_type, *columns).group_by(UploadedFile.file_type):
+        expected[('type', file_type or 'unknown')] = (files, size, downloads)
+    for day, files, size, _downloads in session.query(func.date(UploadedFile.upload_date), *columns).group_by(func.date(UploadedFile.upload_date)):
+        if day is not None:
+            expected[('day', str(day)[:10])] = (files, size, None)
+    
+    drift = 0
+    for row in session.query(StorageStat).all():
+        files, size, downloads = expected.pop((row.scope, row.key), (0, 0, None if row.scope == 'day' else 0))
+        if (row.files, row.file_bytes) != (files, size) or (downloads is not None and row.downloads != downloads):
+            drift += 1
+        row.files, row.file_bytes = files, size
+        if downloads is not None:
+            row.downloads = downloads
+        if not (row.files or row.file_bytes or row.downloads) and row.scope != 'total':
+            session.delete(row)
+    for (scope, key), (files, size, downloads) in expected.items():
+        drift += 1
+        session.add(StorageStat(scope=scope, key=key, files=files, file_bytes=size, downloads=downloads or 0))
+    if drift:
+        current_app.logger.warning(f"Storage stats recomputed, {drift} rows corrected")
+    return storage_totals()
+
+def recompute_storage_stats_job(payload):
+    """Periodic job handler: correct drift in the storage stats"""
+    recompute_storage_stats()
+    db.session.commit()
+
+def stored_file_size(file_path):
+    """Size of a stored upload at its recorded path or its .encrypted variant, None if neither exists"""
+    for path in (file_path, file_path + '.encrypted'):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            continue
+    return None
+
+def reconcile_storage(batch_size=500):
+    """
+    Bring storage_status and stored_size in line with the uploads folder.
+
+    Listings trust storage_status instead of checking the disk, so this runs
+    periodically. Uploads from before the metadata columns also get their
+    type, content type and (if unencrypted) plaintext size; their checksum
+    stays empty since that would need a decrypt. Uploads still being
+    processed are skipped, their job owns the file.
+
+    Returns:
+        dict: Counts of checked, missing, restored and backfilled records
+    """
+    counts = {'checked': 0, 'missing': 0, 'restored': 0, 'backfilled': 0}
+    last_id = ''
+    while True:
+        batch = (UploadedFile.query
+                 .filter(UploadedFile.id > last_id, UploadedFile.status != 'processing')
+                 .order_by(UploadedFile.id).limit(batch_size).all())
+        if not batch:
+            return counts
+        for record in batch:
+            counts['checked'] += 1
+            size = stored_file_size(record.file_path)
+            status = 'present' if size is not None else 'missing'
+            if status != record.storage_status:
+                counts['restored' if size is not None else 'missing'] += 1
+                current_app.logger.warning(f"Stored file of {record.id} is now {status}")
+                record.storage_status = status
+            if size is not None and record.stored_size != size:
+                record.stored_size = size
+            if record.file_type is None:
+                # The per-type storage stats pick this up on their next recompute
+                counts['backfilled'] += 1
+                record.file_type = file_type_of(record.file_name)
+                record.mime_type = record.mime_type or MIME_TYPES.get(record.file_type)
+                if record.file_size is None and not record.is_encrypted:
+                    record.file_size = size
+        # Read before the commit: after a rollback the records are expired, and the last may be gone
+        last_id = batch[-1].id
+        try:
+            db.session.commit()
+        except StaleDataError:
+            # A record of this batch was deleted meanwhile; the next run checks the rest again
+            db.session.rollback()
+            current_app.logger.info("Storage reconciliation batch skipped after a concurrent delete")
+        db.session.expunge_all()
+
+def reconcile_storage_job(payload):
+    """Periodic job handler: refresh storage_status from the uploads folder"""
+    counts = reconcile_storage()
+    if counts['missing'] or counts['restored'] or counts['backfilled']:
+        current_app.logger.info(f"Storage reconciled: {counts}")
+
+def storage_totals():
+    """Files, bytes and downloads currently stored, from one aggregate row (e.g. for quota checks)"""
+    row = db.session.query(StorageStat.files, StorageStat.file_bytes, StorageStat.downloads).filter_by(scope='total', key='').first()
+    return {'files': row[0], 'bytes': row[1], 'downloads': row[2]} if row else {'files': 0, 'bytes': 0, 'downloads': 0}
+
+# Session events are global, so install the listener only once per process
+if not event.contains(Session, 'before_flush', _stamp_changed_files):
+    event.listen(Session, 'before_flush', _stamp_changed_files)
+
+def init_database():
+    """Create missing tables, then apply pending schema migrations"""
+    db.create_all()
+    applied = db_migrations.upgrade(db.engine)
+    if applied:
+        current_app.logger.info(f"Applied schema migrations: {applied}")
+
+def ensure_storage_stats():
+    """Build the storage stats once for a database that has uploads from before they were maintained"""
+    if db.session.query(StorageStat.scope).filter_by(scope='total', key='').first() is None:
+        recompute_storage_stats()
+    db.session.commit()
+
+def bootstrap_schema():
+    """Create database tables (if they don't exist) and bring the schema up to date"""
     try:
         # Only create tables if they don't exist, don't drop tables
-        # db.drop_all()  # Removed to prevent data loss
-        db.create_all()
-        app.logger.info("Database tables created successfully (if they didn't exist)")
+        init_database()
+        ensure_storage_stats()
+        current_app.logger.info("Database tables created successfully (if they didn't exist)")
     except Exception as e:
-        app.logger.error(f"Error creating database tables: {e}")
+        current_app.logger.error(f"Error creating database tables: {e}")
         # If we're using PostgreSQL and it fails, try to fall back to SQLite
-        if 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI'].lower():
+        if 'postgresql' in current_app.config['SQLALCHEMY_DATABASE_URI'].lower():
             try:
-                app.logger.warning("Attempting to fall back to SQLite database")
-                # Switch to SQLite
-                database_path = os.path.join(os.getcwd(), 'fileupload.db')
-                app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
-                # Recreate the engine with the new connection string
-                db.engine.dispose()
-                db.get_engine(app, bind=None)
-                # Try again with SQLite
-                # db.drop_all()  # Removed to prevent data loss
-                db.create_all()
-                app.logger.info("Database tables created successfully with SQLite fallback")
+                current_app.logger.warning("Attempting to fall back to SQLite database")
+                # Switch to SQLite and recreate the engine with the new connection string
+                db.get_engine().dispose()
+                current_app.config['SQLALCHEMY_DATABASE_URI'] = sqlite_database_url()
+                init_database()
+                ensure_storage_stats()
+                current_app.logger.info("Database tables created successfully with SQLite fallback")
             except Exception as inner_e:
-                app.logger.error(f"Error creating SQLite fallback database: {inner_e}")
+                current_app.logger.error(f"Error creating SQLite fallback database: {inner_e}")
+
+def bootstrap_warmup():
+    """Pay one-off costs before the first request: master key, DB connection, SPA shell"""
+    get_master_key()
+    try:
+        db.session.execute(text('SELECT 1'))
+    finally:
+        db.session.remove()
+    with current_app.test_request_context('/'):
+        preload_spa_shell('minimal_react.html')
+
+BOOTSTRAP_HANDLERS = {
+    'schema': bootstrap_schema,
+    'cleanup': cleanup_on_startup,
+    'warmup': bootstrap_warmup
+}
+
+def bootstrap(app, steps=BOOTSTRAP_STEPS):
+    """
+    Run startup steps against an application and time each one.
+
+    Steps run in the given order; a failing step is logged and does not stop
+    the others. Durations are exported as bootstrap_seconds{phase=...}.
+
+    Args:
+        app: Flask application instance
+        steps: Names from BOOTSTRAP_HANDLERS
+
+    Returns:
+        dict: Seconds spent per step
+    """
+    timings = {}
+    with app.app_context():
+        for step in steps:
+            start = time.perf_counter()
+            try:
+                BOOTSTRAP_HANDLERS[step]()
+            except Exception as e:
+                app.logger.error(f"Bootstrap step {step} failed: {str(e)}")
+            timings[step] = time.perf_counter() - start
+            BOOTSTRAP_SECONDS.labels(step).set(timings[step])
+    app.logger.info("Bootstrap finished: " + ', '.join(f"{step} {seconds * 1000:.1f}ms" for step, seconds in timings.items()))
+    return timings
+
+@main.cli.command('bootstrap')
+@click.option('--steps', default=','.join(BOOTSTRAP_STEPS), help="Comma separated steps to run")
+def bootstrap_command(steps):
+    """Run startup steps (schema, cleanup, warmup) and print their timings."""
+    for step, seconds in bootstrap(current_app._get_current_object(), [s.strip() for s in steps.split(',') if s.strip()]).items():
+        print(f"{step:10} {seconds * 1000:8.1f} ms")
+
+@main.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema migrations."""
+    init_database()
+    print(f"Schema is at version {db_migrations.current_version(db.engine)}")
+
+@main.cli.command('recompute-stats')
+def recompute_stats_command():
+    """Rebuild the storage stats from the uploaded files table."""
+    totals = recompute_storage_stats()
+    db.session.commit()
+    print(f"{totals['files']} files, {totals['bytes']} bytes, {totals['downloads']} downloads")
+
+@main.cli.command('reconcile-storage')
+@click.option('--batch-size', default=500, help="Records per transaction")
+def reconcile_storage_command(batch_size):
+    """Check every upload against the uploads folder and update its storage status."""
+    counts = reconcile_storage(batch_size)
+    print(f"Checked {counts['checked']} files: {counts['missing']} missing, {counts['restored']} restored, {counts['backfilled']} backfilled")
+
+@main.cli.command('db-status')
+def db_status_command():
+    """Show the schema version and pending migrations."""
+    print(f"Current version: {db_migrations.current_version(db.engine)}")
+    for migration in db_migrations.pending_migrations(db.engine):
+        print(f"Pending {migration.version}: {migration.description}")
+
+def rotate_master_key(batch_size=500, reencrypt_legacy=False):
+    """
+    Re-encrypt key material under the current master key.
+
+    Set the new key as MASTER_ENCRYPTION_KEY and the old one in
+    MASTER_ENCRYPTION_KEY_PREVIOUS first. Each record's wrapped data key and
+    encrypted name/path fields are rewritten; file contents are not touched.
+    Files encrypted directly with the master key (before data keys existed)
+    are only rewritten with reencrypt_legacy, which gives them a data key.
+
+    Returns:
+        dict: Counts of rotated, legacy and failed records
+    """
+    counts = {'rotated': 0, 'legacy': 0, 'reencrypted': 0, 'failed': 0}
+    last_id = ''
+    while True:
+        # Keyset pagination keeps every batch an index range scan
+        batch = UploadedFile.query.filter(UploadedFile.id > last_id).order_by(UploadedFile.id).limit(batch_size).all()
+        if not batch:
+            return counts
+        for record in batch:
+            # Compute everything first so a failure leaves the record untouched
+            try:
+                updates = {}
+                if record.is_encrypted:
+                    for field in ('_file_name', '_file_path'):
+                        try:
+                            updates[field] = rotate_db_field(getattr(record, field))
+                        except InvalidToken:
+                            # Not a token: the field was stored in plain text, nothing to rotate
+                            pass
+                if record.wrapped_key:
+                    updates['wrapped_key'] = rewrap_data_key(record.wrapped_key)
+            except Exception as e:
+                counts['failed'] += 1
+                current_app.logger.error(f"Key rotation failed for {record.id}: {str(e)}")
+                continue
+            for name, value in updates.items():
+                setattr(record, name, value)
+            if record.wrapped_key:
+                counts['rotated'] += 1
+            elif record.is_encrypted:
+                counts['legacy'] += 1
+                if reencrypt_legacy:
+                    try:
+                        reencrypt_with_data_key(record)
+                        counts['reencrypted'] += 1
+                    except Exception as e:
+                        counts['failed'] += 1
+                        current_app.logger.error(f"Re-encryption failed for {record.id}: {str(e)}")
+        db.session.commit()
+        last_id = batch[-1].id
+        db.session.expunge_all()
+
+def reencrypt_with_data_key(record):
+    """
+    Move a file encrypted with the master key to a new data key.
+
+    The whole file is rewritten, so the record is committed right after the
+    new file replaces the old one.
+    """
+    stored_path = find_stored_file(record.id, record.file_path)
+    if not stored_path or not stored_path.endswith('.encrypted'):
+        raise IOError(f"Encrypted file not found for {record.id}")
+    data_key = generate_data_key()
+    fd, plain_path = tempfile.mkstemp(dir=os.path.dirname(stored_path))
+    os.close(fd)
+    temp_encrypted_path = f"{stored_path}.rekey"
+    try:
+        with open(plain_path, 'wb') as f:
+            for chunk in iter_decrypt_file(stored_path):
+                f.write(chunk)
+        if encrypt_file(plain_path, temp_encrypted_path, key=data_key) != temp_encrypted_path:
+            raise IOError(f"Could not re-encrypt {record.id}")
+        wrapped_key = wrap_data_key(data_key)
+        os.replace(temp_encrypted_path, stored_path)
+        record.wrapped_key = wrapped_key
+        db.session.commit()
+    finally:
+        for path in (plain_path, temp_encrypted_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+@main.cli.command('rotate-keys')
+@click.option('--batch-size', default=500, help="Records per transaction")
+@click.option('--reencrypt-legacy', is_flag=True, help="Give files encrypted directly with the master key their own data key")
+def rotate_keys_command(batch_size, reencrypt_legacy):
+    """Re-wrap data keys and database fields under the current master key."""
+    start = time.perf_counter()
+    counts = rotate_master_key(batch_size, reencrypt_legacy)
+    print(f"Rotated {counts['rotated']} data keys in {time.perf_counter() - start:.1f}s "
+          f"({counts['legacy']} legacy files, {counts['reencrypted']} re-encrypted, {counts['failed']} failed)")
+
+# Password hashing helpers, timed so bcrypt cost shows up in /metrics
+def hash_password(password):
+    with STAGE_SECONDS.labels('bcrypt').time():
+        return bcrypt.generate_password_hash(password).decode('utf-8')
+
+def check_password(password_hash, password):
+    with STAGE_SECONDS.labels('bcrypt').time():
+        return bcrypt.check_password_hash(password_hash, password)
+
+# Helper function to check admin credentials (X-Admin-Key or Bearer admin key)
+def is_admin_request():
+    admin_key = current_app.config.get('ADMIN_KEY', 'admin-key')
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer ') and auth_header.split(' ', 1)[1] == admin_key:
+        return True
+    return request.headers.get('X-Admin-Key') == admin_key
 
 # Helper function to check if a file has an allowed extension
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Helper function to validate file MIME type
-def validate_mime_type(file):
-    # Read the first 2048 bytes to determine MIME type
-    file_head = file.read(2048)
-    file.seek(0)  # Reset file pointer
-    
-    # Get MIME type from the file
-    mime_type = mimetypes.guess_type(file.filename)[0]
-    
-    # List of allowed MIME types
-    allowed_mime_types = [
-        'text/plain', 'application/pdf', 'image/png', 'image/jpeg', 'image/gif',
-        'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-        'application/vnd.ms-excel', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        'application/zip'
-    ]
-    
-    if mime_type not in allowed_mime_types:
-        return False
-    
-    # Additional check for potential malicious content
-    if b'<script' in file_head.lower():
-        return False
-        
-    return True
-
-@app.route('/favicon.ico')
+@main.route('/favicon.ico')
 def favicon():
     return '', 204  # No content
 
-@app.before_request
+@main.before_app_request
 def log_request_info():
     # Log basic request information
-    app.logger.info(
+    current_app.logger.info(
         f"Request: {request.method} {request.path} - "
         f"Referrer: {request.referrer}"
     )
 
-@app.route('/', methods=['GET', 'POST'], defaults={'path': ''})
-@app.route('/<path:path>')
+@main.before_app_request
+def start_job_workers():
+    # Per process, so uploads left queued by a restart and periodic jobs run without a new upload
+    current_app.extensions['jobs'].ensure_started()
+
+@main.route('/', methods=['GET', 'POST'], defaults={'path': ''})
+@main.route('/<path:path>')
 def index(path):
-    app.logger.info(f"Root route called with method: {request.method}, path: {path}")
+    current_app.logger.info(f"Root route called with method: {request.method}, path: {path}")
     
     # Handle some specific paths
     if path == 'favicon.ico':
-        return send_from_directory(os.path.join(app.root_path, 'static'), 'favicon.ico')
+        return send_from_directory(os.path.join(current_app.root_path, 'static'), 'favicon.ico')
     
     # For API requests, handle them separately
     if path.startswith('api/'):
@@ -438,28 +949,33 @@ def index(path):
     
     # For GET requests to known frontend routes, serve the React app
     if request.method == 'GET' and (not path or first_part in known_frontend_routes):
-        app.logger.info("Serving React app")
-        return render_template('minimal_react.html')
+        current_app.logger.info("Serving React app")
+        return send_spa_shell('minimal_react.html')
     
     # For paths that don't match any known pattern, return 404
     if request.method == 'GET' and first_part not in known_frontend_routes:
-        app.logger.warning(f"Unknown route: {path}")
+        current_app.logger.warning(f"Unknown route: {path}")
         return jsonify({"success": False, "message": "Page not found"}), 404
     
     # For POST requests to the root (likely a file upload from a non-React client)
     if request.method == 'POST':
-        app.logger.info("Handling root POST request (likely file upload)")
+        current_app.logger.info("Handling root POST request (likely file upload)")
         if 'file' not in request.files:
             return jsonify({"success": False, "message": "No file part"}), 400
         # Handle file upload here
 
-@app.route('/react')
+@main.route('/static/react/<path:filename>')
+def react_static(filename):
+    """Serve the React bundle with precompressed siblings and immutable caching for hashed files"""
+    return send_static_asset(os.path.join(current_app.root_path, 'static', 'react'), filename)
+
+@main.route('/react')
 def serve_react():
     """Legacy endpoint for backward compatibility"""
-    app.logger.info("React route accessed, redirecting to root")
-    return redirect(url_for('index'))
+    current_app.logger.info("React route accessed, redirecting to root")
+    return redirect(url_for('.index'))
 
-@app.route('/get-file/<file_uuid>', methods=['GET', 'POST', 'OPTIONS'])
+@main.route('/get-file/<file_uuid>', methods=['GET', 'POST', 'OPTIONS'])
 def get_file(file_uuid):
     # Add support for preflight OPTIONS requests
     if request.method == 'OPTIONS':
@@ -469,39 +985,51 @@ def get_file(file_uuid):
         resp.headers['Access-Control-Allow-Headers'] = 'Content-Type, Content-Disposition, X-Requested-With'
         return resp
         
-    app.logger.info(f"File download page accessed: {file_uuid}")
+    current_app.logger.info(f"File download page accessed: {file_uuid}")
     
     file_record = UploadedFile.query.filter_by(id=file_uuid).first()
     if not file_record:
-        app.logger.warning(f"File not found: {file_uuid}")
+        current_app.logger.warning(f"File not found: {file_uuid}")
         return jsonify({'success': False, 'message': _("File not found")}), 404
 
     if request.method == 'POST':
         entered_password = request.form.get('password')
         
         if not entered_password:
-            app.logger.warning(f"Download attempt without password: {file_uuid}")
+            current_app.logger.warning(f"Download attempt without password: {file_uuid}")
             return jsonify({'success': False, 'message': _("Password is required")}), 400
         
-        if bcrypt.check_password_hash(file_record.password_hash, entered_password):
+        not_ready = not_ready_response(file_record)
+        if not_ready:
+            return not_ready
+        
+        # Refuse over-limit attempts before any bcrypt work
+        throttled = admit(file_uuid)
+        if throttled:
+            return throttled
+        
+        password_ok = check_password(file_record.password_hash, entered_password)
+        record_attempt(file_uuid, password_ok)
+        if password_ok:
             # Update download count
             file_record.download_count += 1
             try:
                 db.session.commit()
-                app.logger.info(f"Download count updated: {file_uuid} - New count: {file_record.download_count}")
+                current_app.logger.info(f"Download count updated: {file_uuid} - New count: {file_record.download_count}")
             except Exception as e:
-                app.logger.error(f"Error updating download count: {str(e)} - UUID: {file_uuid}")
+                current_app.logger.error(f"Error updating download count: {str(e)} - UUID: {file_uuid}")
                 return jsonify({'success': False, 'message': _("Error updating download count")}), 500
             
             # Send the file as a download
             directory, stored_file = os.path.split(file_record.file_path)
-            app.logger.info(f"File download successful: {file_uuid} - {file_record.file_name}")
+            current_app.logger.info(f"File download successful: {file_uuid} - {file_record.file_name}")
+            publish_activity('download', file_uuid, download_count=file_record.download_count)
             
             try:
                 response = send_from_directory(directory, stored_file, as_attachment=True, download_name=file_record.file_name)
                 
                 # Add headers for cross-browser compatibility, especially for Chrome
-                response.headers["Content-Disposition"] = f"attachment; filename=\"{file_record.file_name}\"; filename*=UTF-8''{quote(file_record.file_name)}"
+                response.headers["Content-Disposition"] = attachment_disposition(file_record.file_name)
                 response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
                 response.headers["Pragma"] = "no-cache"
                 response.headers["Expires"] = "0"
@@ -518,12 +1046,13 @@ def get_file(file_uuid):
                     response.headers["Cross-Origin-Embedder-Policy"] = "unsafe-none"
                     response.headers["Feature-Policy"] = "downloads *"
                 
+                DOWNLOAD_BYTES.inc(os.path.getsize(file_record.file_path))
                 return response
             except Exception as e:
-                app.logger.error(f"File send error: {str(e)} - Path: {file_record.file_path}")
+                current_app.logger.error(f"File send error: {str(e)} - Path: {file_record.file_path}")
                 return jsonify({'success': False, 'message': _("Error downloading file")}), 500
         else:
-            app.logger.warning(f"Incorrect password attempt for file: {file_uuid}")
+            current_app.logger.warning(f"Incorrect password attempt for file: {file_uuid}")
             return jsonify({'success': False, 'message': _("Incorrect password!")}), 403
     
     # For GET requests, redirect to the main React app with the file UUID as a parameter
@@ -534,34 +1063,34 @@ def get_file(file_uuid):
     host = request.host
     return redirect(f'{scheme}://{host}/?file={file_uuid}')
 
-@app.route('/logs')
+@main.route('/logs')
 def view_logs():
     """Redirect to the React app's logs page."""
-    return redirect(url_for('serve_react') + '#/logs')
+    return redirect(url_for('.serve_react') + '#/logs')
 
-@app.errorhandler(404)
+@main.app_errorhandler(404)
 def page_not_found(e):
-    app.logger.warning(f"404 error: {request.path}")
+    current_app.logger.warning(f"404 error: {request.path}")
     return jsonify({'success': False, 'message': _("Page not found")}), 404
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(e):
-    app.logger.error(f"500 error: {str(e)}")
+    current_app.logger.error(f"500 error: {str(e)}")
     return jsonify({'success': False, 'message': _("Internal server error")}), 500
 
-@app.route('/set_language/<lang>')
+@main.route('/set_language/<lang>')
 def set_language(lang):
-    response = redirect(request.referrer or url_for('serve_react'))
+    response = redirect(request.referrer or url_for('.serve_react'))
     response.set_cookie('lang', lang)
     return response
 
 # API endpoints for React
-@app.route('/api/upload', methods=['GET', 'POST', 'OPTIONS'])
+@main.route('/api/upload', methods=['GET', 'POST', 'OPTIONS'])
 def api_upload_endpoint():
     """API endpoint for file uploads"""
     # Handle preflight OPTIONS request
     if request.method == 'OPTIONS':
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         response.headers['Access-Control-Allow-Origin'] = '*'
         response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
@@ -578,38 +1107,49 @@ def api_upload_endpoint():
     # For POST, handle file upload
     return api_upload_file()
 
-@app.route('/api/files/<file_uuid>', methods=['POST'])
+@main.route('/api/files/<file_uuid>', methods=['POST'])
 def api_get_file(file_uuid):
-    app.logger.info(f"API file access attempt: {file_uuid}")
+    current_app.logger.info(f"API file access attempt: {file_uuid}")
     
     file_record = UploadedFile.query.filter_by(id=file_uuid).first()
     if not file_record:
-        app.logger.warning(f"API: File not found: {file_uuid}")
+        current_app.logger.warning(f"API: File not found: {file_uuid}")
         return jsonify({'success': False, 'message': _("File not found")}), 404
 
     # Try to get password from JSON body first, then form data
     entered_password = None
     if request.is_json:
-        app.logger.info(f"API: Processing JSON request for file: {file_uuid}")
+        current_app.logger.info(f"API: Processing JSON request for file: {file_uuid}")
         entered_password = request.json.get('password')
     else:
-        app.logger.info(f"API: Processing form request for file: {file_uuid}")
+        current_app.logger.info(f"API: Processing form request for file: {file_uuid}")
         entered_password = request.form.get('password')
     
     if not entered_password:
-        app.logger.warning(f"API: Download attempt without password: {file_uuid}")
+        current_app.logger.warning(f"API: Download attempt without password: {file_uuid}")
         return jsonify({'success': False, 'message': _("Password is required")}), 400
     
-    app.logger.info(f"API: Verifying password for file: {file_uuid}")
+    current_app.logger.info(f"API: Verifying password for file: {file_uuid}")
+    
+    not_ready = not_ready_response(file_record)
+    if not_ready:
+        return not_ready
+    
+    # Refuse over-limit attempts before any bcrypt work
+    throttled = admit(file_uuid)
+    if throttled:
+        return throttled
     
-    if bcrypt.check_password_hash(file_record.password_hash, entered_password):
+    password_ok = check_password(file_record.password_hash, entered_password)
+    record_attempt(file_uuid, password_ok)
+    if password_ok:
         # Update download count
         file_record.download_count += 1
         try:
             db.session.commit()
-            app.logger.info(f"API: Download count updated: {file_uuid} - New count: {file_record.download_count}")
+            current_app.logger.info(f"API: Download count updated: {file_uuid} - New count: {file_record.download_count}")
         except Exception as e:
-            app.logger.error(f"API: Error updating download count: {str(e)} - UUID: {file_uuid}")
+            current_app.logger.error(f"API: Error updating download count: {str(e)} - UUID: {file_uuid}")
         
         # Return the direct download URL with HTTPS always forced
         scheme = request.scheme
@@ -618,7 +1158,7 @@ def api_get_file(file_uuid):
             scheme = 'https'
         host = request.host
         download_url = f"{scheme}://{host}/api/download/{file_uuid}?authenticated=true"
-        app.logger.info(f"API: Password verified, returning download URL: {download_url}")
+        current_app.logger.info(f"API: Password verified, returning download URL: {download_url}")
         
         return jsonify({
             'success': True,
@@ -626,16 +1166,159 @@ def api_get_file(file_uuid):
             'filename': file_record.file_name
         })
     else:
-        app.logger.warning(f"API: Incorrect password attempt for file: {file_uuid}")
+        current_app.logger.warning(f"API: Incorrect password attempt for file: {file_uuid}")
         return jsonify({'success': False, 'message': _("Incorrect password!")}), 403
 
-@app.route('/api/download/<file_uuid>', methods=['GET', 'OPTIONS'])
+@main.route('/api/files/<file_uuid>/status', methods=['GET'])
+def api_file_status(file_uuid):
+    """Processing status of an upload: processing, ready (downloadable) or failed"""
+    file_record = UploadedFile.query.filter_by(id=file_uuid).first()
+    if not file_record:
+        return jsonify({'success': False, 'message': _("File not found")}), 404
+    response = jsonify({
+        'success': True,
+        'file_uuid': file_uuid,
+        'status': file_record.status,
+        'downloadable': file_record.status == 'ready'
+    })
+    if file_record.status == 'processing':
+        response.headers['Retry-After'] = '1'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def attachment_disposition(original_filename):
+    return f"attachment; filename=\"{original_filename}\"; filename*=UTF-8''{quote(original_filename)}"
+
+def content_etag(file_record):
+    """Opaque validator of a file's content: an HMAC of its id and plaintext SHA-256 under the master key
+
+    The digest itself is never sent; it would let anyone holding the UUID
+    confirm a guess of a password-protected file's content offline.
+    """
+    if not file_record.sha256:
+        return None
+    key = get_master_key()
+    message = f"{file_record.id}:{file_record.sha256}".encode()
+    return hmac.new(key if isinstance(key, bytes) else key.encode(), message, hashlib.sha256).hexdigest()
+
+def set_content_metadata(response, file_record):
+    """ETag (content_etag()) and Last-Modified (the upload date) of a stored file"""
+    etag = content_etag(file_record)
+    if etag:
+        response.set_etag(etag)
+    if file_record.upload_date:
+        response.last_modified = file_record.upload_date.replace(tzinfo=datetime.timezone.utc)
+    return response
+
+def file_metadata(file_record):
+    """What a client can know about a file before downloading it, from the record alone"""
+    return {
+        'file_uuid': file_record.id,
+        'file_name': file_record.file_name,
+        'size': file_record.file_size,
+        'content_type': file_record.mime_type,
+        'etag': f'"{content_etag(file_record)}"' if file_record.sha256 else None,
+        'last_modified': file_record.upload_date.strftime('%Y-%m-%d %H:%M:%S') if file_record.upload_date else None,
+        'status': file_record.status,
+        'downloadable': file_record.status == 'ready' and file_record.storage_status != 'missing'
+    }
+
+@main.route('/api/files/<file_uuid>/metadata', methods=['GET'])
+def api_file_metadata(file_uuid):
+    """Size, content type, validator and dates of a file; a database lookup, no file I/O"""
+    file_record = UploadedFile.query.filter_by(id=file_uuid).first()
+    if not file_record:
+        return jsonify({'success': False, 'message': _("File not found")}), 404
+    return jsonify(dict(file_metadata(file_record), success=True))
+
+def download_head_response(file_record):
+    """Headers of a download answered from the record: no decryption, and no file I/O once sizes are recorded"""
+    if file_record.storage_status == 'missing':
+        return jsonify({"success": False, "message": "File not found on disk"}), 404
+    file_size = file_record.file_size
+    if file_size is None and not file_record.is_encrypted:
+        # Uploads stored before sizes were recorded: a plain file's size is its stored size
+        file_size = stored_file_size(file_record.file_path)
+    response = Response(status=200)
+    response.headers["Content-Disposition"] = attachment_disposition(file_record.file_name)
+    response.headers["Content-Type"] = file_record.mime_type or 'application/octet-stream'
+    if file_size is not None:
+        response.headers["Content-Length"] = str(file_size)
+    else:
+        # Unknown without decrypting; the empty HEAD body must not be announced as the length
+        response.automatically_set_content_length = False
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    return set_content_metadata(response, file_record)
+
+def download_counts(file_ids):
+    """{file UUID: download_count}, the popularity the plaintext cache evicts by"""
+    return dict(db.session.query(UploadedFile.id, UploadedFile.download_count).filter(UploadedFile.id.in_(file_ids)).all())
+
+def sweep_plaintext_cache_job(payload):
+    """Periodic job handler: wipe expired plaintext cache entries even if no download evicts them"""
+    current_app.extensions['plaintext_cache'].sweep()
+
+def cached_plaintext(file_record, file_path):
+    """Decrypted content of a hot file from the plaintext cache, decrypted into it on a miss
+
+    Returns an open file, or None when the cache is off, the file is not hot
+    enough or caching failed; the caller then decrypts as usual.
+    """
+    cache = current_app.extensions.get('plaintext_cache')
+    if cache is None:
+        return None
+    try:
+        cached = cache.open(file_record.id)
+        if cached is None and cache.admits(file_record.file_size, file_record.download_count):
+            cached = cache.get_or_fill(file_record.id, file_record.file_size,
+                                       lambda path: decrypt_file(file_path, path, key=file_record.data_key()))
+        return cached
+    except Exception as e:
+        current_app.logger.error(f"Plaintext cache error for {file_record.id}: {str(e)}")
+        return None
+
+# Per process: concurrent downloads of one file wait for a single decryption
+decrypt_flights = SingleFlight()
+
+def decrypt_to_buffer(file_path, data_key):
+    """Decrypt a stored file into a new SharedBuffer; None if decryption failed"""
+    buffer = SharedBuffer()
+    try:
+        if decrypt_file(file_path, buffer.path, key=data_key) != buffer.path:
+            buffer.discard()
+            return None
+        buffer.seal()
+    except Exception:
+        buffer.discard()
+        raise
+    return buffer
+
+def find_stored_file(file_uuid, file_path):
+    """Locate a stored upload: the recorded path, its .encrypted variant, or any file with the UUID prefix"""
+    if os.path.exists(file_path):
+        return file_path
+    
+    # Try to check if an encrypted version exists
+    encrypted_file_path = file_path + '.encrypted'
+    current_app.logger.info(f"File not found at {file_path}, checking for encrypted version at {encrypted_file_path}")
+    if os.path.exists(encrypted_file_path):
+        current_app.logger.info(f"Found encrypted version of file: {encrypted_file_path}")
+        return encrypted_file_path
+    
+    # Try one more location - check by ID pattern
+    alt_files = glob.glob(os.path.join(current_app.config['UPLOAD_FOLDER'], f"{file_uuid}_*"))
+    if alt_files:
+        current_app.logger.info(f"Found alternative file location by UUID pattern: {alt_files[0]}")
+        return alt_files[0]
+    return None
+
+@main.route('/api/download/<file_uuid>', methods=['GET', 'HEAD', 'OPTIONS'])
 def download_file_direct(file_uuid):
-    app.logger.info(f"Direct download attempt for file: {file_uuid}")
+    current_app.logger.info(f"Direct download attempt for file: {file_uuid}")
     
     # Ensure we're only serving over HTTPS in production
     if request.headers.get('X-Forwarded-Proto') == 'http' and 'herokuapp.com' in request.host:
-        https_url = url_for('download_file_direct', file_uuid=file_uuid, _external=True).replace('http://', 'https://')
+        https_url = url_for('.download_file_direct', file_uuid=file_uuid, _external=True).replace('http://', 'https://')
         return redirect(https_url, code=301)
         
     # Add CORS headers for preflight requests
@@ -645,160 +1328,307 @@ def download_file_direct(file_uuid):
     # Get file from database
     file_record = UploadedFile.query.get(file_uuid)
     if not file_record:
-        app.logger.warning(f"Download attempt for non-existent file: {file_uuid}")
+        current_app.logger.warning(f"Download attempt for non-existent file: {file_uuid}")
         
         # Check if file exists in uploads directory despite not being in database
-        import glob
-        matching_files = glob.glob(os.path.join(app.config['UPLOAD_FOLDER'], f"{file_uuid}_*"))
+        matching_files = glob.glob(os.path.join(current_app.config['UPLOAD_FOLDER'], f"{file_uuid}_*"))
         if matching_files:
-            app.logger.warning(f"Found orphaned file for {file_uuid} not in database: {matching_files}")
+            current_app.logger.warning(f"Found orphaned file for {file_uuid} not in database: {matching_files}")
         
         return jsonify({"success": False, "message": "File not found in database"}), 404
     
     # User must have authenticated first
     authenticated = request.args.get('authenticated') == 'true'
-    app.logger.info(f"Authentication parameter: {request.args.get('authenticated')} for file: {file_uuid}")
+    current_app.logger.info(f"Authentication parameter: {request.args.get('authenticated')} for file: {file_uuid}")
     
     if not authenticated:
-        app.logger.warning(f"Download attempt without authentication: {file_uuid}")
+        current_app.logger.warning(f"Download attempt without authentication: {file_uuid}")
         return jsonify({"success": False, "message": "Authentication required"}), 401
     
+    not_ready = not_ready_response(file_record)
+    if not_ready:
+        return not_ready
+    
+    # Never decrypts, takes a transfer slot or counts as a download
+    if request.method == 'HEAD':
+        return download_head_response(file_record)
+    
+    busy = admit_transfer(file_record.file_size)
+    if busy:
+        return busy
+    
     try:
         # Get the file path and create the response
         file_path = file_record.file_path  # This uses the decryption getter
         original_filename = file_record.file_name  # This uses the decryption getter
         
-        app.logger.info(f"Looking for file at path: {file_path}")
+        current_app.logger.info(f"Looking for file at path: {file_path}")
         
         # Check if file exists on disk
-        if not os.path.exists(file_path):
-            # Try to check if an encrypted version exists
-            encrypted_file_path = file_path + '.encrypted'
-            app.logger.info(f"File not found at {file_path}, checking for encrypted version at {encrypted_file_path}")
-            
-            if os.path.exists(encrypted_file_path):
-                app.logger.info(f"Found encrypted version of file: {encrypted_file_path}")
-                file_path = encrypted_file_path
-            else:
-                app.logger.error(f"File record exists but file not found on disk: {file_uuid} - {original_filename}")
-                
-                # Try one more location - check both by ID pattern
-                alt_pattern = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_uuid}_*")
-                alt_files = glob.glob(alt_pattern)
-                
-                if alt_files:
-                    alt_file = alt_files[0]  # Take the first match
-                    app.logger.info(f"Found alternative file location by UUID pattern: {alt_file}")
-                    file_path = alt_file
-                else:
-                    # Clean up the database record if configured to do so
-                    if ENABLE_STARTUP_CLEANUP and CLEANUP_STRATEGY in ['all', 'db']:
-                        try:
-                            db.session.delete(file_record)
-                            db.session.commit()
-                            app.logger.info(f"Removed database record for missing file: {file_uuid}")
-                        except Exception as e:
-                            app.logger.error(f"Error removing database record for missing file: {str(e)}")
-                            db.session.rollback()
-                    return jsonify({"success": False, "message": "File not found on disk"}), 404
+        stored_path = find_stored_file(file_uuid, file_path)
+        if stored_path:
+            file_path = stored_path
+        else:
+            current_app.logger.error(f"File record exists but file not found on disk: {file_uuid} - {original_filename}")
+            # Clean up the database record if configured to do so
+            if ENABLE_STARTUP_CLEANUP and CLEANUP_STRATEGY in ['all', 'db']:
+                try:
+                    db.session.delete(file_record)
+                    db.session.commit()
+                    current_app.logger.info(f"Removed database record for missing file: {file_uuid}")
+                    if current_app.extensions.get('plaintext_cache') is not None:
+                        current_app.extensions['plaintext_cache'].discard(file_uuid)
+                    publish_activity('delete', file_uuid)
+                except Exception as e:
+                    current_app.logger.error(f"Error removing database record for missing file: {str(e)}")
+                    db.session.rollback()
+            return jsonify({"success": False, "message": "File not found on disk"}), 404
         
         # For encrypted files, we need to decrypt them before sending
         is_encrypted = file_path.endswith('.encrypted') or file_record.is_encrypted
-        temp_decrypted_path = None
+        cached = None
+        decrypted = None
         
         try:
             if is_encrypted:
-                app.logger.info(f"Decrypting file for download: {file_path}")
-                # Import decrypt_file from crypto_utils
-                from crypto_utils import decrypt_file
-                # Create a temporary file path for decrypted content
-                import tempfile
-                temp_dir = tempfile.gettempdir()
-                temp_decrypted_path = os.path.join(temp_dir, f"decrypted_{os.path.basename(file_path).replace('.encrypted', '')}")
-                
-                # Decrypt the file to the temporary location
-                decrypt_file(file_path, temp_decrypted_path)
+                cached = cached_plaintext(file_record, file_path)
+            if cached is not None:
+                # Hot file: served from the plaintext cache, no decryption
+                directory, filename = os.path.split(cached.name)
+            elif is_encrypted:
+                current_app.logger.info(f"Decrypting file for download: {file_path}")
+                # Concurrent downloads of this file share one decryption into a private buffer
+                decrypted, shared = decrypt_flights.do(file_uuid, functools.partial(decrypt_to_buffer, file_path, file_record.data_key()))
+                if shared:
+                    DECRYPTS_COALESCED.inc()
                 
-                if os.path.exists(temp_decrypted_path):
-                    app.logger.info(f"Successfully decrypted file to: {temp_decrypted_path}")
-                    # Use the decrypted file for the response
-                    directory, filename = os.path.split(temp_decrypted_path)
+                if decrypted is not None:
+                    current_app.logger.info(f"Successfully decrypted file for download: {file_uuid}{' (shared)' if shared else ''}")
+                    directory, filename = None, None
                 else:
-                    app.logger.error(f"Failed to decrypt file, decrypted file not found: {temp_decrypted_path}")
+                    current_app.logger.error(f"Failed to decrypt file: {file_path}")
                     # Fall back to the original encrypted file
                     directory, filename = os.path.split(file_path)
-                    app.logger.warning(f"Falling back to sending encrypted file directly: {file_path}")
+                    current_app.logger.warning(f"Falling back to sending encrypted file directly: {file_path}")
             else:
                 # For non-encrypted files, just use the original path
                 directory, filename = os.path.split(file_path)
                 
-            app.logger.info(f"Sending file: directory={directory}, filename={filename}, original_name={original_filename}")
+            current_app.logger.info(f"Sending file: directory={directory}, filename={filename}, original_name={original_filename}")
             
-            # Register a callback to remove the temporary file after the response is sent
-            if temp_decrypted_path and os.path.exists(temp_decrypted_path):
-                @after_this_request
-                def remove_temp_file(response):
-                    try:
-                        if os.path.exists(temp_decrypted_path):
-                            os.remove(temp_decrypted_path)
-                            app.logger.info(f"Removed temporary decrypted file: {temp_decrypted_path}")
-                    except Exception as e:
-                        app.logger.error(f"Error removing temporary file: {str(e)}")
-                    return response
-
-            # Create a response using send_from_directory
-            response = send_from_directory(
-                directory, 
-                filename, 
-                as_attachment=True, 
-                download_name=original_filename
-            )
+            if cached is not None:
+                # Sent from the open entry, which keeps it from being wiped until the response is closed
+                response = send_file(cached, as_attachment=True, download_name=original_filename)
+                response.content_length = sent_bytes = os.fstat(cached.fileno()).st_size
+            elif decrypted is not None:
+                # Closing the response releases this download's reference to the buffer
+                response = Response(decrypted.reader(), direct_passthrough=True)
+                response.content_length = sent_bytes = decrypted.size
+                decrypted = None
+            else:
+                # Create a response using send_from_directory
+                response = send_from_directory(
+                    directory, 
+                    filename, 
+                    as_attachment=True, 
+                    download_name=original_filename
+                )
+                sent_bytes = os.path.getsize(os.path.join(directory, filename))
             
             # Set appropriate headers
-            response.headers["Content-Disposition"] = f"attachment; filename=\"{original_filename}\"; filename*=UTF-8''{quote(original_filename)}"
-            response.headers["Content-Type"] = mimetypes.guess_type(original_filename)[0] or 'application/octet-stream'
+            response.headers["Content-Disposition"] = attachment_disposition(original_filename)
+            response.headers["Content-Type"] = file_record.mime_type or mimetypes.guess_type(original_filename)[0] or 'application/octet-stream'
             response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
             response.headers["Pragma"] = "no-cache"
             response.headers["Expires"] = "0"
+            set_content_metadata(response, file_record)
             
             # Log successful download
-            app.logger.info(f"File download successful: {file_uuid} - {original_filename}")
+            DOWNLOAD_BYTES.inc(sent_bytes)
+            current_app.logger.info(f"File download successful: {file_uuid} - {original_filename}")
+            publish_activity('download', file_uuid, download_count=file_record.download_count)
+            try:
+                # The download event is new content for /api/logs pollers
+                note_change()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Error recording download change: {str(e)}")
             
             return response
             
         except Exception as e:
-            app.logger.error(f"Error sending file: {str(e)} - UUID: {file_uuid}, Path: {file_path}")
-            
-            # Clean up temp file if it exists
-            if temp_decrypted_path and os.path.exists(temp_decrypted_path):
-                try:
-                    os.remove(temp_decrypted_path)
-                    app.logger.info(f"Cleaned up temporary file after error: {temp_decrypted_path}")
-                except Exception as cleanup_error:
-                    app.logger.error(f"Error cleaning up temporary file: {str(cleanup_error)}")
+            current_app.logger.error(f"Error sending file: {str(e)} - UUID: {file_uuid}, Path: {file_path}")
+            if cached is not None:
+                cached.close()
+            # A buffer not yet handed to a response
+            if decrypted is not None:
+                decrypted.release()
                     
             return jsonify({"success": False, "message": f"Error sending file: {str(e)}"}), 500
             
     except Exception as e:
-        app.logger.error(f"Error in file download process: {str(e)} - UUID: {file_uuid}")
+        current_app.logger.error(f"Error in file download process: {str(e)} - UUID: {file_uuid}")
         return jsonify({"success": False, "message": str(e)}), 500
 
-@app.route('/api/logs', methods=['GET'])
+MAX_ZIP_FILES = int(os.environ.get('MAX_ZIP_FILES', 100))
+
+@main.route('/api/download/zip', methods=['POST'])
+def download_zip():
+    """Stream several password-protected files as one ZIP archive, decrypting each member on the fly"""
+    data = request.get_json(silent=True) or {}
+    if data.get('files'):
+        requested = [(str(item.get('id', '')), item.get('password') or '') for item in data['files'] if isinstance(item, dict)]
+    else:
+        requested = [(str(file_id), data.get('password') or '') for file_id in data.get('file_ids', [])]
+    
+    # Keep the first occurrence of every id
+    seen = set()
+    requested = [(file_id, password) for file_id, password in requested if not (file_id in seen or seen.add(file_id))]
+    if not requested:
+        return jsonify({"success": False, "message": _("No files requested")}), 400
+    if len(requested) > MAX_ZIP_FILES:
+        return jsonify({"success": False, "message": _("Too many files, max %(count)s per archive", count=MAX_ZIP_FILES)}), 400
+    if not all(password for _file_id, password in requested):
+        return jsonify({"success": False, "message": _("Password is required")}), 400
+    
+    records = {record.id: record for record in UploadedFile.query.filter(UploadedFile.id.in_([file_id for file_id, _password in requested]))}
+    missing = [file_id for file_id, _password in requested if file_id not in records]
+    if missing:
+        current_app.logger.warning(f"ZIP download requested missing files: {missing}")
+        return jsonify({"success": False, "message": _("File not found"), "missing": missing}), 404
+    for file_id, _password in requested:
+        not_ready = not_ready_response(records[file_id])
+        if not_ready:
+            return not_ready
+    
+    # Files uploaded in one batch share a hash, so each (hash, password) pair is checked once;
+    # the IP bucket is charged per bcrypt run, every file's own bucket per member
+    verified = {}
+    for file_id, password in requested:
+        key = (records[file_id].password_hash, password)
+        throttled = admit(file_id, charge_ip=key not in verified)
+        if throttled:
+            return throttled
+        if key not in verified:
+            verified[key] = check_password(*key)
+        record_attempt(file_id, verified[key])
+        if not verified[key]:
+            current_app.logger.warning(f"ZIP download: incorrect password for file: {file_id}")
+            return jsonify({"success": False, "message": _("Incorrect password!")}), 403
+    
+    # Classed by the total plaintext size, stored_size standing in where it was not recorded
+    busy = admit_transfer(sum(records[file_id].file_size or records[file_id].stored_size or 0 for file_id, _password in requested))
+    if busy:
+        return busy
+
+    # Resolve everything before streaming starts; errors after that can only abort the stream
+    members = []
+    for file_id, _password in requested:
+        record = records[file_id]
+        stored_path = find_stored_file(file_id, record.file_path)
+        if not stored_path:
+            current_app.logger.error(f"ZIP download: file not found on disk: {file_id}")
+            return jsonify({"success": False, "message": "File not found on disk", "missing": [file_id]}), 404
+        members.append((file_id, record.file_name, stored_path, record.data_key()))
+        record.download_count += 1
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"ZIP download: error updating download counts: {str(e)}")
+    
+    def member_chunks(file_id, path, key):
+        chunks = iter_decrypt_file(path, key) if path.endswith('.encrypted') else iter_file(path)
+        try:
+            for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            current_app.logger.error(f"ZIP download aborted while reading {file_id}: {str(e)}")
+            raise
+    
+    for file_id, _name, _path, _key in members:
+        publish_activity('download', file_id, download_count=records[file_id].download_count)
+    
+    def generate():
+        for chunk in stream_zip((name, member_chunks(file_id, path, key)) for file_id, name, path, key in members):
+            DOWNLOAD_BYTES.inc(len(chunk))
+            yield chunk
+        current_app.logger.info(f"ZIP download completed: {len(members)} files")
+    
+    archive_name = f"files-{datetime.datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.zip"
+    current_app.logger.info(f"Streaming ZIP download of {len(members)} files")
+    return Response(stream_with_context(generate()), mimetype='application/zip', headers={
+        "Content-Disposition": f"attachment; filename=\"{archive_name}\"",
+        "Cache-Control": "no-cache, no-store, must-revalidate",
+        "Pragma": "no-cache",
+        "Expires": "0"
+    })
+
+LOG_EVENT_MARKERS = {
+    'upload_logs': "File metadata saved to database:",
+    'download_logs': "File download successful:"
+}
+
+def parse_logs_cursor(cursor):
+    """(change number, log file inode, log offset) from a /api/logs cursor, or None if it is missing or malformed"""
+    try:
+        seq, inode, offset = (int(part) for part in cursor.split('-'))
+        return seq, inode, offset
+    except (AttributeError, ValueError):
+        return None
+
+def read_log_events(log_path, offset=0):
+    """Upload and download lines of app.log after offset; returns (events by kind, offset after the last complete line)"""
+    events = {kind: [] for kind in LOG_EVENT_MARKERS}
+    with open(log_path, 'rb') as log_file:
+        log_file.seek(offset)
+        for raw_line in log_file:
+            # A line still being written is read again by the next poll
+            if not raw_line.endswith(b'\n'):
+                break
+            offset += len(raw_line)
+            line = raw_line.decode('utf-8', errors='replace')
+            for kind, marker in LOG_EVENT_MARKERS.items():
+                if marker in line:
+                    events[kind].append(line.strip())
+                    break
+    return events, offset
+
+@main.route('/api/logs', methods=['GET'])
 def api_get_logs():
+    """Files and upload/download events; with since=<cursor> only what changed after it
+
+    The weak ETag is the change counter, so an unchanged poll costs one
+    single-row query and is answered with 304.
+    """
     try:
-        # Get all file records from the database
-        files = UploadedFile.query.order_by(UploadedFile.upload_date.desc()).all()
+        seq, last_delete = current_changes()
+        etag = f'logs-{seq}'
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+        
+        log_path = os.path.join(os.getcwd(), 'logs', 'app.log')
+        try:
+            log_stat = os.stat(log_path)
+        except OSError:
+            log_stat = None
+        
+        # Deltas need a cursor with no deletion after it and the same, not truncated, log file
+        cursor = parse_logs_cursor(request.args.get('since'))
+        full = (cursor is None or cursor[0] < last_delete or log_stat is None
+                or cursor[1] != log_stat.st_ino or cursor[2] > log_stat.st_size)
         
-        # Convert file objects to dictionaries, filtering out files that don't exist on disk
+        query = UploadedFile.query.order_by(UploadedFile.upload_date.desc())
+        if not full:
+            query = query.filter(UploadedFile.change_seq > cursor[0])
+        
+        # Convert file objects to dictionaries, leaving out files the reconciler found missing on disk
         file_list = []
-        for file in files:
-            file_path = file.file_path
-            
-            # Check both with and without .encrypted extension
-            file_exists = os.path.exists(file_path) or os.path.exists(file_path + '.encrypted')
-            
-            # Include the file in list if it exists in either form
-            if file_exists:
+        removed = []
+        for file in query.all():
+            if file.storage_status != 'missing':
                 file_list.append({
                     'id': file.id,
                     'file_name': file.file_name,
@@ -806,211 +1636,613 @@ def api_get_logs():
                     'download_count': file.download_count
                 })
             else:
-                app.logger.warning(f"File record exists but file not found on disk: {file.id} - {file.file_name}")
+                removed.append(file.id)
         
-        # Get upload logs
-        upload_logs = []
-        download_logs = []
-        
-        # Read app.log for upload and download logs, filtering by file existence
-        log_path = os.path.join(os.getcwd(), 'logs', 'app.log')
+        # Read app.log for upload and download logs from the cursor's offset
+        events = {kind: [] for kind in LOG_EVENT_MARKERS}
+        log_offset = 0
         try:
-            # Extract UUIDs from log lines for filtering
-            uuid_pattern = r'([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})'
-            
-            if os.path.exists(log_path) and os.path.getsize(log_path) > 0:
-                with open(log_path, 'r') as log_file:
-                    for line in log_file:
-                        if "File metadata saved to database:" in line:
-                            # Add all upload logs regardless of file existence
-                            upload_logs.append(line.strip())
-                            
-                        elif "File download successful:" in line:
-                            # Add all download logs regardless of file existence
-                            download_logs.append(line.strip())
+            if log_stat is not None and log_stat.st_size > 0:
+                events, log_offset = read_log_events(log_path, 0 if full else cursor[2])
             else:
-                app.logger.warning(f"Log file not found or empty: {log_path}")
+                current_app.logger.warning(f"Log file not found or empty: {log_path}")
         except Exception as e:
-            app.logger.error(f"Error reading log file: {str(e)}")
-            
-        return jsonify({
+            current_app.logger.error(f"Error reading log file: {str(e)}")
+        
+        response = jsonify({
             'success': True,
+            'full': full,
+            'cursor': f"{seq}-{log_stat.st_ino if log_stat else 0}-{log_offset}",
             'files': file_list,
-            'upload_logs': upload_logs,
-            'download_logs': download_logs
+            'removed': [] if full else removed,
+            'upload_logs': events['upload_logs'],
+            'download_logs': events['download_logs']
         })
+        response.set_etag(etag, weak=True)
+        # Revalidate on every poll instead of reusing a cached copy
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
-        app.logger.error(f"Error loading logs: {str(e)}")
+        current_app.logger.error(f"Error loading logs: {str(e)}")
         return jsonify({'success': False, 'message': f"Could not load logs: {str(e)}"})
 
+@main.route('/api/events', methods=['GET'])
+def api_events():
+    """Server-sent events: upload, ready, failed, download and delete activity as it happens
+
+    Replaces polling /api/logs: clients load the list once and apply events.
+    A 'resync' event means events were missed (slow consumer or unknown
+    Last-Event-ID) and the list should be reloaded.
+    """
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    except (TypeError, ValueError):
+        last_event_id = None
+    subscription = current_app.extensions['events'].subscribe(last_event_id)
+    if subscription is None:
+        current_app.logger.warning("Event stream refused: too many subscribers")
+        response = jsonify({'success': False, 'message': _("Too many event subscribers, try again later")})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    
+    heartbeat = current_app.config['EVENTS_HEARTBEAT']
+    # Bounded lifetime, so worker recycling is not held up; EventSource reconnects with Last-Event-ID
+    closes_at = time.time() + current_app.config['EVENTS_MAX_AGE']
+    
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while time.time() < closes_at:
+                event = subscription.get(timeout=min(heartbeat, max(0.0, closes_at - time.time())))
+                # A comment line keeps proxies from closing an idle connection
+                yield format_sse(event) if event else ": keepalive\n\n"
+        finally:
+            subscription.close()
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def validate_upload(file):
+    """Check the extension of an uploaded file; size and content are checked while it is saved. Returns an error message or None"""
+    if not allowed_file(file.filename):
+        allowed_extensions = ', '.join(ALLOWED_EXTENSIONS)
+        current_app.logger.warning(f"Upload attempt with invalid file type: {file.filename}")
+        return _("Invalid file type. Allowed types: %(types)s", types=allowed_extensions)
+    return None
+
+def upload_rejected_message(rejection):
+    """User-facing message for an UploadRejected raised while saving"""
+    if rejection.reason == 'size':
+        return _("File too large, max 10MB allowed")
+    return _("Invalid file type")
+
+def receive_upload(file, file_uuid, original_filename, durable=False):
+    """Write an upload into the uploads folder, validating it (size, magic signature, active content) on the way
+
+    Returns (path, sniffer); the sniffer has the size, SHA-256 and content type of the upload.
+
+    UploadRejected is raised and nothing is left on disk if validation fails.
+    With durable=True the file is fsync'ed, so it survives a crash once this returns.
+    """
+    # Create unique filename with UUID
+    secure_filename_with_uuid = f"{file_uuid}_{original_filename}"
+    temp_file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], secure_filename_with_uuid)
+    
+    # Save the file temporarily, sniffing it on the way
+    current_app.logger.info(f"Attempting to save file to {temp_file_path}")
+    sniffer = UploadSniffer(original_filename, MAX_CONTENT_LENGTH)
+    try:
+        with open(temp_file_path, 'wb') as destination:
+            file_size = copy_sniffed(file.stream, destination, sniffer)
+            if durable:
+                destination.flush()
+                os.fsync(destination.fileno())
+    except UploadRejected as rejection:
+        os.remove(temp_file_path)
+        current_app.logger.warning(f"Upload rejected ({rejection.reason}) for file: {file.filename}: {rejection}")
+        raise
+    current_app.logger.info(f"File temporarily saved at: {temp_file_path}")
+    UPLOAD_BYTES.inc(file_size)
+    
+    # Verify the file was saved correctly
+    if not os.path.exists(temp_file_path):
+        raise IOError(f"Failed to save file at: {temp_file_path}")
+    return temp_file_path, sniffer
+
+def encrypt_upload(temp_file_path):
+    """Encrypt a received upload with a new data key, keeping the plaintext; returns (stored path, is_encrypted, wrapped data key)"""
+    current_app.logger.info(f"Attempting to encrypt file: {temp_file_path}")
+    data_key = generate_data_key()
+    try:
+        encrypted_file_path = encrypt_file(temp_file_path, key=data_key)
+        current_app.logger.info(f"File encrypted: {encrypted_file_path}")
+    except Exception as e:
+        current_app.logger.error(f"Encryption error: {str(e)}")
+        # If encryption fails, continue with the unencrypted file
+        encrypted_file_path = temp_file_path
+    if encrypted_file_path == temp_file_path:
+        current_app.logger.warning(f"Continuing with unencrypted file: {encrypted_file_path}")
+    
+    is_encrypted = encrypted_file_path != temp_file_path
+    return encrypted_file_path, is_encrypted, wrap_data_key(data_key) if is_encrypted else None
+
+def remove_plaintext(temp_file_path, stored_path):
+    """Delete the original unencrypted file once the encrypted one is stored"""
+    if stored_path != temp_file_path and os.path.exists(temp_file_path):
+        os.remove(temp_file_path)
+        current_app.logger.info(f"Removed original unencrypted file: {temp_file_path}")
+
+def save_and_encrypt_upload(file, file_uuid, original_filename):
+    """Save an upload into the uploads folder and encrypt it with a new data key; returns (stored path, is_encrypted, wrapped data key, sniffer)"""
+    temp_file_path, sniffed = receive_upload(file, file_uuid, original_filename)
+    stored_path, is_encrypted, wrapped_key = encrypt_upload(temp_file_path)
+    remove_plaintext(temp_file_path, stored_path)
+    return stored_path, is_encrypted, wrapped_key, sniffed
+
+def store_upload(file, file_uuid, original_filename):
+    """save_and_encrypt_upload, or with ASYNC_UPLOADS only a durable save; encryption then happens in process_upload_job"""
+    if current_app.config['ASYNC_UPLOADS']:
+        temp_file_path, sniffed = receive_upload(file, file_uuid, original_filename, durable=True)
+        return temp_file_path, False, None, sniffed
+    return save_and_encrypt_upload(file, file_uuid, original_filename)
+
+def upload_metadata(stored_path, sniffed, original_filename):
+    """Denormalized columns of a new upload, so listings and probes never touch the disk"""
+    return {
+        'file_size': sniffed.size,
+        'stored_size': os.path.getsize(stored_path),
+        'mime_type': sniffed.mime_type,
+        'sha256': sniffed.sha256,
+        'file_type': file_type_of(original_filename),
+        'storage_status': 'present'
+    }
+
+def recovered_metadata(stored_path, original_filename, is_encrypted):
+    """
+    Denormalized columns for an upload found on disk without a record.
+
+    The plaintext is read once for its size and SHA-256; an encrypted file
+    can only be read if it was encrypted with the master key (a per-file data
+    key was lost with the record), otherwise those two stay empty.
+    """
+    file_type = file_type_of(original_filename)
+    metadata = {
+        'stored_size': os.path.getsize(stored_path),
+        'mime_type': MIME_TYPES.get(file_type),
+        'file_type': file_type,
+        'storage_status': 'present'
+    }
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        if is_encrypted:
+            buffer = decrypt_to_buffer(stored_path, None)
+            if buffer is None:
+                return metadata
+            chunks = buffer.reader()
+        else:
+            chunks = iter_file(stored_path)
+        try:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+        finally:
+            chunks.close()
+    except Exception as e:
+        current_app.logger.warning(f"Could not read recovered file {stored_path}: {str(e)}")
+        return metadata
+    metadata.update(file_size=size, sha256=digest.hexdigest())
+    return metadata
+
+def enqueue_upload_processing(file_ids):
+    """Queue encryption and password hashing of committed 'processing' uploads
+
+    Returns:
+        bool: False if the job could not be queued; the uploads are then marked failed
+        and their plaintext removed, as when the job gives up
+    """
+    try:
+        current_app.extensions['jobs'].enqueue('process_upload', {'file_ids': file_ids})
+        return True
+    except Exception as e:
+        # Nothing would ever pick the records up again
+        current_app.logger.error(f"Could not queue processing of uploads {file_ids}: {str(e)}")
+        upload_processing_failed({'file_ids': file_ids}, e)
+        return False
+
+def process_upload_job(payload):
+    """Job handler: encrypt received uploads, hash their password and mark them ready
+
+    Runs again after a crash at any point: the record is committed before the
+    plaintext is removed, and records that are already ready are only cleaned up.
+    """
+    records = UploadedFile.query.filter(UploadedFile.id.in_(payload['file_ids'])).all()
+    hashes = {}
+    stored = []
+    for record in records:
+        temp_file_path = record.file_path
+        if record.status != 'processing':
+            # Already committed by an earlier run that stopped before removing the plaintext
+            if record.status == 'ready' and temp_file_path.endswith('.encrypted'):
+                remove_plaintext(temp_file_path[:-len('.encrypted')], temp_file_path)
+            continue
+        
+        # Files uploaded in one batch share a password; hash it once
+        if record.password not in hashes:
+            hashes[record.password] = hash_password(record.password)
+        stored_path, is_encrypted, wrapped_key = encrypt_upload(temp_file_path)
+        stored.append((temp_file_path, stored_path))
+        
+        # Same field layout as records stored by the synchronous upload path
+        record.file_path = stored_path
+        record.is_encrypted = is_encrypted
+        record.wrapped_key = wrapped_key
+        record.stored_size = os.path.getsize(stored_path)
+        record.password_hash = hashes[record.password]
+        record.status = 'ready'
+    
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        remove_stored_files([stored_path for temp_file_path, stored_path in stored if stored_path != temp_file_path])
+        raise
+    
+    for temp_file_path, stored_path in stored:
+        remove_plaintext(temp_file_path, stored_path)
+    for record in records:
+        if record.status == 'ready':
+            publish_activity('ready', record.id)
+    current_app.logger.info(f"Upload processing finished for {len(stored)} files: {payload['file_ids']}")
+
+def upload_processing_failed(payload, error):
+    """Give-up handler: mark the uploads failed and delete their plaintext"""
+    records = UploadedFile.query.filter(UploadedFile.id.in_(payload['file_ids']), UploadedFile.status == 'processing').all()
+    for record in records:
+        if os.path.exists(record.file_path):
+            os.remove(record.file_path)
+        record.status = 'failed'
+    db.session.commit()
+    for record in records:
+        publish_activity('failed', record.id)
+    current_app.logger.error(f"Upload processing failed for {payload['file_ids']}: {error}")
+
+def publish_activity(kind, file_uuid, **data):
+    """Push an upload/download/delete event to /api/events subscribers; never fails the request"""
+    try:
+        current_app.extensions['events'].publish(kind, file_uuid=file_uuid, **data)
+    except Exception as e:
+        current_app.logger.error(f"Error publishing {kind} event for {file_uuid}: {str(e)}")
+
+def publish_upload(file_record, original_filename):
+    """Upload event carrying the same fields as an /api/logs file entry"""
+    publish_activity('upload', file_record.id,
+                     file_name=original_filename,
+                     upload_date=file_record.upload_date.strftime('%Y-%m-%d %H:%M:%S'),
+                     download_count=file_record.download_count,
+                     status=file_record.status)
+
+def not_ready_response(file_record):
+    """409 response for a file that is still being processed or whose processing failed; None once it can be downloaded"""
+    if file_record.status in (None, 'ready'):
+        return None
+    if file_record.status == 'failed':
+        message = _("File processing failed")
+    else:
+        message = _("File is still being processed")
+    response = jsonify({'success': False, 'message': message, 'status': file_record.status})
+    response.status_code = 409
+    if file_record.status == 'processing':
+        response.headers['Retry-After'] = '1'
+    return response
+
+def remove_stored_files(paths):
+    """Remove stored upload files, e.g. after a database error, to avoid orphans"""
+    for path in paths:
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+                current_app.logger.info(f"Removed file after database error: {path}")
+            except Exception as remove_error:
+                current_app.logger.error(f"Error removing file: {str(remove_error)}")
+
 def api_upload_file():
     """Handle file upload from API"""
+    # Before request.files, which reads the whole body
+    busy = admit_transfer(request.content_length)
+    if busy:
+        return busy
+    
     # Mostly same logic as upload_file but returns JSON
     if 'file' not in request.files:
-        app.logger.warning("Upload attempt with no file part")
+        current_app.logger.warning("Upload attempt with no file part")
         return jsonify({"success": False, "message": _("No file part")})
     
     file = request.files['file']
     if file.filename == '':
-        app.logger.warning("Upload attempt with empty filename")
+        current_app.logger.warning("Upload attempt with empty filename")
         return jsonify({"success": False, "message": _("No file selected")})
     
     password = request.form.get('password', '')
     if not password:
-        app.logger.warning("Upload attempt with no password")
+        current_app.logger.warning("Upload attempt with no password")
         return jsonify({"success": False, "message": _("No password provided")})
     
-    if file and allowed_file(file.filename):
-        # Check file size
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
-        
-        if file_size > MAX_CONTENT_LENGTH:
-            app.logger.warning(f"Upload attempt with too large file: {file_size} bytes, max is {MAX_CONTENT_LENGTH}")
+    error = validate_upload(file)
+    if error:
+        return jsonify({"success": False, "message": error})
+    
+    # Create a secure filename
+    original_filename = secure_filename(file.filename)
+    file_uuid = str(uuid.uuid4())
+    
+    try:
+        actual_file_path, is_encrypted, wrapped_key, sniffed = store_upload(file, file_uuid, original_filename)
+    except UploadRejected as rejection:
+        return jsonify({"success": False, "message": upload_rejected_message(rejection)})
+    except Exception as e:
+        current_app.logger.error(f"File system error during upload: {str(e)}")
+        return jsonify({
+            "success": False, 
+            "message": _("An error occurred while saving the file.")
+        })
+    
+    # Asynchronous uploads are hashed by the processing job
+    processing = current_app.config['ASYNC_UPLOADS']
+    password_hash = '' if processing else hash_password(password)
+    
+    try:
+        # Store file information in database
+        new_file = UploadedFile(
+            id=file_uuid,
+            file_name=original_filename,  # This will be encrypted by the setter
+            file_path=actual_file_path,  # This will be encrypted by the setter
+            password=password,  # Raw password for demonstration purposes
+            password_hash=password_hash,
+            is_encrypted=is_encrypted,
+            wrapped_key=wrapped_key,
+            status='processing' if processing else 'ready',
+            **upload_metadata(actual_file_path, sniffed, original_filename)
+        )
+        db.session.add(new_file)
+        db.session.commit()
+        if processing and not enqueue_upload_processing([file_uuid]):
             return jsonify({
                 "success": False, 
-                "message": _("File too large, max 10MB allowed")
+                "message": _("An error occurred while saving the file information.")
             })
         
-        # Validate MIME type
-        if not validate_mime_type(file):
-            app.logger.warning(f"Upload attempt with invalid MIME type for file: {file.filename}")
-            return jsonify({
-                "success": False, 
-                "message": _("Invalid file type")
-            })
+        # Log file upload success with the specific format needed for the logs page
+        current_app.logger.info(f"File metadata saved to database: {file_uuid} - {original_filename}")
+        current_app.logger.info(f"File uploaded successfully: {original_filename} (UUID: {file_uuid})")
+        publish_upload(new_file, original_filename)
         
-        # Create a secure filename
-        original_filename = secure_filename(file.filename)
-        file_uuid = str(uuid.uuid4())
+        # Create file URL for download
+        file_url = url_for('.get_file', file_uuid=file_uuid, _external=True)
         
-        # Create unique filename with UUID
-        secure_filename_with_uuid = f"{file_uuid}_{original_filename}"
-        temp_file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename_with_uuid)
+        return jsonify({
+            "success": True, 
+            "message": _("File uploaded successfully!"),
+            "file_uuid": file_uuid,
+            "file_url": file_url,
+            "status": new_file.status,
+            "status_url": url_for('.api_file_status', file_uuid=file_uuid, _external=True)
+        })
         
-        # Save the file temporarily
+    except Exception as e:
+        db.session.rollback()
+        # If database error, delete the uploaded file to avoid orphaned files
+        remove_stored_files([actual_file_path])
+        current_app.logger.error(f"Database error during file upload: {str(e)}")
+        return jsonify({
+            "success": False, 
+            "message": _("An error occurred while saving the file information.")
+        })
+
+# Thread pool for batch uploads, created lazily so it is never inherited across a fork
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', min(8, (os.cpu_count() or 1) + 2)))
+MAX_BATCH_FILES = int(os.environ.get('MAX_BATCH_FILES', 50))
+_upload_executor = None
+
+def in_app_context(func):
+    """Wrap func so it runs inside the current application's context on a worker thread"""
+    app = current_app._get_current_object()
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            return func(*args, **kwargs)
+    return wrapper
+
+def get_upload_executor():
+    global _upload_executor
+    if _upload_executor is None:
+        _upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload')
+    return _upload_executor
+
+@main.route('/api/upload/batch', methods=['POST'])
+def api_upload_batch():
+    """Upload many files under one password: one bcrypt hash, parallel encryption, one transaction"""
+    busy = admit_transfer(request.content_length)
+    if busy:
+        return busy
+    
+    files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+    if not files:
+        current_app.logger.warning("Batch upload attempt with no files")
+        return jsonify({"success": False, "message": _("No file selected")})
+    
+    if len(files) > MAX_BATCH_FILES:
+        current_app.logger.warning(f"Batch upload attempt with too many files: {len(files)}")
+        return jsonify({"success": False, "message": _("Too many files, max %(count)s per batch", count=MAX_BATCH_FILES)})
+    
+    password = request.form.get('password', '')
+    if not password:
+        current_app.logger.warning("Batch upload attempt with no password")
+        return jsonify({"success": False, "message": _("No password provided")})
+    
+    # Validate everything up front, then encrypt the accepted files concurrently
+    results = []
+    futures = {}
+    executor = get_upload_executor()
+    for index, file in enumerate(files):
+        result = {"filename": file.filename, "success": False}
+        results.append(result)
+        error = validate_upload(file)
+        if error:
+            result["message"] = error
+            continue
+        
+        result["original_filename"] = secure_filename(file.filename)
+        result["file_uuid"] = str(uuid.uuid4())
+        futures[index] = executor.submit(in_app_context(store_upload), file, result["file_uuid"], result["original_filename"])
+    
+    stored = {}
+    for index, future in futures.items():
         try:
-            app.logger.info(f"Attempting to save file to {temp_file_path}")
-            file.save(temp_file_path)
-            app.logger.info(f"File temporarily saved at: {temp_file_path}")
-            
-            # Verify the file was saved correctly
-            if not os.path.exists(temp_file_path):
-                app.logger.error(f"Failed to save file at: {temp_file_path}")
-                return jsonify({
-                    "success": False,
-                    "message": _("Failed to save uploaded file")
-                })
-            
-            # Encrypt the file
-            app.logger.info(f"Attempting to encrypt file: {temp_file_path}")
-            try:
-                from crypto_utils import encrypt_file
-                encrypted_file_path = encrypt_file(temp_file_path)
-                app.logger.info(f"File encrypted: {encrypted_file_path}")
-                
-                # Store the encrypted path directly (without decryption attempt)
-                actual_file_path = encrypted_file_path
-                
-                # Delete the original unencrypted file if encryption was successful
-                if encrypted_file_path != temp_file_path and os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
-                    app.logger.info(f"Removed original unencrypted file: {temp_file_path}")
-            except Exception as e:
-                app.logger.error(f"Encryption error: {str(e)}")
-                # If encryption fails, continue with the unencrypted file
-                encrypted_file_path = temp_file_path
-                actual_file_path = temp_file_path
-                app.logger.warning(f"Continuing with unencrypted file: {encrypted_file_path}")
-            
-            # Generate password hash
-            password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
-            
-            try:
-                # Store file information in database
-                is_encrypted = encrypted_file_path != temp_file_path
-                new_file = UploadedFile(
-                    id=file_uuid,
-                    file_name=original_filename,  # This will be encrypted by the setter
-                    file_path=actual_file_path,  # This will be encrypted by the setter
-                    password=password,  # Raw password for demonstration purposes
-                    password_hash=password_hash,
-                    is_encrypted=is_encrypted
-                )
-                db.session.add(new_file)
-                db.session.commit()
-                
-                # Log file upload success with the specific format needed for the logs page
-                app.logger.info(f"File metadata saved to database: {file_uuid} - {original_filename}")
-                app.logger.info(f"File uploaded successfully: {original_filename} (UUID: {file_uuid})")
-                
-                # Create file URL for download
-                file_url = url_for('get_file', file_uuid=file_uuid, _external=True)
-                
-                return jsonify({
-                    "success": True, 
-                    "message": _("File uploaded successfully!"),
-                    "file_uuid": file_uuid,
-                    "file_url": file_url
-                })
-                
-            except Exception as e:
-                # If database error, delete the uploaded file to avoid orphaned files
-                if os.path.exists(encrypted_file_path):
-                    try:
-                        os.remove(encrypted_file_path)
-                        app.logger.info(f"Removed file after database error: {encrypted_file_path}")
-                    except Exception as remove_error:
-                        app.logger.error(f"Error removing file: {str(remove_error)}")
-                
-                app.logger.error(f"Database error during file upload: {str(e)}")
-                return jsonify({
-                    "success": False, 
-                    "message": _("An error occurred while saving the file information.")
-                })
-                
+            stored[index] = future.result()
+        except UploadRejected as rejection:
+            results[index]["message"] = upload_rejected_message(rejection)
         except Exception as e:
-            app.logger.error(f"File system error during upload: {str(e)}")
+            current_app.logger.error(f"File system error during batch upload: {str(e)}")
+            results[index]["message"] = _("An error occurred while saving the file.")
+    
+    if not stored:
+        return jsonify({"success": False, "message": _("No files were uploaded"), "files": [
+            {k: v for k, v in result.items() if k != "original_filename"} for result in results
+        ]})
+    
+    # One hash for the whole batch (in the processing job for asynchronous uploads)
+    processing = current_app.config['ASYNC_UPLOADS']
+    password_hash = '' if processing else hash_password(password)
+    
+    uploaded = {}
+    try:
+        for index, (actual_file_path, is_encrypted, wrapped_key, sniffed) in stored.items():
+            uploaded[index] = UploadedFile(
+                id=results[index]["file_uuid"],
+                file_name=results[index]["original_filename"],
+                file_path=actual_file_path,
+                password=password,  # Raw password for demonstration purposes
+                password_hash=password_hash,
+                is_encrypted=is_encrypted,
+                wrapped_key=wrapped_key,
+                status='processing' if processing else 'ready',
+                **upload_metadata(actual_file_path, sniffed, results[index]["original_filename"])
+            )
+            db.session.add(uploaded[index])
+        db.session.commit()
+        if processing and not enqueue_upload_processing([results[index]["file_uuid"] for index in stored]):
             return jsonify({
                 "success": False, 
-                "message": _("An error occurred while saving the file.")
+                "message": _("An error occurred while saving the file information.")
             })
-    
-    else:
-        # Handle invalid file type
-        allowed_extensions = ', '.join(ALLOWED_EXTENSIONS)
-        app.logger.warning(f"Upload attempt with invalid file type: {file.filename}")
+    except Exception as e:
+        db.session.rollback()
+        remove_stored_files([upload[0] for upload in stored.values()])
+        current_app.logger.error(f"Database error during batch upload: {str(e)}")
         return jsonify({
             "success": False, 
-            "message": _("Invalid file type. Allowed types: %(types)s", types=allowed_extensions)
+            "message": _("An error occurred while saving the file information.")
         })
+    
+    for index in stored:
+        result = results[index]
+        result["success"] = True
+        result["file_url"] = url_for('.get_file', file_uuid=result["file_uuid"], _external=True)
+        result["status"] = 'processing' if processing else 'ready'
+        current_app.logger.info(f"File metadata saved to database: {result['file_uuid']} - {result['original_filename']}")
+        publish_upload(uploaded[index], result['original_filename'])
+    current_app.logger.info(f"Batch upload completed: {len(stored)} of {len(files)} files stored")
+    
+    return jsonify({
+        "success": True,
+        "message": _("%(stored)s of %(total)s files uploaded successfully!", stored=len(stored), total=len(files)),
+        "files": [{k: v for k, v in result.items() if k != "original_filename"} for result in results]
+    })
+
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for all worker processes (admin only)"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+    
+    REGISTRY.flush()
+    return Response(generate_latest(REGISTRY), mimetype=CONTENT_TYPE_LATEST)
+
+@main.route('/api/admin/profiles', methods=['GET'])
+def list_request_profiles():
+    """Admin endpoint listing stored request profiles"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+    
+    profiles = profiling_utils.list_profiles(current_app.config['PROFILE_DIR'])
+    return jsonify({"success": True, "profiles": profiles})
 
-@app.route('/api/admin/check-files', methods=['GET'])
+@main.route('/api/admin/profiles/<name>', methods=['GET'])
+def get_request_profile(name):
+    """Admin endpoint returning a stored profile as pstats data or a text summary"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+    
+    path = profiling_utils.profile_path(current_app.config['PROFILE_DIR'], name)
+    if not path:
+        return jsonify({"success": False, "message": "Profile not found"}), 404
+    
+    if request.args.get('format') == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'calls', 'ncalls'):
+            sort = 'cumulative'
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        return Response(profiling_utils.profile_summary(path, limit, sort), mimetype='text/plain')
+    
+    directory, filename = os.path.split(path)
+    return send_from_directory(directory, filename, as_attachment=True, mimetype='application/octet-stream')
+
+@main.route('/api/admin/stats', methods=['GET'])
+def storage_stats():
+    """Storage totals, per-type and per-day aggregates (admin only); reads the maintained rows, never uploaded_file"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+    
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    since = (datetime.datetime.utcnow() - datetime.timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    by_type = StorageStat.query.filter_by(scope='type').all()
+    by_day = StorageStat.query.filter(StorageStat.scope == 'day', StorageStat.key >= since).order_by(StorageStat.key).all()
+    return jsonify({
+        "success": True,
+        "totals": storage_totals(),
+        "by_type": {row.key: row.to_dict() for row in by_type},
+        "by_day": [dict(row.to_dict(), day=row.key) for row in by_day]
+    })
+
+@main.route('/api/admin/check-files', methods=['GET'])
 def check_files():
     """Admin endpoint to check and repair orphaned files"""
     # This would ideally have authentication, but it's simplified for this example
     
-    if request.headers.get('X-Admin-Key') != app.config.get('ADMIN_KEY', 'admin-key'):
+    if not is_admin_request():
         return jsonify({"success": False, "message": "Unauthorized"}), 401
     
     try:
         # Get all files in the uploads directory
-        import glob
-        all_files = glob.glob(os.path.join(app.config['UPLOAD_FOLDER'], '*'))
-        app.logger.info(f"Found {len(all_files)} files in uploads directory: {app.config['UPLOAD_FOLDER']}")
+        all_files = glob.glob(os.path.join(current_app.config['UPLOAD_FOLDER'], '*'))
+        current_app.logger.info(f"Found {len(all_files)} files in uploads directory: {current_app.config['UPLOAD_FOLDER']}")
         
         # Log the database path
-        db_path = app.config['SQLALCHEMY_DATABASE_URI']
-        app.logger.info(f"Using database: {db_path}")
+        db_path = current_app.config['SQLALCHEMY_DATABASE_URI']
+        current_app.logger.info(f"Using database: {db_path}")
         
         # Get all file UUIDs from the database
         try:
             db_files = UploadedFile.query.all()
-            app.logger.info(f"Found {len(db_files)} files in database")
+            current_app.logger.info(f"Found {len(db_files)} files in database")
             db_uuids = [f.id for f in db_files]
         except Exception as e:
-            app.logger.error(f"Database query error: {str(e)}")
+            current_app.logger.error(f"Database query error: {str(e)}")
             db_files = []
             db_uuids = []
         
@@ -1021,13 +2253,13 @@ def check_files():
         # Check for orphaned files (files in directory but not in database)
         for file_path in all_files:
             file_name = os.path.basename(file_path)
-            app.logger.info(f"Checking file: {file_name}")
+            current_app.logger.info(f"Checking file: {file_name}")
             
             # Extract UUID from filename
             uuid_match = file_name.split('_')[0] if '_' in file_name else None
             
             if uuid_match and uuid_match not in db_uuids:
-                app.logger.info(f"Found orphaned file: {file_path} with UUID: {uuid_match}")
+                current_app.logger.info(f"Found orphaned file: {file_path} with UUID: {uuid_match}")
                 orphaned_files.append({
                     "file_path": file_path,
                     "uuid": uuid_match
@@ -1044,38 +2276,40 @@ def check_files():
                     else:
                         display_filename = original_filename
                         
-                    app.logger.info(f"Creating database entry for {uuid_match} with name {display_filename}")
+                    current_app.logger.info(f"Creating database entry for {uuid_match} with name {display_filename}")
                     
-                    # Create a new database entry
+                    # Create a new database entry, with the columns listings and downloads rely on
+                    is_encrypted = file_path.endswith('.encrypted')
                     new_file = UploadedFile(
                         id=uuid_match,
                         file_name=display_filename,
                         file_path=file_path,
                         password="recovered",  # Default password for recovered files
-                        password_hash=bcrypt.generate_password_hash("recovered").decode('utf-8'),
-                        is_encrypted=file_path.endswith('.encrypted')
+                        password_hash=hash_password("recovered"),
+                        is_encrypted=is_encrypted,
+                        **recovered_metadata(file_path, display_filename, is_encrypted)
                     )
                     db.session.add(new_file)
                     db.session.commit()
                     repaired_files.append(uuid_match)
-                    app.logger.info(f"Repaired orphaned file: {file_path}")
+                    current_app.logger.info(f"Repaired orphaned file: {file_path}")
                 except Exception as e:
-                    app.logger.error(f"Failed to repair orphaned file {file_path}: {str(e)}")
+                    current_app.logger.error(f"Failed to repair orphaned file {file_path}: {str(e)}")
         
         # Check for missing files (files in database but not in directory)
         for db_file in db_files:
             if not os.path.exists(db_file.file_path):
-                app.logger.warning(f"File in database but not on disk: {db_file.id} - {db_file.file_path}")
+                current_app.logger.warning(f"File in database but not on disk: {db_file.id} - {db_file.file_path}")
                 
                 # Try to find the file with .encrypted extension if it exists
                 encrypted_path = f"{db_file.file_path}.encrypted"
                 if os.path.exists(encrypted_path):
-                    app.logger.info(f"Found encrypted version of file: {encrypted_path}")
+                    current_app.logger.info(f"Found encrypted version of file: {encrypted_path}")
                     # Update the database record
                     db_file.file_path = encrypted_path
                     db_file.is_encrypted = True
                     db.session.commit()
-                    app.logger.info(f"Updated file path in database: {db_file.id}")
+                    current_app.logger.info(f"Updated file path in database: {db_file.id}")
                 else:
                     missing_files.append({
                         "uuid": db_file.id,
@@ -1088,7 +2322,7 @@ def check_files():
             "orphaned_files": len(orphaned_files),
             "missing_files": len(missing_files),
             "repaired_files": len(repaired_files),
-            "uploads_dir": app.config['UPLOAD_FOLDER'],
+            "uploads_dir": current_app.config['UPLOAD_FOLDER'],
             "database_path": db_path,
             "details": {
                 "orphaned": orphaned_files,
@@ -1097,5 +2331,14 @@ def check_files():
             }
         })
     except Exception as e:
-        app.logger.error(f"Error checking files: {str(e)}")
+        current_app.logger.error(f"Error checking files: {str(e)}")
         return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
+
+# Module-level application for WSGI servers (app:app), the flask CLI and the tests
+app = create_app()
+if BOOTSTRAP_ON_IMPORT:
+    bootstrap(app)
+
+if __name__ == '__main__':
+    port = int(os.environ.get("PORT", 5000))
+    app.run(host='0.0.0.0', port=port, debug=False)  # Set debug=False for production
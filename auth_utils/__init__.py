@@ -1,7 +1,9 @@
-from .token_manager import TokenManager, token_required, admin_token_required, download_token_required
+from .token_manager import TokenManager, MemoryRevocations, SQLiteRevocations, token_required, admin_token_required, download_token_required
 
 __all__ = [
     'TokenManager',
+    'MemoryRevocations',
+    'SQLiteRevocations',
     'token_required',
     'admin_token_required',
     'download_token_required'
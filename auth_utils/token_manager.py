@@ -1,6 +1,13 @@
 import os
 import jwt
+import time
+import uuid
+import random
+import sqlite3
+import hashlib
 import datetime
+import threading
+from collections import OrderedDict
 from functools import wraps
 from flask import request, jsonify, current_app
 import logging
@@ -8,19 +15,104 @@ import logging
 # Initialize logger
 logger = logging.getLogger(__name__)
 
+def _redact(payload):
+    """Token claims that are safe to log: type, flags and a shortened file id"""
+    summary = {key: payload[key] for key in ('type', 'admin', 'password_verified') if key in payload}
+    if payload.get('file_uuid'):
+        summary['file_uuid'] = str(payload['file_uuid'])[:8] + '...'
+    return summary
+
+
+class MemoryRevocations:
+    """Revoked token ids of this process only; with several workers a revocation does not reach the others"""
+
+    def __init__(self):
+        self._revoked = {}
+        self._lock = threading.Lock()
+
+    def add(self, token_id, expires):
+        now = time.time()
+        with self._lock:
+            self._revoked[token_id] = expires
+            self._revoked = {key: exp for key, exp in self._revoked.items() if exp > now}
+
+    def contains(self, token_id):
+        # Lock-free fast path for the common case of nothing revoked
+        return bool(self._revoked) and token_id in self._revoked
+
+
+class SQLiteRevocations:
+    """
+    Revoked token ids shared by every process on a node through a small SQLite file.
+
+    Stands in for a networked store (e.g. Redis) in multi-worker deployments,
+    like the admission and event backends; rows are dropped once the token
+    has expired anyway.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute("CREATE TABLE IF NOT EXISTS token_revocations (token_id TEXT PRIMARY KEY, expires REAL)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        # Connections must not be shared with a forked parent
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def add(self, token_id, expires):
+        connection = self._connection()
+        connection.execute("INSERT OR REPLACE INTO token_revocations (token_id, expires) VALUES (?, ?)", (token_id, expires))
+        connection.execute("DELETE FROM token_revocations WHERE expires <= ?", (time.time(),))
+
+    def contains(self, token_id):
+        row = self._connection().execute(
+            "SELECT 1 FROM token_revocations WHERE token_id = ? AND expires > ?", (token_id, time.time())
+        ).fetchone()
+        return row is not None
+
+
+def create_revocations(spec):
+    """Revocation list from a spec: 'memory' or 'sqlite:///path/to/revocations.db'"""
+    if not spec or spec == 'memory':
+        return MemoryRevocations()
+    if spec.startswith('sqlite:///'):
+        path = spec[len('sqlite:///'):]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQLiteRevocations(path)
+    raise ValueError(f"Unknown revocation backend: {spec}")
+
+
 class TokenManager:
     """
     Manages JWT token generation, validation, and refresh operations.
+
+    Verified payloads are cached per process (keyed by a hash of the token,
+    until the token's exp), so repeated checks of the same token skip the
+    signature verification. Tokens carry a jti claim that can be revoked;
+    the revocation list is checked on every verification, cached or not. It
+    is kept in memory with a single worker and, by default, in a SQLite file
+    shared by all workers when GUNICORN_WORKERS > 1.
     """
     
-    def __init__(self, app=None):
+    def __init__(self, app=None, revocations=None):
         """
         Initialize the TokenManager.
         
         Args:
             app: Optional Flask application instance
+            revocations: Optional revocation list (MemoryRevocations, SQLiteRevocations);
+                by default created from JWT_REVOCATION_BACKEND
         """
         self.app = app
+        self.revocations = revocations
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
         if app is not None:
             self.init_app(app)
     
@@ -37,6 +129,13 @@ class TokenManager:
         app.config.setdefault('JWT_ACCESS_TOKEN_EXPIRES', 30 * 60)  # 30 minutes
         app.config.setdefault('JWT_REFRESH_TOKEN_EXPIRES', 7 * 24 * 60 * 60)  # 7 days
         app.config.setdefault('JWT_ALGORITHM', 'HS256')
+        app.config.setdefault('JWT_VERIFY_CACHE_SIZE', int(os.environ.get('JWT_VERIFY_CACHE_SIZE', 10000)))
+        app.config.setdefault('JWT_LOG_SAMPLE_RATE', float(os.environ.get('JWT_LOG_SAMPLE_RATE', 0.01)))
+        workers = int(os.environ.get('GUNICORN_WORKERS') or 1)
+        default_revocations = f"sqlite:///{os.path.abspath('revocations.db')}" if workers > 1 else 'memory'
+        app.config.setdefault('JWT_REVOCATION_BACKEND', os.environ.get('JWT_REVOCATION_BACKEND', default_revocations))
+        if self.revocations is None:
+            self.revocations = create_revocations(app.config['JWT_REVOCATION_BACKEND'])
         
         logger.info("TokenManager initialized")
     
@@ -56,6 +155,7 @@ class TokenManager:
                 seconds=self.app.config['JWT_ACCESS_TOKEN_EXPIRES']
             ),
             'iat': datetime.datetime.utcnow(),
+            'jti': uuid.uuid4().hex,
             'type': 'access'
         }
         
@@ -66,7 +166,7 @@ class TokenManager:
         if admin:
             payload['admin'] = True
         
-        logger.info(f"Generating access token: {payload}")
+        self._log_sampled("Generating access token", payload)
         
         return jwt.encode(
             payload,
@@ -86,10 +186,11 @@ class TokenManager:
                 seconds=self.app.config['JWT_REFRESH_TOKEN_EXPIRES']
             ),
             'iat': datetime.datetime.utcnow(),
+            'jti': uuid.uuid4().hex,
             'type': 'refresh'
         }
         
-        logger.info("Generating refresh token")
+        self._log_sampled("Generating refresh token", payload)
         
         return jwt.encode(
             payload,
@@ -113,6 +214,7 @@ class TokenManager:
         payload = {
             'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=10),
             'iat': datetime.datetime.utcnow(),
+            'jti': uuid.uuid4().hex,
             'type': 'download',
             'file_uuid': file_uuid,
             'password_verified': password_verified
@@ -121,7 +223,7 @@ class TokenManager:
         if file_type:
             payload['file_type'] = file_type
             
-        logger.info(f"Generating download token for file: {file_uuid}")
+        self._log_sampled("Generating download token", payload)
         
         return jwt.encode(
             payload,
@@ -140,26 +242,109 @@ class TokenManager:
         Returns:
             dict: Token payload if valid, None if invalid
         """
+        key = self._cache_key(token)
+        payload = self._cached_payload(key)
+        if payload is None:
+            try:
+                payload = jwt.decode(
+                    token,
+                    self.app.config['JWT_SECRET_KEY'],
+                    algorithms=[self.app.config['JWT_ALGORITHM']]
+                )
+            except jwt.ExpiredSignatureError:
+                logger.warning("Token has expired")
+                return None
+            except jwt.InvalidTokenError as e:
+                logger.warning(f"Invalid token: {str(e)}")
+                return None
+            self._cache_payload(key, payload)
+            self._log_sampled("Token verified", payload)
+
+        if self.is_revoked(payload, key):
+            logger.warning("Revoked token used")
+            return None
+
+        # If token_type is specified, verify that the token matches the expected type
+        if token_type and payload.get('type') != token_type:
+            logger.warning(f"Token type mismatch. Expected: {token_type}, Got: {payload.get('type')}")
+            return None
+
+        # Callers may add to the payload; keep the cached copy intact
+        return dict(payload)
+
+    def revoke_token(self, token):
+        """
+        Revoke a token until it expires.
+
+        Args:
+            token: JWT token to revoke; it must have a valid signature
+
+        Returns:
+            bool: True if the token was revoked, False if it is invalid or already expired
+        """
         try:
             payload = jwt.decode(
                 token,
                 self.app.config['JWT_SECRET_KEY'],
                 algorithms=[self.app.config['JWT_ALGORITHM']]
             )
-            
-            # If token_type is specified, verify that the token matches the expected type
-            if token_type and payload.get('type') != token_type:
-                logger.warning(f"Token type mismatch. Expected: {token_type}, Got: {payload.get('type')}")
+        except jwt.InvalidTokenError:
+            return False
+
+        key = self._cache_key(token)
+        with self._lock:
+            self._cache.pop(key, None)
+        # Tokens without exp stay revoked for the longest token lifetime
+        expires = payload.get('exp', time.time() + self.app.config['JWT_REFRESH_TOKEN_EXPIRES'])
+        self.revocations.add(self._revocation_id(payload, key), expires)
+        logger.info(f"Token revoked: {_redact(payload)}")
+        return True
+
+    def is_revoked(self, payload, key=None):
+        """Check a verified payload (or, for tokens without jti, its cache key) against the revocation list"""
+        return self.revocations.contains(self._revocation_id(payload, key))
+
+    @staticmethod
+    def _revocation_id(payload, key):
+        # Tokens issued before jti was added are revoked by their hash
+        return payload.get('jti') or (key.hex() if key else None)
+
+    def clear_cache(self):
+        """Forget all verified tokens (e.g. after changing JWT_SECRET_KEY)"""
+        with self._lock:
+            self._cache.clear()
+
+    @staticmethod
+    def _cache_key(token):
+        if isinstance(token, str):
+            token = token.encode()
+        return hashlib.sha256(token).digest()
+
+    def _cached_payload(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
                 return None
-                
-            logger.info(f"Token verified successfully: {payload.get('type')}")
+            payload, expires = entry
+            if expires <= time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
             return payload
-        except jwt.ExpiredSignatureError:
-            logger.warning("Token has expired")
-            return None
-        except jwt.InvalidTokenError as e:
-            logger.warning(f"Invalid token: {str(e)}")
-            return None
+
+    def _cache_payload(self, key, payload):
+        max_size = self.app.config['JWT_VERIFY_CACHE_SIZE']
+        # Tokens without exp are always verified in full
+        if max_size <= 0 or 'exp' not in payload:
+            return
+        with self._lock:
+            self._cache[key] = (payload, payload['exp'])
+            while len(self._cache) > max_size:
+                self._cache.popitem(last=False)
+
+    def _log_sampled(self, message, payload):
+        if logger.isEnabledFor(logging.DEBUG) and random.random() < self.app.config['JWT_LOG_SAMPLE_RATE']:
+            logger.debug(f"{message}: {_redact(payload)}")
 
 # Decorators for protecting routes
 
@@ -0,0 +1,238 @@
+"""
+Micro-benchmarks for crypto_utils and the UploadedFile metadata accessors.
+
+Usage:
+    python -m benchmarks.bench_crypto                          # run and print
+    python -m benchmarks.bench_crypto --save baseline.json     # save a JSON baseline
+    python -m benchmarks.bench_crypto --compare baseline.json  # flag regressions (exit 1)
+    python -m benchmarks.bench_crypto --sizes 1KB,1MB,1GB      # choose file sizes
+"""
+import os
+import io
+import sys
+import json
+import time
+import base64
+import argparse
+import platform
+import tempfile
+import datetime
+import statistics
+import subprocess
+import contextlib
+
+DEFAULT_SIZES = '1KB,64KB,1MB,16MB'
+FULL_SIZES = '1KB,64KB,1MB,16MB,256MB,1GB'
+SIZE_UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(text):
+    """Parse sizes such as 64KB or 1GB into bytes"""
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def format_size(size):
+    """Format bytes using the largest unit that divides them evenly"""
+    for unit, factor in reversed(list(SIZE_UNITS.items())):
+        if size % factor == 0:
+            return f"{size // factor}{unit}"
+    return f"{size}B"
+
+
+def measure(func, min_time=0.5, min_rounds=3, max_rounds=1000):
+    """Run func repeatedly and return per-call durations in seconds"""
+    durations = []
+    deadline = time.perf_counter() + min_time
+    while len(durations) < max_rounds and (len(durations) < min_rounds or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(durations, unit, work=1.0, higher_is_better=True):
+    """Turn durations into a result entry; work is bytes (throughput) or 1 (ops/sec)"""
+    median = statistics.median(durations)
+    if unit == 'MB/s':
+        value = work / (1024 ** 2) / median
+    elif unit == 'ops/s':
+        value = work / median
+    else:
+        value = median
+    return {
+        'value': round(value, 6),
+        'unit': unit,
+        'higher_is_better': higher_is_better,
+        'rounds': len(durations),
+        'median_s': median,
+        'min_s': min(durations)
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """crypto_utils prints on every call; keep benchmark output readable"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_files(sizes, workdir):
+    import crypto_utils
+
+    results = {}
+    for size in sizes:
+        label = format_size(size)
+        plain_path = os.path.join(workdir, f"plain_{size}")
+        encrypted_path = plain_path + '.encrypted'
+        decrypted_path = plain_path + '.decrypted'
+
+        # Write random data in chunks so large sizes do not need the whole file in memory
+        with open(plain_path, 'wb') as f:
+            remaining = size
+            while remaining:
+                chunk = min(remaining, 16 * 1024 * 1024)
+                f.write(os.urandom(chunk))
+                remaining -= chunk
+
+        # Large files are only run a few times
+        min_time = 0.5 if size < 64 * 1024 * 1024 else 0
+        with quiet():
+            encrypt = measure(lambda: crypto_utils.encrypt_file(plain_path, encrypted_path), min_time=min_time)
+            decrypt = measure(lambda: crypto_utils.decrypt_file(encrypted_path, decrypted_path), min_time=min_time)
+
+        results[f"encrypt_file[{label}]"] = summarize(encrypt, 'MB/s', size)
+        results[f"decrypt_file[{label}]"] = summarize(decrypt, 'MB/s', size)
+
+        for path in (plain_path, encrypted_path, decrypted_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return results
+
+
+def bench_fields():
+    import crypto_utils
+
+    value = '/app/uploads/0b3f1c2e-8d4a-4f5b-9c6d-7e8f9a0b1c2d_quarterly-report.pdf.encrypted'
+    with quiet():
+        token = crypto_utils.encrypt_db_field(value)
+        return {
+            'get_master_key': summarize(measure(crypto_utils.get_master_key), 's', higher_is_better=False),
+            'encrypt_db_field': summarize(measure(lambda: crypto_utils.encrypt_db_field(value)), 'ops/s'),
+            'decrypt_db_field': summarize(measure(lambda: crypto_utils.decrypt_db_field(token)), 'ops/s')
+        }
+
+
+def bench_model():
+    from app import app, bcrypt, UploadedFile
+
+    with app.app_context():
+        record = UploadedFile(id='benchmark', is_encrypted=True)
+        record.file_name = 'quarterly-report.pdf'
+        password_hash = bcrypt.generate_password_hash('benchmark-password').decode('utf-8')
+
+        with quiet():
+            file_name = measure(lambda: record.file_name)
+        bcrypt_verify = measure(lambda: bcrypt.check_password_hash(password_hash, 'benchmark-password'), min_time=1.0)
+
+    return {
+        'UploadedFile.file_name': summarize(file_name, 'ops/s'),
+        'bcrypt_verify': summarize(bcrypt_verify, 's', higher_is_better=False)
+    }
+
+
+def compare_results(baseline, current, threshold):
+    """
+    Compare two result sets.
+
+    Returns:
+        list: (name, baseline value, current value, relative change) for every
+        benchmark that got worse by more than threshold (e.g. 0.1 for 10%)
+    """
+    regressions = []
+    for name, base in baseline.get('results', {}).items():
+        now = current.get('results', {}).get(name)
+        if not now or not base['value']:
+            continue
+        change = (now['value'] - base['value']) / base['value']
+        worse = -change if base.get('higher_is_better', True) else change
+        if worse > threshold:
+            regressions.append((name, base['value'], now['value'], change))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="crypto_utils and metadata micro-benchmarks")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f"comma separated file sizes (default {DEFAULT_SIZES})")
+    parser.add_argument('--full', action='store_true', help=f"use sizes {FULL_SIZES}")
+    parser.add_argument('--save', help="write results as JSON to this path")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.15, help="allowed relative regression (default 0.15)")
+    parser.add_argument('--skip-model', action='store_true', help="skip benchmarks that import the Flask app")
+    args = parser.parse_args(argv)
+
+    # A fixed key keeps runs comparable; the app must not wipe anything on import
+    os.environ.setdefault('MASTER_ENCRYPTION_KEY', base64.urlsafe_b64encode(b'0' * 32).decode())
+    os.environ.setdefault('ENABLE_STARTUP_CLEANUP', 'false')
+
+    sizes = [parse_size(size) for size in (FULL_SIZES if args.full else args.sizes).split(',')]
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, repo_root)
+
+    workdir = tempfile.mkdtemp(prefix='bench_crypto_')
+    cwd = os.getcwd()
+    # Importing the app creates its SQLite database, uploads and logs in the working directory
+    os.chdir(workdir)
+    try:
+        results = {}
+        results.update(bench_files(sizes, workdir))
+        results.update(bench_fields())
+        if not args.skip_model:
+            results.update(bench_model())
+    finally:
+        os.chdir(cwd)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': results
+    }
+
+    for name, result in results.items():
+        print(f"{name:32} {result['value']:>14.4f} {result['unit']}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, report, args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:.4f} -> {after:.4f} ({change:+.1%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
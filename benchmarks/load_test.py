@@ -0,0 +1,417 @@
+"""
+End-to-end load test for the upload -> verify -> download flow.
+
+By default a local instance is started in a scratch directory with a SQLite
+database (pass --database-url for a local PostgreSQL), driven by a pool of
+virtual users, and stopped again. Use --url to target an already running node.
+
+Usage:
+    python -m benchmarks.load_test --users 16 --duration 60
+    python -m benchmarks.load_test --size-mix 1KB:60,256KB:30,4MB:10 --json report.json
+    python -m benchmarks.load_test --server gunicorn --workers 4 --worker-class gthread
+    python -m benchmarks.load_test --url http://127.0.0.1:5000
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import base64
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+from benchmarks.bench_crypto import parse_size, format_size
+
+DEFAULT_SIZE_MIX = '1KB:50,64KB:30,1MB:15,8MB:5'
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_size_mix(text):
+    """Parse '1KB:50,1MB:10' into [(bytes, weight), ...]"""
+    mix = []
+    for part in text.split(','):
+        size, _, weight = part.partition(':')
+        mix.append((parse_size(size), float(weight or 1)))
+    return mix
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def process_rss(pid):
+    """Resident memory in bytes of a process and all of its children (Linux only)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total or None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """Runs the app in a scratch working directory so uploads, logs and the SQLite DB stay isolated"""
+
+    def __init__(self, server='flask', workers=2, worker_class='sync', threads=4, database_url=None, async_uploads=False):
+        self.server = server
+        self.async_uploads = async_uploads
+        self.workers = workers
+        self.worker_class = worker_class
+        self.threads = threads
+        self.database_url = database_url
+        self.port = free_port()
+        self.workdir = tempfile.mkdtemp(prefix='load_test_')
+        self.process = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout=30):
+        env = dict(os.environ)
+        env.update({
+            'PORT': str(self.port),
+            'ENABLE_STARTUP_CLEANUP': 'false',
+            # Virtual users announce distinct client addresses so per-IP limits apply per user
+            'ADMISSION_TRUST_FORWARDED': 'true',
+            'ASYNC_UPLOADS': 'true' if self.async_uploads else 'false',
+            'JOB_QUEUE_PATH': os.path.join(self.workdir, 'jobs.db'),
+            'MASTER_ENCRYPTION_KEY': env.get('MASTER_ENCRYPTION_KEY') or base64.urlsafe_b64encode(b'0' * 32).decode(),
+            'PYTHONPATH': REPO_ROOT + os.pathsep + env.get('PYTHONPATH', ''),
+            'FLASK_APP': os.path.join(REPO_ROOT, 'app.py')
+        })
+        if self.database_url:
+            env['DATABASE_URL'] = self.database_url
+        else:
+            env.pop('DATABASE_URL', None)
+
+        if self.server == 'gunicorn':
+            command = [
+                sys.executable, '-m', 'gunicorn', 'app:app',
+                '--config', os.path.join(REPO_ROOT, 'gunicorn.conf.py'),
+                '--bind', f"127.0.0.1:{self.port}",
+                '--workers', str(self.workers),
+                '--worker-class', self.worker_class,
+                '--threads', str(self.threads)
+            ]
+        else:
+            command = [sys.executable, '-m', 'flask', 'run', '--host', '127.0.0.1', '--port', str(self.port), '--with-threads']
+
+        self.log = open(os.path.join(self.workdir, 'server.out'), 'w')
+        self.process = subprocess.Popen(command, cwd=self.workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited early, see {self.log.name}")
+            try:
+                status, _ = request('GET', self.url, '/api/upload')
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("Server did not become ready in time")
+
+    def rss(self):
+        return process_rss(self.process.pid) if self.process else None
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.process:
+            self.log.close()
+
+
+_local = threading.local()
+
+
+def request(method, base_url, path, body=None, headers=None):
+    """Send a request on a per-thread keep-alive connection and return (status, body)"""
+    parts = urlsplit(base_url)
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(parts.hostname, parts.port, timeout=120)
+        _local.connection = connection
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    except (OSError, http.client.HTTPException):
+        connection.close()
+        _local.connection = None
+        raise
+
+
+def multipart(fields, files):
+    """Encode form fields and (name, filename, bytes) files as multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: text/plain\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Stats:
+    """Thread-safe latency and error collection per operation"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.bytes = {'uploaded': 0, 'downloaded': 0}
+
+    def record(self, operation, seconds, ok, uploaded=0, downloaded=0):
+        with self.lock:
+            self.latencies.setdefault(operation, []).append(seconds)
+            if not ok:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+            self.bytes['uploaded'] += uploaded
+            self.bytes['downloaded'] += downloaded
+
+
+def timed_request(stats, operation, base_url, method, path, body=None, headers=None, expected=200, uploaded=0):
+    start = time.perf_counter()
+    try:
+        status, data = request(method, base_url, path, body, headers)
+        ok = status == expected
+    except (OSError, http.client.HTTPException):
+        status, data, ok = None, b'', False
+    downloaded = len(data) if operation == 'download' and ok else 0
+    stats.record(operation, time.perf_counter() - start, ok, uploaded, downloaded)
+    return status, data, ok
+
+
+def virtual_user(base_url, stats, size_mix, logs_ratio, deadline, rng, client_ip='127.0.0.1', known_ids=None):
+    sizes, weights = zip(*size_mix)
+    client_header = {'X-Forwarded-For': client_ip}
+    # Payloads are built once per size; hex text passes every upload validator
+    payloads = {}
+    while time.time() < deadline:
+        size = rng.choices(sizes, weights)[0]
+        if size not in payloads:
+            payloads[size] = os.urandom(size // 2 + 1).hex()[:size].encode()
+        password = uuid.uuid4().hex
+
+        body, content_type = multipart({'password': password}, [('file', f"load_{format_size(size)}.txt", payloads[size])])
+        _, data, ok = timed_request(stats, 'upload', base_url, 'POST', '/api/upload', body,
+                                    {'Content-Type': content_type, **client_header}, uploaded=size)
+        if not ok:
+            continue
+        try:
+            result = json.loads(data)
+        except ValueError:
+            result = {}
+        file_uuid = result.get('file_uuid')
+        if not result.get('success') or not file_uuid:
+            stats.record('upload_rejected', 0, False)
+            continue
+        if result.get('status') == 'processing' and not wait_until_ready(base_url, stats, file_uuid, client_header, deadline):
+            continue
+        if known_ids is not None:
+            known_ids.append(file_uuid)
+
+        verify_body = json.dumps({'password': password}).encode()
+        _, _, ok = timed_request(stats, 'verify', base_url, 'POST', f'/api/files/{file_uuid}', verify_body,
+                                 {'Content-Type': 'application/json', **client_header})
+        if ok:
+            timed_request(stats, 'download', base_url, 'GET', f'/api/download/{file_uuid}?authenticated=true', headers=client_header)
+
+        if rng.random() < logs_ratio:
+            timed_request(stats, 'logs', base_url, 'GET', '/api/logs', headers=client_header)
+
+
+def wait_until_ready(base_url, stats, file_uuid, headers, deadline):
+    """Poll the status of an asynchronous upload; records the time until it is downloadable as 'processing'"""
+    start = time.perf_counter()
+    while time.time() < deadline + 30:
+        try:
+            status, data = request('GET', base_url, f'/api/files/{file_uuid}/status', headers=headers)
+            state = json.loads(data).get('status') if status == 200 else 'failed'
+        except (OSError, http.client.HTTPException, ValueError):
+            state = 'failed'
+        if state != 'processing':
+            stats.record('processing', time.perf_counter() - start, state == 'ready')
+            return state == 'ready'
+        time.sleep(0.05)
+    stats.record('processing', time.perf_counter() - start, False)
+    return False
+
+
+def attacker(base_url, stats, deadline, rng, known_ids):
+    """Guess passwords for files other users uploaded, from rotating addresses"""
+    while time.time() < deadline:
+        if not known_ids:
+            time.sleep(0.1)
+            continue
+        body = json.dumps({'password': uuid.uuid4().hex}).encode()
+        headers = {'Content-Type': 'application/json', 'X-Forwarded-For': f"198.51.100.{rng.randrange(1, 255)}"}
+        status, _, _ = timed_request(stats, 'attack', base_url, 'POST', f'/api/files/{rng.choice(known_ids)}', body, headers, expected=403)
+        if status == 429:
+            # Refused before bcrypt: the outcome admission control is meant to produce
+            stats.record('attack_throttled', 0, True)
+
+
+def build_report(stats, elapsed, rss_samples, args):
+    operations = {}
+    total_requests = 0
+    total_errors = 0
+    for operation, latencies in sorted(stats.latencies.items()):
+        errors = stats.errors.get(operation, 0)
+        total_requests += len(latencies)
+        total_errors += errors
+        operations[operation] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'error_rate': errors / len(latencies) if latencies else 0,
+            'throughput_rps': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000
+        }
+    rss = [sample for sample in rss_samples if sample]
+    return {
+        'config': {
+            'users': args.users,
+            'duration_s': args.duration,
+            'size_mix': args.size_mix,
+            'server': args.url or args.server,
+            'workers': args.workers,
+            'worker_class': args.worker_class
+        },
+        'elapsed_s': elapsed,
+        'total_requests': total_requests,
+        'total_errors': total_errors,
+        'throughput_rps': total_requests / elapsed,
+        'upload_mb_per_s': stats.bytes['uploaded'] / (1024 ** 2) / elapsed,
+        'download_mb_per_s': stats.bytes['downloaded'] / (1024 ** 2) / elapsed,
+        'server_rss_mb': {
+            'max': max(rss) / (1024 ** 2) if rss else None,
+            'last': rss[-1] / (1024 ** 2) if rss else None
+        },
+        'operations': operations
+    }
+
+
+def print_report(report):
+    print(f"\n{'operation':12} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for operation, row in report['operations'].items():
+        print(f"{operation:12} {row['requests']:>9} {row['errors']:>7} {row['throughput_rps']:>8.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+    print(f"\nTotal: {report['total_requests']} requests, {report['total_errors']} errors, "
+          f"{report['throughput_rps']:.1f} req/s, upload {report['upload_mb_per_s']:.2f} MB/s, "
+          f"download {report['download_mb_per_s']:.2f} MB/s")
+    if report['server_rss_mb']['max'] is not None:
+        print(f"Server RSS: max {report['server_rss_mb']['max']:.1f} MB, last {report['server_rss_mb']['last']:.1f} MB")
+
+
+def run(args):
+    server = None
+    base_url = args.url
+    if not base_url:
+        server = LocalServer(args.server, args.workers, args.worker_class, args.threads, args.database_url, args.async_uploads)
+        server.start()
+        base_url = server.url
+        print(f"Started {args.server} server at {base_url} (workdir {server.workdir})")
+
+    stats = Stats()
+    known_ids = []
+    rss_samples = []
+    size_mix = parse_size_mix(args.size_mix)
+    start = time.time()
+    deadline = start + args.duration
+
+    threads = [
+        threading.Thread(target=virtual_user, args=(base_url, stats, size_mix, args.logs_ratio, deadline, random.Random(args.seed + index),
+                                                    f"10.0.{index // 250}.{index % 250 + 1}", known_ids), daemon=True)
+        for index in range(args.users)
+    ] + [
+        threading.Thread(target=attacker, args=(base_url, stats, deadline, random.Random(args.seed - index - 1), known_ids), daemon=True)
+        for index in range(args.attackers)
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            if server:
+                rss_samples.append(server.rss())
+            time.sleep(1)
+        elapsed = time.time() - start
+    finally:
+        if server:
+            server.stop()
+
+    return build_report(stats, elapsed, rss_samples, args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Load test the upload -> verify -> download flow")
+    parser.add_argument('--url', help="target an existing instance instead of starting one")
+    parser.add_argument('--users', type=int, default=8, help="concurrent virtual users (default 8)")
+    parser.add_argument('--duration', type=float, default=30, help="test duration in seconds (default 30)")
+    parser.add_argument('--size-mix', default=DEFAULT_SIZE_MIX, help=f"size:weight list (default {DEFAULT_SIZE_MIX})")
+    parser.add_argument('--attackers', type=int, default=0, help="threads guessing passwords of uploaded files (default 0)")
+    parser.add_argument('--logs-ratio', type=float, default=0.1, help="probability of polling /api/logs per iteration")
+    parser.add_argument('--server', choices=['flask', 'gunicorn'], default='flask', help="local server to start")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers")
+    parser.add_argument('--worker-class', default='sync', help="gunicorn worker class")
+    parser.add_argument('--threads', type=int, default=4, help="gunicorn threads per worker (gthread)")
+    parser.add_argument('--async-uploads', action='store_true', help="start the server with ASYNC_UPLOADS=true (upload latency then excludes encryption and hashing)")
+    parser.add_argument('--database-url', help="e.g. a local PostgreSQL; SQLite in the scratch dir by default")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="write the report as JSON to this path")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.json}")
+    return 1 if report['total_requests'] == 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Compare gunicorn worker classes on the upload -> verify -> download mix.
+
+Each worker class is started with gunicorn.conf.py (preload, post-fork hooks)
+in its own scratch directory and driven by the load test from load_test.py.
+gevent is skipped when the package is not installed.
+
+Usage:
+    python -m benchmarks.worker_classes
+    python -m benchmarks.worker_classes --classes sync,gthread --workers 4 --duration 60
+    python -m benchmarks.worker_classes --json worker_classes.json
+"""
+import sys
+import json
+import argparse
+import importlib.util
+
+from benchmarks import load_test
+
+DEFAULT_CLASSES = 'sync,gthread,gevent'
+
+# Worker classes that need an extra package
+REQUIRED_PACKAGES = {'gevent': 'gevent', 'eventlet': 'eventlet'}
+
+
+def available(worker_class):
+    package = REQUIRED_PACKAGES.get(worker_class)
+    return package is None or importlib.util.find_spec(package) is not None
+
+
+def compare(args):
+    """Run the load test once per worker class and return {worker class: report}"""
+    reports = {}
+    for worker_class in [name.strip() for name in args.classes.split(',') if name.strip()]:
+        if not available(worker_class):
+            print(f"Skipping {worker_class}: {REQUIRED_PACKAGES[worker_class]} is not installed")
+            continue
+        print(f"\n=== {worker_class} ===")
+        run_args = load_test.build_parser().parse_args([
+            '--server', 'gunicorn',
+            '--worker-class', worker_class,
+            '--workers', str(args.workers),
+            '--threads', str(args.threads),
+            '--users', str(args.users),
+            '--duration', str(args.duration),
+            '--size-mix', args.size_mix,
+            '--seed', str(args.seed)
+        ] + (['--database-url', args.database_url] if args.database_url else []))
+        reports[worker_class] = load_test.run(run_args)
+        load_test.print_report(reports[worker_class])
+    return reports
+
+
+def print_comparison(reports):
+    print(f"\n{'worker class':14} {'req/s':>8} {'errors':>7} {'upload p95':>11} {'download p95':>13} {'RSS MB':>8}")
+    for worker_class, report in reports.items():
+        operations = report['operations']
+        upload = operations.get('upload', {}).get('p95_ms', float('nan'))
+        download = operations.get('download', {}).get('p95_ms', float('nan'))
+        rss = report['server_rss_mb']['max']
+        print(f"{worker_class:14} {report['throughput_rps']:>8.1f} {report['total_errors']:>7} "
+              f"{upload:>9.1f}ms {download:>11.1f}ms {rss if rss is not None else float('nan'):>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare gunicorn worker classes under the load test mix")
+    parser.add_argument('--classes', default=DEFAULT_CLASSES, help=f"comma separated worker classes (default {DEFAULT_CLASSES})")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers per run")
+    parser.add_argument('--threads', type=int, default=4, help="threads per worker (gthread)")
+    parser.add_argument('--users', type=int, default=16, help="concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="seconds per worker class")
+    parser.add_argument('--size-mix', default=load_test.DEFAULT_SIZE_MIX)
+    parser.add_argument('--database-url', help="e.g. a local PostgreSQL; SQLite in the scratch dir by default")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="write all reports as JSON to this path")
+    args = parser.parse_args(argv)
+
+    reports = compare(args)
+    if not reports:
+        print("No worker class could be run")
+        return 1
+    print_comparison(reports)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"Reports saved to {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
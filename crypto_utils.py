@@ -1,8 +1,15 @@
 import os
 import base64
-from cryptography.fernet import Fernet
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from metrics_utils import timed
+
+# Normalized keys by MASTER_ENCRYPTION_KEY value, so the key is validated once rather than on every field access
+_key_cache = {}
 
 # Set a default encryption key from environment or generate one
 def get_master_key():
@@ -17,6 +24,65 @@ def get_master_key():
         print("Set this in your environment variables to ensure data consistency")
         return key
     
+    cached = _key_cache.get(key)
+    if cached is None:
+        cached = _key_cache[key] = _normalize_master_key(key)
+    return cached
+
+def get_master_keys():
+    """
+    Current master key followed by retired ones (MASTER_ENCRYPTION_KEY_PREVIOUS, comma separated).
+
+    Decryption accepts any of them, so data stays readable while a rotation is in progress.
+    """
+    keys = [get_master_key()]
+    for previous in os.environ.get('MASTER_ENCRYPTION_KEY_PREVIOUS', '').split(','):
+        previous = previous.strip()
+        if previous:
+            cached = _key_cache.get(previous)
+            if cached is None:
+                cached = _key_cache[previous] = _normalize_master_key(previous)
+            if cached not in keys:
+                keys.append(cached)
+    return keys
+
+def _fernet(key):
+    """Fernet for one key, MultiFernet (first key encrypts, any decrypts) for a list of keys"""
+    if isinstance(key, (list, tuple)):
+        return MultiFernet([Fernet(k) for k in key])
+    return Fernet(key)
+
+# Envelope encryption: each file is encrypted with its own random data key, and only
+# that key is encrypted ("wrapped") with the master key and stored with the record.
+# Rotating the master key then means re-wrapping a 100-byte token per file.
+def generate_data_key():
+    """Create a random per-file data key"""
+    return Fernet.generate_key()
+
+def wrap_data_key(data_key, master_key=None):
+    """Encrypt a data key with the (current) master key"""
+    return Fernet(master_key or get_master_key()).encrypt(data_key)
+
+def unwrap_data_key(wrapped_key):
+    """Decrypt a wrapped data key with the current or any previous master key"""
+    return _fernet(get_master_keys()).decrypt(bytes(wrapped_key))
+
+def rewrap_data_key(wrapped_key):
+    """Re-encrypt a wrapped data key under the current master key"""
+    return _fernet(get_master_keys()).rotate(bytes(wrapped_key))
+
+def rotate_db_field(encrypted_data):
+    """Re-encrypt a database field token under the current master key"""
+    token = encrypted_data.encode() if isinstance(encrypted_data, str) else encrypted_data
+    rotated = _fernet(get_master_keys()).rotate(token)
+    return rotated.decode() if isinstance(encrypted_data, str) else rotated
+
+def reset_key_cache():
+    """Forget normalized keys (e.g. after a key change or in a freshly forked worker)"""
+    _key_cache.clear()
+
+def _normalize_master_key(key):
+    """Turn a configured key into a valid Fernet key"""
     # If it's a string, ensure it's base64 encoded with the right length
     if isinstance(key, str):
         try:
@@ -84,6 +150,7 @@ def get_master_key():
         return Fernet.generate_key()
 
 # Encryption for database fields
+@timed('encrypt_db_field')
 def encrypt_db_field(data, master_key=None):
     """Encrypt a database field using Fernet symmetric encryption"""
     if not data:
@@ -96,16 +163,16 @@ def encrypt_db_field(data, master_key=None):
     # Return encrypted data
     return f.encrypt(data.encode()).decode() if isinstance(data, str) else f.encrypt(data)
 
+@timed('decrypt_db_field')
 def decrypt_db_field(encrypted_data, master_key=None):
     """Decrypt a database field encrypted with Fernet"""
     if not encrypted_data:
         print("Warning: Attempt to decrypt None or empty data")
         return None
     
-    # Use provided key or get master key
+    # Use provided key or any of the master keys
     try:
-        key = master_key or get_master_key()
-        f = Fernet(key)
+        f = _fernet(master_key or get_master_keys())
         
         # Return decrypted data
         try:
@@ -156,23 +223,154 @@ def decrypt_db_field(encrypted_data, master_key=None):
         return str(encrypted_data)
 
 # File encryption/decryption
+#
+# Files are stored in a segmented format so they can be decrypted chunk by chunk:
+#   SEGMENT_MAGIC, then per segment a 4-byte big-endian length and a Fernet token.
+# Each token's plaintext starts with the segment index (8 bytes) and a final flag
+# (1 byte), so reordered, duplicated or truncated segments fail to decrypt.
+# Files written before this format (one Fernet token for the whole file) are
+# still decrypted transparently.
+SEGMENT_MAGIC = b'FUSEG1\n'
+SEGMENT_HEADER = struct.Struct('>QB')
+SEGMENT_LENGTH = struct.Struct('>I')
+SEGMENT_SIZE = int(os.environ.get('CRYPTO_SEGMENT_SIZE', 1024 * 1024))
+
+# Segments are independent, so large files are encrypted/decrypted on a worker pool.
+# CRYPTO_PARALLEL_MODE: 'thread', 'process' (sidesteps the GIL) or 'off'.
+CRYPTO_PARALLEL_MODE = os.environ.get('CRYPTO_PARALLEL_MODE', 'thread').lower()
+CRYPTO_WORKERS = int(os.environ.get('CRYPTO_WORKERS', os.cpu_count() or 1))
+CRYPTO_PARALLEL_MIN_SIZE = int(os.environ.get('CRYPTO_PARALLEL_MIN_SIZE', 8 * 1024 * 1024))
+# Segments in flight per file: caps memory at roughly this many segments
+CRYPTO_READ_AHEAD = int(os.environ.get('CRYPTO_READ_AHEAD', 2 * CRYPTO_WORKERS))
+
+_segment_executor = None
+_segment_executor_pid = None
+
+def get_segment_executor():
+    """Return the shared segment worker pool, or None if parallel mode is off"""
+    global _segment_executor, _segment_executor_pid
+    if CRYPTO_PARALLEL_MODE not in ('thread', 'process') or CRYPTO_WORKERS < 2:
+        return None
+    # Pools are not inherited across a fork; each worker process creates its own
+    if _segment_executor is None or _segment_executor_pid != os.getpid():
+        if CRYPTO_PARALLEL_MODE == 'process':
+            _segment_executor = ProcessPoolExecutor(max_workers=CRYPTO_WORKERS)
+        else:
+            _segment_executor = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS, thread_name_prefix='crypto')
+        _segment_executor_pid = os.getpid()
+    return _segment_executor
+
+def shutdown_segment_executor():
+    """Stop the segment worker pool (e.g. before forking or at exit)"""
+    global _segment_executor, _segment_executor_pid
+    if _segment_executor is not None and _segment_executor_pid == os.getpid():
+        _segment_executor.shutdown(wait=False)
+    _segment_executor = None
+    _segment_executor_pid = None
+
+def _map_segments(func, key, items, size):
+    """
+    Apply func(key, *item) to every item and yield the results in order.
+
+    Files smaller than CRYPTO_PARALLEL_MIN_SIZE are processed inline; larger ones
+    on the worker pool with at most CRYPTO_READ_AHEAD segments in flight.
+    """
+    executor = get_segment_executor() if size >= CRYPTO_PARALLEL_MIN_SIZE else None
+    if executor is None:
+        for item in items:
+            yield func(key, *item)
+        return
+
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(func, key, *item))
+            if len(pending) >= CRYPTO_READ_AHEAD:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+def _read_segments(file, segment_size):
+    """Yield (index, is_final, chunk) for a file object, reading one chunk ahead"""
+    index = 0
+    chunk = file.read(segment_size)
+    while True:
+        next_chunk = file.read(segment_size)
+        yield index, not next_chunk, chunk
+        if not next_chunk:
+            return
+        chunk = next_chunk
+        index += 1
+
+def _read_tokens(file):
+    """Yield (index, token) for the segments that follow SEGMENT_MAGIC"""
+    index = 0
+    while True:
+        length_bytes = file.read(SEGMENT_LENGTH.size)
+        if not length_bytes:
+            return
+        if len(length_bytes) < SEGMENT_LENGTH.size:
+            raise InvalidToken("Encrypted file is truncated")
+        yield index, file.read(SEGMENT_LENGTH.unpack(length_bytes)[0])
+        index += 1
+
+# Segment workers take the key rather than a Fernet instance so they can run in another process
+def _encrypt_segment(key, index, is_final, chunk):
+    return _fernet(key).encrypt(SEGMENT_HEADER.pack(index, 1 if is_final else 0) + chunk)
+
+def _decrypt_segment(key, expected_index, token):
+    data = _fernet(key).decrypt(token)
+    index, final_flag = SEGMENT_HEADER.unpack_from(data)
+    if index != expected_index:
+        raise InvalidToken(f"Segment {index} found where {expected_index} was expected")
+    return bool(final_flag), data[SEGMENT_HEADER.size:]
+
+def iter_decrypt_file(encrypted_path, key=None):
+    """
+    Yield the plaintext of an encrypted file chunk by chunk.
+
+    Memory use is bounded by the segments in flight for segmented files; legacy
+    single-token files are decrypted in one piece. Raises InvalidToken if the
+    file was tampered with, truncated or encrypted with a different key.
+    
+    key is the file's data key; without one the master keys are tried.
+    """
+    key = key or get_master_keys()
+    with open(encrypted_path, 'rb') as file:
+        if file.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            file.seek(0)
+            yield _fernet(key).decrypt(file.read())
+            return
+
+        seen_final = False
+        for is_final, chunk in _map_segments(_decrypt_segment, key, _read_tokens(file), os.path.getsize(encrypted_path)):
+            if seen_final:
+                raise InvalidToken("Unexpected data after the final segment")
+            seen_final = is_final
+            yield chunk
+        if not seen_final:
+            raise InvalidToken("Encrypted file is truncated")
+
+@timed('encrypt_file')
 def encrypt_file(file_path, encrypted_path=None, key=None):
     """Encrypt a file with Fernet symmetric encryption"""
     try:
         # Use provided key or get master key
         encryption_key = key or get_master_key()
-        f = Fernet(encryption_key)
         
         # Default output path
         output_path = encrypted_path or f"{file_path}.encrypted"
         
-        with open(file_path, 'rb') as file:
-            file_data = file.read()
-        
-        encrypted_data = f.encrypt(file_data)
-        
-        with open(output_path, 'wb') as file:
-            file.write(encrypted_data)
+        # Stream segment by segment so memory use does not grow with the file size
+        with open(file_path, 'rb') as source, open(output_path, 'wb') as file:
+            file.write(SEGMENT_MAGIC)
+            segments = _read_segments(source, SEGMENT_SIZE)
+            for token in _map_segments(_encrypt_segment, encryption_key, segments, os.path.getsize(file_path)):
+                file.write(SEGMENT_LENGTH.pack(len(token)))
+                file.write(token)
             
         # Verify the file was written
         if not os.path.exists(output_path):
@@ -186,30 +384,26 @@ def encrypt_file(file_path, encrypted_path=None, key=None):
         # This allows the system to continue working even if encryption fails
         return file_path
 
+@timed('decrypt_file')
 def decrypt_file(encrypted_path, output_path=None, key=None):
     """Decrypt a file encrypted with Fernet"""
     try:
-        # Use provided key or get master key
-        encryption_key = key or get_master_key()
-        f = Fernet(encryption_key)
-        
         # Default output path
         if not output_path:
             output_path = encrypted_path.replace('.encrypted', '') if encrypted_path.endswith('.encrypted') else f"{encrypted_path}.decrypted"
         
-        with open(encrypted_path, 'rb') as file:
-            encrypted_data = file.read()
-        
         try:
-            decrypted_data = f.decrypt(encrypted_data)
-            
             with open(output_path, 'wb') as file:
-                file.write(decrypted_data)
+                for chunk in iter_decrypt_file(encrypted_path, key):
+                    file.write(chunk)
                 
             print(f"Successfully decrypted {encrypted_path} to {output_path}")
             return output_path
         except Exception as e:
             print(f"File decryption error: {e}")
+            # Never leave partially decrypted output behind
+            if os.path.exists(output_path) and output_path != encrypted_path:
+                os.remove(output_path)
             
             # If decryption fails, check if we can return the original
             if os.path.exists(encrypted_path) and not encrypted_path.endswith('.encrypted'):
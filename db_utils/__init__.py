@@ -0,0 +1,17 @@
+from .engine import ProfiledSQLAlchemy, TimedQueuePool, engine_profile, sqlite_pragmas, pool_status
+from .migrations import MIGRATIONS, Migration, CreateIndex, AddColumn, upgrade, pending_migrations, current_version
+
+__all__ = [
+    'ProfiledSQLAlchemy',
+    'TimedQueuePool',
+    'engine_profile',
+    'sqlite_pragmas',
+    'pool_status',
+    'MIGRATIONS',
+    'Migration',
+    'CreateIndex',
+    'AddColumn',
+    'upgrade',
+    'pending_migrations',
+    'current_version'
+]
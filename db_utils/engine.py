@@ -0,0 +1,144 @@
+import os
+import time
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from metrics_utils import POOL_CHECKOUT_WAIT, POOL_CHECKOUTS, QUEUE_DEPTH
+
+_pool_waiters = QUEUE_DEPTH.labels('db_pool')
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    return value.lower() == 'true' if value not in (None, '') else default
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a free connection, and how many are waiting"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        _pool_waiters.inc()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            POOL_CHECKOUTS.labels('timeout').inc()
+            raise
+        finally:
+            _pool_waiters.inc(-1)
+        POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+        POOL_CHECKOUTS.labels('ok').inc()
+        return connection
+
+
+def sqlite_pragmas():
+    """PRAGMA statements applied to every new SQLite connection"""
+    return [
+        ('journal_mode', os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')),
+        ('synchronous', os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        ('mmap_size', _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        ('temp_store', 'MEMORY')
+    ]
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def engine_profile(sa_url):
+    """
+    Engine options for a database URL, tuned from the environment.
+
+    SQLite (file): pooled connections with WAL, synchronous=NORMAL, busy_timeout
+    and mmap_size set on connect (SQLITE_POOL_SIZE, SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE).
+
+    PostgreSQL: QueuePool with pre-ping, recycle, overflow and a server-side
+    statement timeout (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE,
+    DB_POOL_TIMEOUT, DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS).
+
+    Args:
+        sa_url: sqlalchemy.engine.URL of the database
+
+    Returns:
+        dict: Keyword arguments for create_engine
+    """
+    if sa_url.drivername.startswith('sqlite'):
+        if sa_url.database in (None, '', ':memory:'):
+            # In-memory databases keep Flask-SQLAlchemy's StaticPool
+            return {}
+        return {
+            'poolclass': TimedQueuePool,
+            'pool_size': _env_int('SQLITE_POOL_SIZE', 5),
+            'max_overflow': _env_int('SQLITE_MAX_OVERFLOW', 10),
+            'connect_args': {
+                'check_same_thread': False,
+                'timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000
+            }
+        }
+
+    if sa_url.drivername.startswith('postgresql'):
+        options = {
+            'poolclass': TimedQueuePool,
+            'pool_size': _env_int('DB_POOL_SIZE', 5),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+            'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+            'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True)
+        }
+        statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+        if statement_timeout:
+            options['connect_args'] = {'options': f"-c statement_timeout={statement_timeout}"}
+        return options
+
+    return {}
+
+
+class ProfiledSQLAlchemy(SQLAlchemy):
+    """
+    SQLAlchemy extension that applies engine_profile() to every engine it creates.
+
+    The profile is chosen from the URL the engine is actually created for, so
+    switching SQLALCHEMY_DATABASE_URI (tests, SQLite fallback) stays consistent.
+    """
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        profile = engine_profile(sa_url)
+        connect_args = dict(profile.pop('connect_args', {}))
+        connect_args.update(options.get('connect_args', {}))
+        for key, value in profile.items():
+            options.setdefault(key, value)
+        if connect_args:
+            options['connect_args'] = connect_args
+        return super().apply_driver_hacks(app, sa_url, options)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        if sa_url.drivername.startswith('sqlite'):
+            event.listen(engine, 'connect', _apply_sqlite_pragmas)
+        return engine
+
+
+def pool_status(engine):
+    """Snapshot of a pool's connection counts"""
+    pool = engine.pool
+    return {
+        'class': type(pool).__name__,
+        'size': pool.size() if hasattr(pool, 'size') else None,
+        'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+        'idle': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+        'overflow': pool.overflow() if hasattr(pool, 'overflow') else None
+    }
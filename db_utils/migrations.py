@@ -0,0 +1,176 @@
+import datetime
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+VERSION_TABLE = 'schema_migrations'
+
+# Arbitrary constant used as the PostgreSQL advisory lock id while migrating
+ADVISORY_LOCK_ID = 7204531
+
+
+class CreateIndex:
+    """
+    Create an index if it does not exist.
+
+    PostgreSQL builds it with CREATE INDEX CONCURRENTLY (outside a transaction)
+    so writes to the table are not blocked while the index is built.
+    """
+
+    def __init__(self, name, table, columns, unique=False):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.unique = unique
+
+    def __str__(self):
+        return f"create index {self.name} on {self.table} ({', '.join(self.columns)})"
+
+    def apply(self, engine):
+        unique = 'UNIQUE ' if self.unique else ''
+        columns = ', '.join(self.columns)
+        if engine.dialect.name == 'postgresql':
+            # A failed concurrent build leaves an INVALID index behind; drop it so the retry can succeed
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                invalid = connection.execute(text(
+                    "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = :name AND NOT i.indisvalid"
+                ), {'name': self.name}).first()
+                if invalid:
+                    connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.name}"))
+                connection.execute(text(
+                    f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {self.name} ON {self.table} ({columns})"
+                ))
+        else:
+            with engine.begin() as connection:
+                connection.execute(text(f"CREATE {unique}INDEX IF NOT EXISTS {self.name} ON {self.table} ({columns})"))
+
+
+class AddColumn:
+    """Add a nullable column (or one with a server default) if it is missing"""
+
+    def __init__(self, table, column, ddl_type, default=None):
+        self.table = table
+        self.column = column
+        self.ddl_type = ddl_type
+        self.default = default
+
+    def __str__(self):
+        return f"add column {self.table}.{self.column}"
+
+    def apply(self, engine):
+        existing = {column['name'] for column in inspect(engine).get_columns(self.table)}
+        if self.column in existing:
+            return
+        ddl_type = self.ddl_type.get(engine.dialect.name, self.ddl_type['default']) if isinstance(self.ddl_type, dict) else self.ddl_type
+        default = f" DEFAULT {self.default}" if self.default is not None else ''
+        with engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE {self.table} ADD COLUMN {self.column} {ddl_type}{default}"))
+
+
+class Migration:
+    """A numbered schema change made of idempotent operations"""
+
+    def __init__(self, version, description, operations=()):
+        self.version = version
+        self.description = description
+        self.operations = list(operations)
+
+
+# Schema history for UploadedFile. Operations must be idempotent: a fresh
+# database already gets the final schema from db.create_all().
+MIGRATIONS = [
+    Migration(1, 'baseline uploaded_file table'),
+    Migration(2, 'index upload_date for listings and retention sweeps', [
+        CreateIndex('ix_uploaded_file_upload_date', 'uploaded_file', ['upload_date'])
+    ]),
+    Migration(3, 'per-file data keys wrapped by the master key', [
+        AddColumn('uploaded_file', 'wrapped_key', {'postgresql': 'BYTEA', 'default': 'BLOB'})
+    ]),
+    Migration(4, 'upload processing status for asynchronous uploads', [
+        AddColumn('uploaded_file', 'status', 'VARCHAR(16) NOT NULL', default="'ready'")
+    ]),
+    # The change_counter table itself is created by create_all()
+    Migration(5, 'change numbers for incremental /api/logs polling', [
+        AddColumn('uploaded_file', 'change_seq', 'INTEGER NOT NULL', default='0'),
+        CreateIndex('ix_uploaded_file_change_seq', 'uploaded_file', ['change_seq'])
+    ]),
+    # The storage_stats table is created by create_all() and filled by the schema bootstrap step
+    Migration(6, 'plaintext size and type of uploads for the storage stats', [
+        AddColumn('uploaded_file', 'file_size', 'BIGINT'),
+        AddColumn('uploaded_file', 'file_type', 'VARCHAR(16)')
+    ]),
+    # Existing rows start 'present'; the storage reconciler checks them against the disk
+    Migration(7, 'stored size, content type, checksum and storage status of uploads', [
+        AddColumn('uploaded_file', 'stored_size', 'BIGINT'),
+        AddColumn('uploaded_file', 'mime_type', 'VARCHAR(100)'),
+        AddColumn('uploaded_file', 'sha256', 'VARCHAR(64)'),
+        AddColumn('uploaded_file', 'storage_status', 'VARCHAR(16) NOT NULL', default="'present'")
+    ])
+]
+
+
+def _ensure_version_table(engine):
+    with engine.begin() as connection:
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+            "version INTEGER PRIMARY KEY, description VARCHAR(255), applied_at TIMESTAMP)"
+        ))
+
+
+def applied_versions(engine):
+    """Return the set of migration versions recorded in the database"""
+    _ensure_version_table(engine)
+    with engine.connect() as connection:
+        return {row[0] for row in connection.execute(text(f"SELECT version FROM {VERSION_TABLE}"))}
+
+
+def pending_migrations(engine, migrations=MIGRATIONS):
+    applied = applied_versions(engine)
+    return [migration for migration in sorted(migrations, key=lambda m: m.version) if migration.version not in applied]
+
+
+def upgrade(engine, migrations=MIGRATIONS):
+    """
+    Apply all pending migrations in version order.
+
+    On PostgreSQL an advisory lock serialises concurrent upgrades from several
+    workers; on SQLite the operations themselves are idempotent.
+
+    Returns:
+        list: Versions that were applied
+    """
+    lock_connection = None
+    if engine.dialect.name == 'postgresql':
+        lock_connection = engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        lock_connection.execute(text("SELECT pg_advisory_lock(:id)"), {'id': ADVISORY_LOCK_ID})
+
+    applied = []
+    try:
+        for migration in pending_migrations(engine, migrations):
+            logger.info(f"Applying migration {migration.version}: {migration.description}")
+            for operation in migration.operations:
+                logger.info(f"Migration {migration.version}: {operation}")
+                operation.apply(engine)
+            try:
+                with engine.begin() as connection:
+                    connection.execute(
+                        text(f"INSERT INTO {VERSION_TABLE} (version, description, applied_at) VALUES (:version, :description, :applied_at)"),
+                        {'version': migration.version, 'description': migration.description, 'applied_at': datetime.datetime.utcnow()}
+                    )
+            except IntegrityError:
+                # Another worker recorded it first
+                continue
+            applied.append(migration.version)
+    finally:
+        if lock_connection is not None:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': ADVISORY_LOCK_ID})
+            lock_connection.close()
+    return applied
+
+
+def current_version(engine):
+    versions = applied_versions(engine)
+    return max(versions) if versions else 0
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+
+from metrics_utils import EVENT_SUBSCRIBERS, EVENTS_PUBLISHED, EVENTS_DROPPED
+
+logger = logging.getLogger(__name__)
+
+# Sent instead of the missed events when a subscriber fell behind or resumed from an unknown id;
+# the client reloads /api/logs and continues from the stream
+RESYNC = {'id': None, 'type': 'resync', 'data': {}}
+
+
+class Subscription:
+    """
+    Bounded queue of events for one subscriber.
+
+    The publisher never blocks: when the queue is full, the queued events are
+    dropped and replaced by a single resync event, so a slow consumer costs
+    at most max_queue + 1 events of memory.
+    """
+
+    def __init__(self, bus, max_queue):
+        self.bus = bus
+        self.max_queue = max_queue
+        self._events = deque()
+        self._condition = threading.Condition()
+        self.closed = False
+
+    def put(self, event):
+        with self._condition:
+            if len(self._events) >= self.max_queue:
+                self._events.clear()
+                self._events.append(RESYNC)
+                EVENTS_DROPPED.inc()
+            self._events.append(event)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Next event, or None after timeout seconds without one"""
+        with self._condition:
+            if not self._events:
+                self._condition.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """
+    In-process fan-out of activity events to subscribers.
+
+    Events reach the bus through a backend (see create_backend), which
+    assigns their ids; the last replay_size events are kept so a reconnecting
+    client can resume from its Last-Event-ID.
+    """
+
+    def __init__(self, backend=None, max_queue=256, replay_size=1000, max_subscribers=100):
+        self.backend = backend or MemoryBackend()
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._recent = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, kind, **data):
+        """Publish an event to subscribers in every process sharing the backend"""
+        EVENTS_PUBLISHED.labels(kind).inc()
+        self.backend.publish(kind, data, self.deliver)
+
+    def deliver(self, event):
+        """Called by the backend with an event that has its id"""
+        with self._lock:
+            self._recent.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscribe(self, last_event_id=None):
+        """
+        Register a subscriber.
+
+        Args:
+            last_event_id: Id of the last event the client saw; later events still
+                in the replay buffer are queued first, otherwise a resync event
+
+        Returns:
+            Subscription: Or None when max_subscribers are already connected
+        """
+        self.backend.start(self.deliver)
+        subscription = Subscription(self, self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if last_event_id is not None:
+                if self._recent and self._recent[0]['id'] <= last_event_id + 1:
+                    for event in self._recent:
+                        if event['id'] > last_event_id:
+                            subscription.put(event)
+                else:
+                    # Events after last_event_id may have been missed
+                    subscription.put(RESYNC)
+            self._subscribers.add(subscription)
+        EVENT_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+                EVENT_SUBSCRIBERS.dec()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+class MemoryBackend:
+    """Events stay in this process; for a single worker, tests and development"""
+
+    def __init__(self):
+        # Ids start from the clock, so a client resuming across a restart gets a resync, not a gap
+        self._next_id = int(time.time() * 1000)
+        self._lock = threading.Lock()
+
+    def start(self, deliver):
+        pass
+
+    def publish(self, kind, data, deliver):
+        # Delivered under the lock so events reach the bus in id order
+        with self._lock:
+            self._next_id += 1
+            deliver({'id': self._next_id, 'type': kind, 'data': data})
+
+
+class SQLiteBackend:
+    """
+    Events shared by every process on a node through a SQLite file.
+
+    Stands in for a pub/sub service (e.g. Redis) in multi-worker deployments:
+    publish() appends a row, and one thread per process polls for new rows and
+    hands them to the local bus. A networked backend only needs the same two
+    methods, start(deliver) and publish(kind, data, deliver).
+    """
+
+    def __init__(self, path, poll_interval=0.25, retention=3600):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        self._pid = None
+        self._lock = threading.Lock()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, kind TEXT NOT NULL, data TEXT NOT NULL)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        # Connections must not be shared with a forked parent
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def start(self, deliver):
+        """Start this process's polling thread, once"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            with self._connection() as connection:
+                # Subscribers only get events published from now on
+                last_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+            threading.Thread(target=self._poll, args=(deliver, last_id), name='event-poller', daemon=True).start()
+            self._pid = os.getpid()
+
+    def publish(self, kind, data, deliver):
+        now = time.time()
+        with self._connection() as connection:
+            cursor = connection.execute("INSERT INTO events (created, kind, data) VALUES (?, ?, ?)", (now, kind, json.dumps(data)))
+            if cursor.lastrowid % 100 == 0:
+                connection.execute("DELETE FROM events WHERE created < ?", (now - self.retention,))
+
+    def _poll(self, deliver, last_id):
+        while True:
+            rows = []
+            try:
+                with self._connection() as connection:
+                    rows = connection.execute("SELECT id, kind, data FROM events WHERE id > ? ORDER BY id LIMIT 500", (last_id,)).fetchall()
+                for event_id, kind, data in rows:
+                    last_id = event_id
+                    deliver({'id': event_id, 'type': kind, 'data': json.loads(data)})
+            except Exception as e:
+                logger.error(f"Event poller error: {str(e)}")
+            if not rows:
+                time.sleep(self.poll_interval)
+
+
+def create_backend(spec):
+    """Backend from a spec: 'memory' or 'sqlite:///path/to/events.db'"""
+    if not spec or spec == 'memory':
+        return MemoryBackend()
+    if spec.startswith('sqlite:///'):
+        path = spec[len('sqlite:///'):]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQLiteBackend(path)
+    raise ValueError(f"Unknown event backend: {spec}")
+
+
+def format_sse(event):
+    """Encode an event in the text/event-stream format"""
+    lines = []
+    if event['id'] is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event['data'])}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def init_app(app):
+    """
+    Attach an EventBus configured from EVENTS_* environment variables.
+
+    Defaults follow the gunicorn settings (GUNICORN_WORKERS, GUNICORN_THREADS,
+    GUNICORN_WORKER_CLASS, exported by gunicorn.conf.py): with several
+    workers events go through a SQLite file in the working directory, and a
+    gthread worker admits streams on half of its threads only, since every
+    open stream holds one. A sync worker has a single thread, which a stream
+    would hold for EVENTS_MAX_AGE, so there streams are refused (503)
+    rather than taking the worker out of service.
+
+    Args:
+        app: Flask application instance
+
+    Returns:
+        EventBus: The bus, also stored in app.extensions['events']
+    """
+    app.config.setdefault('EVENTS_HEARTBEAT', float(os.environ.get('EVENTS_HEARTBEAT', 15)))
+    app.config.setdefault('EVENTS_MAX_AGE', float(os.environ.get('EVENTS_MAX_AGE', 300)))
+    workers = int(os.environ.get('GUNICORN_WORKERS') or 1)
+    threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+    default_backend = f"sqlite:///{os.path.abspath('events.db')}" if workers > 1 else 'memory'
+    worker_class = os.environ.get('GUNICORN_WORKER_CLASS')
+    if worker_class == 'gevent':
+        default_subscribers = 100
+    elif worker_class == 'sync':
+        default_subscribers = 0
+    else:
+        default_subscribers = max(1, threads // 2)
+    bus = EventBus(
+        backend=create_backend(os.environ.get('EVENTS_BACKEND', default_backend)),
+        max_queue=int(os.environ.get('EVENTS_QUEUE_SIZE', 256)),
+        max_subscribers=int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', default_subscribers))
+    )
+    app.extensions['events'] = bus
+    return bus
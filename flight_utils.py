@@ -0,0 +1,139 @@
+import os
+import tempfile
+import threading
+
+CHUNK_SIZE = 64 * 1024
+
+
+class SharedBuffer:
+    """
+    Decrypted content in a private temporary file, read by several responses at their own offsets.
+
+    The file comes from mkstemp, so concurrent downloads never share a path,
+    and it is unlinked as soon as it is written: nothing is left behind, not
+    even after a crash. Readers use pread on the one descriptor, which is
+    closed when the last of them is released.
+    """
+
+    def __init__(self, directory=None):
+        fd, self.path = tempfile.mkstemp(prefix='decrypted_', dir=directory)
+        self.fd = fd
+        self.size = 0
+        self._users = 1
+        self._lock = threading.Lock()
+
+    def seal(self):
+        """Unlink the written file; from now on it is only reachable through the descriptor"""
+        os.unlink(self.path)
+        self.size = os.fstat(self.fd).st_size
+
+    def discard(self):
+        """Drop a buffer that will not be shared, e.g. after a failed write"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.release()
+
+    def retain(self, count=1):
+        with self._lock:
+            self._users += count
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            last = self._users == 0
+        if last:
+            os.close(self.fd)
+
+    def reader(self, chunk_size=CHUNK_SIZE):
+        """A response body over the whole buffer; closing it releases this user's reference"""
+        return BufferReader(self, chunk_size)
+
+
+class BufferReader:
+    """Iterates a SharedBuffer from its start; close() is called by the WSGI server even if it was never iterated"""
+
+    def __init__(self, buffer, chunk_size):
+        self.buffer = buffer
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed or self.offset >= self.buffer.size:
+            raise StopIteration
+        chunk = os.pread(self.buffer.fd, min(self.chunk_size, self.buffer.size - self.offset), self.offset)
+        if not chunk:
+            raise StopIteration
+        self.offset += len(chunk)
+        return chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.buffer.release()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.callers = 1
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent work on the same key into one execution.
+
+    The first caller runs the function; callers arriving while it runs wait
+    for it and get the same result, or the same exception. Results are
+    SharedBuffers (or None): the buffer is retained once per caller, and each
+    caller releases its reference, normally by closing its reader.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, func):
+        """
+        Run func() once for all concurrent callers with key.
+
+        Returns:
+            tuple: (SharedBuffer or None, True if the result came from another caller's flight)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.callers += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                # Nobody can join once the flight is gone, so callers is final here
+                del self._flights[key]
+                if flight.result is not None and flight.callers > 1:
+                    flight.result.retain(flight.callers - 1)
+            flight.done.set()
+        return flight.result, False
+
+    def in_flight(self):
+        """Number of keys currently being worked on"""
+        return len(self._flights)
@@ -0,0 +1,105 @@
+"""
+Production gunicorn settings.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Every setting can be overridden from the environment (GUNICORN_*) or on the
+command line. The app is preloaded: bootstrap (schema, cleanup, warmup) runs
+once in the master, and workers are forked from the warmed-up process.
+"""
+import os
+import glob
+import tempfile
+import multiprocessing
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+cores = multiprocessing.cpu_count()
+
+# Workers share their metrics through this directory, so any of them can answer a scrape
+# for the whole pool; read by the app, which is loaded after this file
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f"fileupload-metrics-{os.getpid()}"))
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# sync, gthread or gevent (needs the gevent package)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# gthread workers serve several requests each, so fewer processes are needed
+workers = _env_int('GUNICORN_WORKERS', cores + 1 if worker_class == 'gthread' else 2 * cores + 1)
+# More than one thread turns sync workers into gthread ones
+threads = _env_int('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1)
+worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 1000)
+
+# Large uploads are encrypted inside the request, so allow more than the 30s default
+timeout = _env_int('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# Recycle workers periodically; the jitter keeps them from restarting at the same time
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    import sys
+
+    # The app sizes per-worker limits and shares state between workers from these; taken from
+    # server.cfg, which (unlike the values above) includes command-line overrides
+    cfg = server.cfg
+    os.environ['GUNICORN_WORKERS'] = str(cfg.workers)
+    os.environ['GUNICORN_THREADS'] = str(cfg.threads)
+    os.environ['GUNICORN_WORKER_CLASS'] = cfg.worker_class_str
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        # Preloaded before this hook ran, with the defaults of a single worker
+        app_module.configure_worker_layout(app_module.app)
+
+    # Snapshots left by a previous run would be merged into /metrics
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, 'metrics_*.json')):
+            os.remove(path)
+
+
+def when_ready(server):
+    from metrics_utils import REGISTRY
+
+    # Publish the master's bootstrap timings (with METRICS_DIR) before workers reset their copies
+    REGISTRY.flush()
+    cfg = server.cfg
+    server.log.info(f"Serving with {cfg.workers} {cfg.worker_class_str} workers ({cfg.threads} threads), preload={cfg.preload_app}")
+
+
+def post_fork(server, worker):
+    """Drop state inherited from the master that must not be shared between processes"""
+    import sys
+    from metrics_utils import REGISTRY
+    import crypto_utils
+
+    REGISTRY.reset_after_fork()
+    crypto_utils.reset_key_cache()
+    crypto_utils.shutdown_segment_executor()
+
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        # Pooled connections opened by bootstrap belong to the master; open fresh ones in this worker
+        with app_module.app.app_context():
+            app_module.db.engine.dispose(close=False)
+    server.log.info(f"Worker {worker.pid} reset inherited pools and caches")
+
+
+def worker_exit(server, worker):
+    from metrics_utils import REGISTRY
+
+    REGISTRY.flush()
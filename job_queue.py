@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from metrics_utils import JOBS
+
+logger = logging.getLogger(__name__)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT around a block, so claiming a job is atomic across processes"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class JobQueue:
+    """
+    Durable FIFO of jobs in a SQLite file, shared by every process on the node.
+
+    A claimed job is leased to its worker; if the worker dies, the job is
+    claimed again once the lease expires. Failed jobs are retried with
+    exponential backoff. Finished jobs are deleted, failed ones are kept for
+    inspection.
+    """
+
+    def __init__(self, path, lease_seconds=300, retry_delay=2.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, run_after REAL NOT NULL, "
+                "lease_until REAL, last_error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_run_after ON jobs (status, run_after)")
+
+    def _transaction(self):
+        connection = getattr(self._local, 'connection', None)
+        # Connections must not be shared with a forked parent
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Jobs are the only record of work still to do, so keep them durable
+            connection.execute("PRAGMA synchronous=FULL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return _Transaction(connection)
+
+    def enqueue(self, kind, payload, delay=0, unique=False):
+        """
+        Store a job; returns its id once it is on disk.
+
+        Args:
+            kind: Job kind
+            payload: JSON-serialisable job data
+            delay: Seconds before the job may run
+            unique: Skip (and return None) if a job of this kind is already queued or running
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            if unique and connection.execute(
+                "SELECT 1 FROM jobs WHERE kind = ? AND status IN ('queued', 'running') LIMIT 1", (kind,)
+            ).fetchone():
+                return None
+            cursor = connection.execute(
+                "INSERT INTO jobs (kind, payload, status, run_after, created, updated) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (kind, json.dumps(payload), now + delay, now, now)
+            )
+            return cursor.lastrowid
+
+    def claim(self):
+        """Lease the oldest runnable job; returns (id, kind, payload, attempts) or None"""
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT id, kind, payload, attempts FROM jobs "
+                "WHERE (status = 'queued' AND run_after <= ?) OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, kind, payload, attempts = row
+            connection.execute(
+                "UPDATE jobs SET status = 'running', attempts = ?, lease_until = ?, updated = ? WHERE id = ?",
+                (attempts + 1, now + self.lease_seconds, now, job_id)
+            )
+        return job_id, kind, json.loads(payload), attempts + 1
+
+    def complete(self, job_id):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def retry(self, job_id, attempts, error):
+        """Put a failed job back, delayed by retry_delay * 2^(attempts - 1)"""
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'queued', run_after = ?, lease_until = NULL, last_error = ?, updated = ? WHERE id = ?",
+                (now + self.retry_delay * 2 ** (attempts - 1), error, now, job_id)
+            )
+
+    def fail(self, job_id, error):
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', lease_until = NULL, last_error = ?, updated = ? WHERE id = ?",
+                (error, time.time(), job_id)
+            )
+
+    def counts(self):
+        """Number of jobs per status"""
+        with self._transaction() as connection:
+            return dict(connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class JobRunner:
+    """
+    Worker threads that run queued jobs inside the application context.
+
+    Handlers are registered per job kind. Threads are started lazily in each
+    process (never inherited across a fork) and also poll the queue, so jobs
+    enqueued by other processes or left over from a restart are picked up.
+    """
+
+    def __init__(self, app, workers=2, max_attempts=3, poll_interval=1.0):
+        self.app = app
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self.periodic = {}
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def queue(self):
+        if self._queue is None:
+            self._queue = JobQueue(self.app.config['JOB_QUEUE_PATH'],
+                                   lease_seconds=self.app.config['JOB_LEASE_SECONDS'],
+                                   retry_delay=self.app.config['JOB_RETRY_DELAY'])
+        return self._queue
+
+    def register(self, kind, handler, on_give_up=None):
+        """
+        Register the handler for a job kind.
+
+        Args:
+            kind: Job kind
+            handler: Called with the job payload; an exception means the job failed
+            on_give_up: Optional, called with the payload and the error once all attempts failed
+        """
+        self.handlers[kind] = (handler, on_give_up)
+
+    def schedule(self, kind, interval):
+        """
+        Run a registered job kind every interval seconds.
+
+        One job of the kind is kept queued per node, not per process: each run
+        queues the next one, and starting workers queues the first if none is.
+        """
+        if interval > 0:
+            self.periodic[kind] = interval
+
+    def _schedule_next(self, kind):
+        try:
+            self.queue.enqueue(kind, {}, delay=self.periodic[kind], unique=True)
+        except Exception as e:
+            logger.error(f"Could not schedule periodic job {kind}: {str(e)}")
+
+    def enqueue(self, kind, payload):
+        """Store a job durably and wake a worker"""
+        job_id = self.queue.enqueue(kind, payload)
+        self.ensure_started()
+        self._wakeup.set()
+        return job_id
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"job-worker-{index}", daemon=True)
+                for index in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+        for kind in self.periodic:
+            self._schedule_next(kind)
+
+    def shutdown(self, timeout=5):
+        """Stop the worker threads; jobs being run finish, the rest stay queued"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pid = None
+        self._queue = None
+
+    def run_pending(self):
+        """Run queued jobs in the calling thread until none is runnable; returns how many ran"""
+        count = 0
+        while self._run_one():
+            count += 1
+        return count
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                ran = self._run_one()
+            except Exception as e:
+                logger.error(f"Job worker error: {str(e)}")
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _run_one(self):
+        job = self.queue.claim()
+        if job is None:
+            return False
+        job_id, kind, payload, attempts = job
+        try:
+            self._execute(job_id, kind, payload, attempts)
+        finally:
+            # A retried job is still queued, so this only queues the next run once the job is done
+            if kind in self.periodic:
+                self._schedule_next(kind)
+        return True
+
+    def _execute(self, job_id, kind, payload, attempts):
+        handler, on_give_up = self.handlers.get(kind, (None, None))
+        with self.app.app_context():
+            try:
+                if handler is None:
+                    raise LookupError(f"No handler for job kind {kind}")
+                if attempts > self.max_attempts:
+                    # Claimed again after its lease expired too often, e.g. it keeps killing the worker
+                    raise RuntimeError("lease expired")
+                handler(payload)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if handler is not None and attempts < self.max_attempts:
+                    logger.warning(f"Job {job_id} ({kind}) failed, attempt {attempts} of {self.max_attempts}: {error}")
+                    self.queue.retry(job_id, attempts, error)
+                    return
+                logger.error(f"Job {job_id} ({kind}) failed permanently: {error}")
+                self.queue.fail(job_id, error)
+                if on_give_up is not None:
+                    try:
+                        on_give_up(payload, error)
+                    except Exception as give_up_error:
+                        logger.error(f"Job {job_id} ({kind}) cleanup failed: {str(give_up_error)}")
+                return
+        self.queue.complete(job_id)
+
+
+def init_app(app):
+    """
+    Attach a JobRunner configured from JOB_* environment variables.
+
+    Args:
+        app: Flask application instance
+
+    Returns:
+        JobRunner: The runner, also stored in app.extensions['jobs']
+    """
+    app.config.setdefault('JOB_QUEUE_PATH', os.environ.get('JOB_QUEUE_PATH', os.path.join(os.getcwd(), 'jobs.db')))
+    app.config.setdefault('JOB_LEASE_SECONDS', float(os.environ.get('JOB_LEASE_SECONDS', 300)))
+    app.config.setdefault('JOB_RETRY_DELAY', float(os.environ.get('JOB_RETRY_DELAY', 2)))
+    runner = JobRunner(
+        app,
+        workers=int(os.environ.get('JOB_WORKERS', 2)),
+        max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    )
+    app.extensions['jobs'] = runner
+
+    def job_count(status):
+        return lambda: runner.queue.counts().get(status, 0)
+
+    for status in ('queued', 'running', 'failed'):
+        JOBS.set_function(job_count(status), status)
+    return runner
@@ -0,0 +1,81 @@
+import os
+import functools
+
+from .registry import Registry, Counter, Gauge, Histogram, DEFAULT_BUCKETS
+from .exposition import generate_latest, CONTENT_TYPE_LATEST
+
+# Shared registry; set METRICS_DIR to aggregate across gunicorn workers
+REGISTRY = Registry(
+    directory=os.environ.get('METRICS_DIR') or None,
+    flush_interval=float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route',
+    ['method', 'route', 'status'], registry=REGISTRY
+)
+UPLOAD_BYTES = Counter('file_upload_bytes', 'Bytes received in file uploads', registry=REGISTRY)
+DOWNLOAD_BYTES = Counter('file_download_bytes', 'Bytes sent in file downloads', registry=REGISTRY)
+STAGE_SECONDS = Histogram(
+    'stage_duration_seconds', 'Time spent in internal processing stages (encrypt, decrypt, bcrypt, db commit)',
+    ['stage'], registry=REGISTRY
+)
+CACHE_REQUESTS = Counter('cache_requests', 'Cache lookups by cache and result', ['cache', 'result'], registry=REGISTRY)
+QUEUE_DEPTH = Gauge('queue_depth', 'Items waiting in internal queues', ['queue'], registry=REGISTRY)
+JOBS = Gauge('jobs', 'Jobs in the node\'s durable job queue by status', ['status'], registry=REGISTRY, aggregate='max')
+POOL_CONNECTIONS = Gauge('db_pool_connections', 'Database pool connections by state', ['state'], registry=REGISTRY)
+POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled database connection',
+    registry=REGISTRY, buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, float('inf'))
+)
+ADMISSION_DECISIONS = Counter('admission_decisions', 'Password attempt admission decisions by result', ['result'], registry=REGISTRY)
+BOOTSTRAP_SECONDS = Gauge('bootstrap_seconds', 'Duration of the last application startup phase', ['phase'], registry=REGISTRY)
+POOL_CHECKOUTS = Counter('db_pool_checkouts', 'Database pool checkouts by result', ['result'], registry=REGISTRY)
+EVENT_SUBSCRIBERS = Gauge('event_subscribers', 'Connected server-sent event subscribers', registry=REGISTRY)
+EVENTS_PUBLISHED = Counter('events_published', 'Activity events published by kind', ['kind'], registry=REGISTRY)
+EVENTS_DROPPED = Counter('events_dropped', 'Subscriber queue overflows replaced by a resync event', registry=REGISTRY)
+DECRYPTS_COALESCED = Counter('decrypts_coalesced', 'Downloads served by a decryption already in progress for another download', registry=REGISTRY)
+TRANSFER_ADMISSIONS = Counter('transfer_admissions', 'Upload and download admissions by size class and result', ['transfer_class', 'result'], registry=REGISTRY)
+
+
+def timed(stage):
+    """Decorator recording the wrapped function's duration under STAGE_SECONDS{stage=...}"""
+    def decorator(func):
+        child = STAGE_SECONDS.labels(stage)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with child.time():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+__all__ = [
+    'Registry',
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'DEFAULT_BUCKETS',
+    'generate_latest',
+    'CONTENT_TYPE_LATEST',
+    'REGISTRY',
+    'REQUEST_LATENCY',
+    'UPLOAD_BYTES',
+    'DOWNLOAD_BYTES',
+    'STAGE_SECONDS',
+    'CACHE_REQUESTS',
+    'QUEUE_DEPTH',
+    'JOBS',
+    'BOOTSTRAP_SECONDS',
+    'ADMISSION_DECISIONS',
+    'POOL_CONNECTIONS',
+    'POOL_CHECKOUT_WAIT',
+    'POOL_CHECKOUTS',
+    'EVENT_SUBSCRIBERS',
+    'EVENTS_PUBLISHED',
+    'EVENTS_DROPPED',
+    'DECRYPTS_COALESCED',
+    'TRANSFER_ADMISSIONS',
+    'timed'
+]
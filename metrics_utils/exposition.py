@@ -0,0 +1,45 @@
+CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def generate_latest(registry):
+    """Render all metrics of a registry in the Prometheus text exposition format"""
+    lines = []
+    for metric, values in registry.collect():
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+
+        for key, value in sorted(values.items()):
+            if metric.kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value['buckets']):
+                    cumulative += count
+                    labels = _format_labels(metric.labelnames, key, ('le', _format_value(bound)))
+                    lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(metric.labelnames, key)
+                lines.append(f"{metric.name}_sum{labels} {_format_value(value['sum'])}")
+                lines.append(f"{metric.name}_count{labels} {value['count']}")
+            else:
+                suffix = '_total' if metric.kind == 'counter' and not metric.name.endswith('_total') else ''
+                labels = _format_labels(metric.labelnames, key)
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+
+    return '\n'.join(lines) + '\n'
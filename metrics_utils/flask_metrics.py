@@ -0,0 +1,59 @@
+import time
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import REGISTRY, REQUEST_LATENCY, STAGE_SECONDS, POOL_CONNECTIONS
+
+
+_commit_timer = STAGE_SECONDS.labels('db_commit')
+
+
+def _start_commit_timer(session):
+    session.info['metrics_commit_start'] = time.perf_counter()
+
+
+def _observe_commit(session):
+    start = session.info.pop('metrics_commit_start', None)
+    if start is not None:
+        _commit_timer.observe(time.perf_counter() - start)
+
+
+def init_app(app, db=None):
+    """
+    Install request timing, DB commit timing and pool gauges on a Flask app.
+
+    Args:
+        app: Flask application instance
+        db: Optional Flask-SQLAlchemy instance whose pool is reported
+    """
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(time.perf_counter() - start)
+        REGISTRY.maybe_flush()
+        return response
+
+    # Session events are global, so several apps in one process share the listeners
+    if not event.contains(Session, 'before_commit', _start_commit_timer):
+        event.listen(Session, 'before_commit', _start_commit_timer)
+        event.listen(Session, 'after_commit', _observe_commit)
+        event.listen(Session, 'after_rollback', _observe_commit)
+
+    if db is not None:
+        def pool_stat(name):
+            def read():
+                with app.app_context():
+                    pool = db.engine.pool
+                    return getattr(pool, name)() if hasattr(pool, name) else 0
+            return read
+
+        POOL_CONNECTIONS.set_function(pool_stat('checkedout'), 'checked_out')
+        POOL_CONNECTIONS.set_function(pool_stat('checkedin'), 'idle')
+        POOL_CONNECTIONS.set_function(pool_stat('overflow'), 'overflow')
@@ -0,0 +1,348 @@
+import os
+import json
+import time
+import glob
+import fcntl
+import atexit
+import threading
+from contextlib import contextmanager
+
+# Counters and histograms of exited processes, folded together
+RETIRED_SNAPSHOT = 'metrics_retired.json'
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+
+class _Metric:
+    """Base class for a labelled metric family"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labelvalues, labelkwargs):
+        if labelkwargs:
+            labelvalues = tuple(labelkwargs[name] for name in self.labelnames)
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(value) for value in labelvalues)
+
+    def labels(self, *labelvalues, **labelkwargs):
+        """Return a child bound to the given label values"""
+        return _Child(self, self._key(labelvalues, labelkwargs))
+
+    def snapshot(self):
+        """Return a JSON-serialisable copy of the current values"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class _Child:
+    """A metric bound to one set of label values"""
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount=1):
+        self._metric._inc(self._key, amount)
+
+    def set(self, value):
+        self._metric._set(self._key, value)
+
+    def observe(self, value):
+        self._metric._observe(self._key, value)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._metric._observe(self._key, time.perf_counter() - start)
+
+
+class Counter(_Metric):
+    """Monotonically increasing value, summed across processes"""
+
+    kind = 'counter'
+
+    def _inc(self, key, amount):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def inc(self, amount=1):
+        self._inc((), amount)
+
+
+class Gauge(_Metric):
+    """
+    Point-in-time value, summed across live processes.
+
+    aggregate='max' is for state every process reads from the same place
+    (e.g. the node's job queue file), which summing would count once per worker.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, aggregate='sum'):
+        super().__init__(name, documentation, labelnames, registry)
+        self.aggregate = aggregate
+        self._callbacks = []
+
+    def _inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1):
+        self._inc((), amount)
+
+    def dec(self, amount=1):
+        self._inc((), -amount)
+
+    def set(self, value):
+        self._set((), value)
+
+    def set_function(self, func, *labelvalues):
+        """Evaluate func whenever the gauge is collected (e.g. pool or queue depth)"""
+        self._callbacks.append((tuple(str(value) for value in labelvalues), func))
+
+    def snapshot(self):
+        for key, func in self._callbacks:
+            try:
+                self._set(key, func())
+            except Exception:
+                # A failing callback must never break a scrape
+                continue
+        return super().snapshot()
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets, merged across processes"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def _observe(self, key, value):
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._values[key] = state
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def observe(self, value):
+        self._observe((), value)
+
+    def time(self):
+        return _Child(self, ()).time()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), {'buckets': list(state['buckets']), 'sum': state['sum'], 'count': state['count']}]
+                    for key, state in self._values.items()]
+
+
+class Registry:
+    """
+    Collection of metrics with optional multi-process aggregation.
+
+    When a directory is configured (METRICS_DIR), every process periodically
+    writes a snapshot of its own values to metrics_<pid>.json. Collecting merges
+    all snapshots so any gunicorn worker can answer a scrape for the whole pool;
+    snapshots of exited processes are folded into one retired snapshot. The
+    directory should be emptied when the master process starts.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.directory, f"metrics_{pid or os.getpid()}.json")
+
+    def flush(self, force=True):
+        """Write this process's values to the shared directory"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        with self._flush_lock:
+            self._last_flush = now
+            data = {name: metric.snapshot() for name, metric in self._metrics.items()}
+            path = self._snapshot_path()
+            temp_path = f"{path}.tmp"
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(temp_path, path)
+            except OSError:
+                pass
+
+    def maybe_flush(self):
+        """Flush if the flush interval has passed; cheap enough to call per request"""
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush(force=False)
+
+    def reset_after_fork(self):
+        """Drop values inherited from the parent so the child only reports its own work"""
+        for metric in self._metrics.values():
+            with metric._lock:
+                metric._values.clear()
+        self._last_flush = 0.0
+
+    @contextmanager
+    def _directory_lock(self, mode):
+        """flock on the directory's lock file: shared to read snapshots, exclusive to retire them"""
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _snapshot_paths(self):
+        """(pid, path) of every process snapshot in the directory"""
+        paths = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            try:
+                paths.append((int(os.path.basename(path)[len('metrics_'):-len('.json')]), path))
+            except ValueError:
+                continue
+        return paths
+
+    def _retire_dead(self):
+        """
+        Fold the snapshots of exited processes into metrics_retired.json and delete them.
+
+        Their counters and histograms still count towards the totals; their
+        gauges are dropped. Without this, recycled workers (max_requests)
+        would leave one file each behind for every later scrape to read.
+        """
+        if not any(not self._pid_alive(pid) for pid, _path in self._snapshot_paths()):
+            return
+        with self._directory_lock(fcntl.LOCK_EX):
+            # Another process may have retired them while we waited for the lock
+            dead = [path for pid, path in self._snapshot_paths() if not self._pid_alive(pid)]
+            if not dead:
+                return
+            retired_path = os.path.join(self.directory, RETIRED_SNAPSHOT)
+            retired = {}
+            for path in [retired_path] + dead:
+                try:
+                    with open(path) as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                for name, metric in self._metrics.items():
+                    if metric.kind == 'gauge':
+                        continue
+                    values = retired.setdefault(name, {})
+                    for key, value in data.get(name, []):
+                        self._merge_value(metric, values, tuple(key), value)
+            temp_path = f"{retired_path}.tmp"
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump({name: [[list(key), value] for key, value in values.items()]
+                               for name, values in retired.items()}, f)
+                os.replace(temp_path, retired_path)
+                for path in dead:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _read_snapshots(self):
+        if not self.directory:
+            return []
+        self._retire_dead()
+        snapshots = []
+        own_path = self._snapshot_path()
+        with self._directory_lock(fcntl.LOCK_SH):
+            paths = self._snapshot_paths() + [(None, os.path.join(self.directory, RETIRED_SNAPSHOT))]
+            for pid, path in paths:
+                if path == own_path:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append((pid, json.load(f)))
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+    @staticmethod
+    def _pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def collect(self):
+        """Return merged (metric, {labels: value}) pairs for all processes"""
+        sources = [(os.getpid(), {name: metric.snapshot() for name, metric in self._metrics.items()})]
+        sources.extend(self._read_snapshots())
+
+        merged = []
+        for name, metric in self._metrics.items():
+            values = {}
+            for pid, data in sources:
+                # Gauges describe live state, so values of exited workers are ignored
+                if metric.kind == 'gauge' and pid != os.getpid() and (pid is None or not self._pid_alive(pid)):
+                    continue
+                for key, value in data.get(name, []):
+                    self._merge_value(metric, values, tuple(key), value)
+            merged.append((metric, values))
+        return merged
+
+    @staticmethod
+    def _merge_value(metric, values, key, value):
+        if metric.kind == 'histogram':
+            current = values.setdefault(key, {'buckets': [0] * len(metric.buckets), 'sum': 0.0, 'count': 0})
+            for index, count in enumerate(value['buckets']):
+                current['buckets'][index] += count
+            current['sum'] += value['sum']
+            current['count'] += value['count']
+        elif metric.kind == 'gauge' and metric.aggregate == 'max':
+            values[key] = max(values.get(key, value), value)
+        else:
+            values[key] = values.get(key, 0) + value
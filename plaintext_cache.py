@@ -0,0 +1,235 @@
+import os
+import time
+import uuid
+import fcntl
+import logging
+import threading
+
+from metrics_utils import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+ENTRY_SUFFIX = '.plain'
+# Striped locks serialising fills of the same key within a process
+FILL_LOCKS = 64
+WIPE_CHUNK = 1024 * 1024
+# Seconds without a hit after which an entry's popularity counts half
+IDLE_HALF_SCORE = 60
+
+
+class PlaintextCache:
+    """
+    Decrypted copies of hot files, shared by every process on the node through a directory.
+
+    Meant for a tmpfs or another local directory that only the application can
+    read. The directory is the index, so there is nothing to keep in sync
+    between workers: an entry is <key>.plain, its mtime is when it was
+    decrypted (for the TTL) and its atime the last hit.
+
+    When the byte budget is exceeded, the entries with the lowest popularity
+    (download_count discounted by the time since their last hit) are evicted.
+    Evicted and expired entries are moved to trash/ and overwritten with zeros
+    before they are unlinked; readers hold a shared flock while streaming, so
+    an entry is only wiped once nobody is sending it.
+    """
+
+    def __init__(self, directory, max_bytes, ttl=600, min_downloads=2, popularity=None):
+        """
+        Args:
+            directory: Cache directory, created with mode 0700
+            max_bytes: Budget for all entries together
+            ttl: Seconds an entry is served after it was decrypted
+            min_downloads: download_count a file needs before it is cached
+            popularity: Callable mapping a list of keys to {key: download_count}
+        """
+        self.directory = directory
+        self.trash = os.path.join(directory, 'trash')
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.min_downloads = min_downloads
+        self.popularity = popularity or (lambda keys: {})
+        self._fill_locks = [threading.Lock() for _ in range(FILL_LOCKS)]
+        os.makedirs(self.trash, mode=0o700, exist_ok=True)
+        os.chmod(directory, 0o700)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def admits(self, size, download_count):
+        """Whether a file is hot enough, and small enough for the budget, to be cached"""
+        return size is not None and size <= self.max_bytes // 4 and (download_count or 0) >= self.min_downloads
+
+    def open(self, key):
+        """Open a fresh entry for reading, or None; the caller closes the file, which releases it"""
+        file = self._open_fresh(key)
+        CACHE_REQUESTS.labels('plaintext', 'hit' if file is not None else 'miss').inc()
+        return file
+
+    def _open_fresh(self, key):
+        path = self._path(key)
+        try:
+            file = open(path, 'rb')
+        except OSError:
+            return None
+        fcntl.flock(file.fileno(), fcntl.LOCK_SH)
+        stat = os.fstat(file.fileno())
+        now = time.time()
+        if stat.st_nlink == 0 or now - stat.st_mtime > self.ttl:
+            # Wiped while we waited for the lock, or expired
+            file.close()
+            if stat.st_nlink:
+                self._evict(path)
+            return None
+        try:
+            # Record the hit, keeping the decryption time
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            pass
+        return file
+
+    def get_or_fill(self, key, size, write):
+        """
+        Open an entry, filling it first if needed.
+
+        Concurrent misses for one key in this process wait for the first fill
+        and then read its entry, so the file is decrypted once.
+        """
+        with self._fill_locks[hash(key) % FILL_LOCKS]:
+            file = self._open_fresh(key)
+            if file is None:
+                file = self.fill(key, size, write)
+            return file
+
+    def fill(self, key, size, write):
+        """
+        Create an entry and open it for reading.
+
+        Args:
+            key: Entry key (the file UUID)
+            size: Expected plaintext size, room is made for it first
+            write: Called with a path to write the plaintext to; returns that path on success
+
+        Returns:
+            file: The new entry, open like open(); None if write() failed
+        """
+        self.sweep(incoming=size)
+        temp_path = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            if write(temp_path) != temp_path:
+                return None
+            # Locked before it becomes visible, so it cannot be wiped under us
+            file = open(temp_path, 'rb')
+            fcntl.flock(file.fileno(), fcntl.LOCK_SH)
+            # A copy filled concurrently is wiped rather than just unlinked by the replace
+            self.discard(key)
+            os.replace(temp_path, self._path(key))
+            return file
+        finally:
+            if os.path.exists(temp_path):
+                self._wipe(temp_path)
+
+    def discard(self, key):
+        """Evict an entry, e.g. when its file is deleted"""
+        if os.path.exists(self._path(key)):
+            self._evict(self._path(key))
+
+    def sweep(self, incoming=0):
+        """Evict expired entries, then the least popular ones until incoming more bytes fit; wipe the trash"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                self._evict(path)
+            else:
+                entries.append((name[:-len(ENTRY_SUFFIX)], path, stat))
+
+        total = sum(stat.st_size for _key, _path, stat in entries) + (incoming or 0)
+        if total > self.max_bytes:
+            counts = self.popularity([key for key, _path, _stat in entries])
+
+            def score(entry):
+                key, _path, stat = entry
+                return counts.get(key, 0) / (1 + max(0, now - stat.st_atime) / IDLE_HALF_SCORE)
+
+            for key, path, stat in sorted(entries, key=score):
+                if total <= self.max_bytes:
+                    break
+                self._evict(path)
+                total -= stat.st_size
+        self._wipe_trash()
+
+    def clear(self):
+        """Evict every entry"""
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_SUFFIX):
+                self._evict(os.path.join(self.directory, name))
+
+    def _evict(self, path):
+        # The rename is atomic: new readers miss, current readers keep their open file
+        trash_path = os.path.join(self.trash, uuid.uuid4().hex)
+        try:
+            os.rename(path, trash_path)
+        except OSError:
+            return
+        self._wipe(trash_path)
+
+    def _wipe_trash(self):
+        for name in os.listdir(self.trash):
+            self._wipe(os.path.join(self.trash, name))
+
+    def _wipe(self, path):
+        """Overwrite a file with zeros and unlink it, unless a reader still holds it"""
+        try:
+            file = open(path, 'r+b')
+        except OSError:
+            return
+        with file:
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Still being sent; a later sweep wipes it
+                return
+            try:
+                remaining = os.fstat(file.fileno()).st_size
+                zeros = bytes(min(remaining, WIPE_CHUNK))
+                while remaining > 0:
+                    remaining -= file.write(zeros[:remaining])
+                file.flush()
+                os.fsync(file.fileno())
+                os.unlink(path)
+            except OSError as e:
+                logger.warning(f"Could not wipe cached plaintext {path}: {str(e)}")
+
+
+def init_app(app, popularity=None):
+    """
+    Attach a PlaintextCache configured from PLAINTEXT_CACHE_* environment variables.
+
+    The cache is off unless PLAINTEXT_CACHE_DIR is set.
+
+    Args:
+        app: Flask application instance
+        popularity: Callable mapping a list of file UUIDs to {uuid: download_count}
+
+    Returns:
+        PlaintextCache: The cache (or None), also stored in app.extensions['plaintext_cache']
+    """
+    directory = os.environ.get('PLAINTEXT_CACHE_DIR')
+    cache = None
+    if directory:
+        cache = PlaintextCache(
+            directory,
+            max_bytes=int(os.environ.get('PLAINTEXT_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+            ttl=float(os.environ.get('PLAINTEXT_CACHE_TTL', 600)),
+            min_downloads=int(os.environ.get('PLAINTEXT_CACHE_MIN_DOWNLOADS', 2)),
+            popularity=popularity
+        )
+    app.extensions['plaintext_cache'] = cache
+    return cache
@@ -0,0 +1,137 @@
+import os
+import io
+import re
+import time
+import glob
+import pstats
+import random
+import cProfile
+import datetime
+import threading
+from flask import g, request
+
+# Configuration from environment
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.getcwd(), 'logs', 'profiles'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))  # 0.0 - 1.0
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '50'))
+PROFILE_HEADER = 'X-Profile'
+
+# Profile names are generated by us, anything else is rejected
+PROFILE_NAME_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}_[0-9]+_[A-Za-z0-9_.-]+_[0-9]+ms\.prof$')
+
+# Only one request per process is profiled at a time
+_profile_lock = threading.Lock()
+
+
+def _should_profile(is_admin):
+    if request.headers.get(PROFILE_HEADER) and is_admin():
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _rotate(directory, max_files):
+    """Delete the oldest profiles so at most max_files remain"""
+    profiles = sorted((path for path in glob.glob(os.path.join(directory, '*.prof'))
+                       if PROFILE_NAME_PATTERN.match(os.path.basename(path))), key=os.path.getmtime)
+    for path in profiles[:max(0, len(profiles) - max_files)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def init_app(app, is_admin):
+    """
+    Install the opt-in request profiler.
+
+    A request is profiled when it carries the X-Profile header together with
+    admin credentials, or when it is picked by PROFILE_SAMPLE_RATE.
+
+    Args:
+        app: Flask application instance
+        is_admin: Callable returning True if the current request has admin credentials
+    """
+    app.config.setdefault('PROFILE_DIR', PROFILE_DIR)
+    app.config.setdefault('PROFILE_MAX_FILES', PROFILE_MAX_FILES)
+
+    @app.before_request
+    def _start_profiler():
+        if not _should_profile(is_admin) or not _profile_lock.acquire(blocking=False):
+            return
+        g.profiler = cProfile.Profile()
+        g.profiler_start = time.perf_counter()
+        g.profiler.enable()
+
+    @app.after_request
+    def _stop_profiler(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        try:
+            profiler.disable()
+            elapsed_ms = int((time.perf_counter() - g.pop('profiler_start')) * 1000)
+            directory = app.config['PROFILE_DIR']
+            os.makedirs(directory, exist_ok=True)
+
+            endpoint = re.sub(r'[^A-Za-z0-9_.-]', '-', request.endpoint or 'unmatched')
+            stamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+            name = f"{stamp}_{os.getpid()}_{endpoint}_{elapsed_ms}ms.prof"
+            profiler.dump_stats(os.path.join(directory, name))
+            _rotate(directory, app.config['PROFILE_MAX_FILES'])
+
+            response.headers['X-Profile-Id'] = name
+            app.logger.info(f"Request profile saved: {name}")
+        except Exception as e:
+            app.logger.error(f"Error saving request profile: {str(e)}")
+        finally:
+            _profile_lock.release()
+        return response
+
+    @app.teardown_request
+    def _discard_profiler(exc):
+        # Only set here if after_request did not run (e.g. another after_request hook raised)
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+
+
+def list_profiles(directory):
+    """Return metadata for the stored profiles, newest first"""
+    profiles = []
+    for path in glob.glob(os.path.join(directory, '*.prof')):
+        name = os.path.basename(path)
+        # Other .prof files in the directory are not ours to list
+        if not PROFILE_NAME_PATTERN.match(name):
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        _, pid, rest = name.split('_', 2)
+        endpoint, duration = rest.rsplit('_', 1)
+        profiles.append({
+            'name': name,
+            'endpoint': endpoint,
+            'pid': int(pid),
+            'duration_ms': int(duration[:-len('ms.prof')]),
+            'size': stat.st_size,
+            'created': datetime.datetime.utcfromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+        })
+    return sorted(profiles, key=lambda profile: profile['created'], reverse=True)
+
+
+def profile_path(directory, name):
+    """Return the path of a stored profile, or None if the name is not valid"""
+    if not PROFILE_NAME_PATTERN.match(name):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isfile(path) else None
+
+
+def profile_summary(path, limit=50, sort='cumulative'):
+    """Render a pstats text summary of a stored profile"""
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback, forwardRef, useImperativeHandle } from 'react';
+import React, { useState, useEffect, useCallback, useRef, forwardRef, useImperativeHandle } from 'react';
 import axios from 'axios';
 import { useTranslation } from 'react-i18next';
 
@@ -15,23 +15,52 @@ const ActivityLog = forwardRef((props, ref) => {
   const [passwordError, setPasswordError] = useState('');
   const [downloadLoading, setDownloadLoading] = useState(false);
   const [isInitialLoad, setIsInitialLoad] = useState(true);
+  // Cursor and ETag of the last response, so refreshes only fetch what changed
+  const cursorRef = useRef(null);
+  const etagRef = useRef(null);
+
+  const applyLogs = useCallback((response) => {
+    const data = response.data;
+    cursorRef.current = data.cursor || null;
+    etagRef.current = response.headers.etag || null;
+    if (data.full !== false) {
+      setFiles(data.files || []);
+      setUploadLogs(data.upload_logs || []);
+      setDownloadLogs(data.download_logs || []);
+      return;
+    }
+    const changed = new Map((data.files || []).map(file => [file.id, file]));
+    const removed = new Set(data.removed || []);
+    setFiles(current => [
+      ...changed.values(),
+      ...current.filter(file => !changed.has(file.id) && !removed.has(file.id))
+    ].sort((a, b) => b.upload_date.localeCompare(a.upload_date)));
+    setUploadLogs(current => current.concat(data.upload_logs || []));
+    setDownloadLogs(current => current.concat(data.download_logs || []));
+  }, []);
 
   // Create a silent refresh function that doesn't show loading indicators
   const refreshLogsSilently = useCallback(async () => {
     try {
-      const response = await axios.get('/api/logs');
+      const response = await axios.get('/api/logs', {
+        params: cursorRef.current ? { since: cursorRef.current } : {},
+        headers: etagRef.current ? { 'If-None-Match': etagRef.current } : {},
+        validateStatus: status => (status >= 200 && status < 300) || status === 304
+      });
       
+      // 304: nothing changed since the last poll
+      if (response.status === 304) {
+        return;
+      }
       if (response.data.success) {
-        setFiles(response.data.files || []);
-        setUploadLogs(response.data.upload_logs || []);
-        setDownloadLogs(response.data.download_logs || []);
+        applyLogs(response);
       } else {
         setError(response.data.message || t('Could not load logs.'));
       }
     } catch (err) {
       setError(err.response?.data?.message || t('Could not load logs.'));
     }
-  }, [t]);
+  }, [t, applyLogs]);
 
   // Original fetchLogs function that shows loading indicators (for initial load)
   const fetchLogs = useCallback(async () => {
@@ -40,9 +69,7 @@ const ActivityLog = forwardRef((props, ref) => {
       const response = await axios.get('/api/logs');
       
       if (response.data.success) {
-        setFiles(response.data.files || []);
-        setUploadLogs(response.data.upload_logs || []);
-        setDownloadLogs(response.data.download_logs || []);
+        applyLogs(response);
       } else {
         setError(response.data.message || t('Could not load logs.'));
       }
@@ -54,7 +81,7 @@ const ActivityLog = forwardRef((props, ref) => {
       setLoading(false);
       setIsInitialLoad(false);
     }
-  }, [t]);
+  }, [t, applyLogs]);
 
   // Expose methods via ref
   useImperativeHandle(ref, () => ({
@@ -82,6 +109,28 @@ const ActivityLog = forwardRef((props, ref) => {
     loadBootstrapModal();
   }, [fetchLogs]);
 
+  // Live activity: one event stream instead of polling; each burst of events triggers one delta fetch
+  useEffect(() => {
+    if (typeof window === 'undefined' || !window.EventSource) {
+      return undefined;
+    }
+    const source = new EventSource('/api/events');
+    let timer = null;
+    const scheduleRefresh = () => {
+      if (!timer) {
+        timer = setTimeout(() => {
+          timer = null;
+          refreshLogsSilently();
+        }, 250);
+      }
+    };
+    ['upload', 'ready', 'failed', 'download', 'delete', 'resync'].forEach(type => source.addEventListener(type, scheduleRefresh));
+    return () => {
+      clearTimeout(timer);
+      source.close();
+    };
+  }, [refreshLogsSilently]);
+
   const initiateDownload = (fileId) => {
     console.log('Initiating download for file:', fileId);
     setSelectedFileId(fileId);
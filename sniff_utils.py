@@ -0,0 +1,157 @@
+import re
+import hashlib
+
+# Magic signatures of the allowed upload types, compiled once per extension.
+# PDF readers accept the header anywhere in the first KiB, the others must start the file.
+SIGNATURES = {
+    'pdf': [rb'.{0,1024}?%PDF-'],
+    'png': [re.escape(b'\x89PNG\r\n\x1a\n')],
+    'jpg': [re.escape(b'\xff\xd8\xff')],
+    'jpeg': [re.escape(b'\xff\xd8\xff')],
+    'gif': [re.escape(b'GIF87a'), re.escape(b'GIF89a')],
+    # OOXML documents are ZIP archives; an empty archive starts with the end-of-central-directory record
+    'zip': [re.escape(b'PK\x03\x04'), re.escape(b'PK\x05\x06')],
+    'docx': [re.escape(b'PK\x03\x04')],
+    'xlsx': [re.escape(b'PK\x03\x04')],
+    # OLE2 compound document (legacy Office)
+    'doc': [re.escape(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1')],
+    'xls': [re.escape(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1')],
+}
+COMPILED_SIGNATURES = {
+    extension: re.compile(rb'\A(?:' + b'|'.join(patterns) + rb')', re.S)
+    for extension, patterns in SIGNATURES.items()
+}
+
+# Content type of an upload that passed the checks for its extension
+MIME_TYPES = {
+    'txt': 'text/plain',
+    'pdf': 'application/pdf',
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'zip': 'application/zip',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'doc': 'application/msword',
+    'xls': 'application/vnd.ms-excel',
+}
+
+# Parts every file of the type must contain somewhere in its body
+REQUIRED_MARKERS = {
+    'docx': b'[Content_Types].xml',
+    'xlsx': b'[Content_Types].xml',
+}
+
+# Byte order marks of UTF-16/32 text, which legitimately contains NUL bytes
+TEXT_BOMS = (b'\xff\xfe', b'\xfe\xff')
+
+DANGEROUS_PATTERN = re.compile(rb'<\s{0,16}(?:script|iframe)\b', re.I)
+
+# Bytes inspected for the signature (and, for text, for NUL bytes)
+HEAD_SIZE = 2048
+# Bytes carried over between chunks so patterns split across a boundary are found
+OVERLAP = 64
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """Raised when an upload fails validation; reason is 'size', 'type' or 'content'"""
+
+    def __init__(self, reason, detail):
+        super().__init__(detail)
+        self.reason = reason
+
+
+class UploadSniffer:
+    """
+    Validate an upload incrementally while it is being written.
+
+    Feed every chunk to update() and call finish() at the end. The size limit,
+    the magic signature for the file extension and the dangerous-content scan
+    are all checked on the chunks as they pass, so validation needs no seeks
+    and no second read of the file. Errors are raised as soon as they can be
+    detected. The SHA-256 of the content is computed in the same pass.
+    """
+
+    def __init__(self, filename, max_size):
+        self.extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        self.max_size = max_size
+        self.size = 0
+        self._head = b''
+        self._type_checked = False
+        self._tail = b''
+        self._marker = REQUIRED_MARKERS.get(self.extension)
+        self._digest = hashlib.sha256()
+
+    def update(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise UploadRejected('size', f"upload exceeds {self.max_size} bytes")
+        self._digest.update(chunk)
+
+        if not self._type_checked:
+            self._head += chunk[:HEAD_SIZE - len(self._head)]
+            if len(self._head) >= HEAD_SIZE:
+                self._check_type()
+
+        window = self._tail + chunk
+        if DANGEROUS_PATTERN.search(window):
+            raise UploadRejected('content', "upload contains active content")
+        if self._marker and self._marker in window:
+            self._marker = None
+        self._tail = window[-OVERLAP:]
+
+    def finish(self):
+        """Run the checks that need the whole upload; returns the upload size"""
+        if not self._type_checked:
+            self._check_type()
+        if self._marker:
+            raise UploadRejected('type', f"{self.extension} upload is missing {self._marker.decode()}")
+        return self.size
+
+    @property
+    def sha256(self):
+        """Hex SHA-256 of the bytes seen so far"""
+        return self._digest.hexdigest()
+
+    @property
+    def mime_type(self):
+        """Content type of the upload once finish() accepted it"""
+        return MIME_TYPES.get(self.extension, 'application/octet-stream')
+
+    def _check_type(self):
+        self._type_checked = True
+        signature = COMPILED_SIGNATURES.get(self.extension)
+        if signature is not None:
+            if not signature.match(self._head):
+                raise UploadRejected('type', f"content does not match the .{self.extension} signature")
+        elif self.extension == 'txt':
+            if b'\x00' in self._head and not self._head.startswith(TEXT_BOMS):
+                raise UploadRejected('type', "binary content in a text upload")
+        else:
+            raise UploadRejected('type', f"no signature for .{self.extension}")
+
+
+def copy_sniffed(source, destination, sniffer, chunk_size=CHUNK_SIZE):
+    """
+    Copy a stream to a file object in one pass, validating every chunk.
+
+    Args:
+        source: Readable binary stream, e.g. FileStorage.stream
+        destination: Writable binary file object
+        sniffer: UploadSniffer for the upload
+        chunk_size: Bytes read at a time
+
+    Returns:
+        int: Number of bytes copied
+
+    Raises:
+        UploadRejected: As soon as the upload fails validation
+    """
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return sniffer.finish()
+        sniffer.update(chunk)
+        destination.write(chunk)
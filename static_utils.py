@@ -0,0 +1,167 @@
+import os
+import re
+import sys
+import gzip
+import hashlib
+import mimetypes
+from flask import current_app, request, render_template, send_from_directory, Response
+from werkzeug.security import safe_join
+from metrics_utils import CACHE_REQUESTS
+
+# Brotli is optional - gzip siblings are always produced
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# File types worth precompressing (images and fonts are already compressed)
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.html', '.json', '.map', '.svg', '.txt', '.ico'}
+
+# Encodings in order of preference, mapped to the sibling file suffix
+ENCODING_SUFFIXES = [('br', '.br'), ('gzip', '.gz')]
+
+# Build output from react-scripts carries an 8 hex digit content hash, e.g. main.66359096.js
+HASHED_ASSET_PATTERN = re.compile(r'\.[0-9a-f]{8}(\.chunk)?\.(js|css)(\.map)?$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Cache of which precompressed siblings exist for an asset path; only existing
+# assets are cached, and at most SIBLING_CACHE_SIZE of them
+_sibling_cache = {}
+SIBLING_CACHE_SIZE = 4096
+
+# Cache of rendered SPA shell templates
+_shell_cache = {}
+
+
+def compress_assets(root, min_size=256):
+    """Write .gz (and .br when available) siblings next to every compressible asset under root"""
+    written = 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if os.path.splitext(filename)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+
+            with open(path, 'rb') as source:
+                data = source.read()
+            if len(data) < min_size:
+                continue
+
+            compressed = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['.br'] = brotli.compress(data, quality=11)
+
+            for suffix, payload in compressed.items():
+                # Only keep a sibling if it is actually smaller than the original
+                if len(payload) >= len(data):
+                    continue
+                with open(path + suffix, 'wb') as target:
+                    target.write(payload)
+                written += 1
+
+    _sibling_cache.clear()
+    return written
+
+
+def is_hashed_asset(filename):
+    """Check if a filename carries a build content hash and can be cached forever"""
+    return bool(HASHED_ASSET_PATTERN.search(filename))
+
+
+def _available_encodings(path):
+    """Return the precompressed encodings present on disk for an asset"""
+    encodings = _sibling_cache.get(path)
+    if encodings is None or current_app.debug:
+        # Unknown URLs must not grow the cache; send_from_directory answers them with 404
+        if path is None or not os.path.isfile(path):
+            return []
+        encodings = [encoding for encoding, suffix in ENCODING_SUFFIXES if os.path.isfile(path + suffix)]
+        if len(_sibling_cache) < SIBLING_CACHE_SIZE:
+            _sibling_cache[path] = encodings
+    return encodings
+
+
+def send_static_asset(directory, filename):
+    """Send a static asset, preferring a precompressed sibling accepted by the client"""
+    path = safe_join(directory, filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    chosen = None
+    for encoding in _available_encodings(path):
+        if encoding in request.accept_encodings:
+            chosen = encoding
+            break
+
+    if chosen:
+        suffix = dict(ENCODING_SUFFIXES)[chosen]
+        response = send_from_directory(directory, filename + suffix, mimetype=mimetype)
+        response.headers['Content-Encoding'] = chosen
+        # The sibling's own name must not leak into the response
+        response.headers.pop('Content-Disposition', None)
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype)
+
+    response.vary.add('Accept-Encoding')
+    if is_hashed_asset(filename):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    return response
+
+
+def _render_shell(template_name):
+    """Render the SPA shell once and keep the body, its ETag and a gzip copy in memory"""
+    cached = _shell_cache.get(template_name)
+    if cached is None or current_app.debug or current_app.config.get('TEMPLATES_AUTO_RELOAD'):
+        CACHE_REQUESTS.labels('spa_shell', 'miss').inc()
+        body = render_template(template_name).encode('utf-8')
+        cached = {
+            'body': body,
+            'gzip': gzip.compress(body, compresslevel=9, mtime=0),
+            'etag': hashlib.sha1(body).hexdigest()
+        }
+        _shell_cache[template_name] = cached
+    else:
+        CACHE_REQUESTS.labels('spa_shell', 'hit').inc()
+    return cached
+
+
+def send_spa_shell(template_name):
+    """Serve the SPA shell from the in-memory cache with ETag revalidation"""
+    cached = _render_shell(template_name)
+
+    # The same ETag covers both encodings, so it is marked weak
+    if request.if_none_match.contains_weak(cached['etag']):
+        response = Response(status=304)
+    elif 'gzip' in request.accept_encodings:
+        response = Response(cached['gzip'], mimetype='text/html')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(cached['body'], mimetype='text/html')
+
+    response.set_etag(cached['etag'], weak=True)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    return response
+
+
+def preload_spa_shell(template_name):
+    """Render the SPA shell into the cache ahead of the first request (needs a request context)"""
+    _render_shell(template_name)
+
+
+def clear_caches():
+    """Drop cached shell renders and sibling lookups (e.g. after a new frontend build)"""
+    _sibling_cache.clear()
+    _shell_cache.clear()
+
+
+if __name__ == '__main__':
+    # Build step: python static_utils.py [static/react]
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'react')
+    count = compress_assets(target)
+    print(f"Wrote {count} precompressed assets under {target}")
+    if brotli is None:
+        print("brotli module not installed, only gzip siblings were written")
@@ -1,7 +1,14 @@
 import os
 import tempfile
 import pytest
+
+# Tests create their own schema; never run startup cleanup against the working directory
+os.environ.setdefault('BOOTSTRAP_ON_IMPORT', 'false')
+# A stable master key, so data keys wrapped during a test can be unwrapped in the same test
+os.environ.setdefault('MASTER_ENCRYPTION_KEY', 'x7yLzeuc0YpqVQPLGv9JSDZdjk5yX7dPjjyBYd6x0gU=')
+
 from app import app as flask_app
+import transfer_utils
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -18,7 +25,9 @@ def app():
         'SQLALCHEMY_DATABASE_URI': test_db_url,
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
         'UPLOAD_FOLDER': tempfile.mkdtemp(),
-        'WTF_CSRF_ENABLED': False
+        'WTF_CSRF_ENABLED': False,
+        'ASYNC_UPLOADS': False,
+        'JOB_QUEUE_PATH': os.path.join(tempfile.mkdtemp(), 'jobs.db')
     })
     
     # Create the database and context
@@ -27,8 +36,16 @@ def app():
         from app import db
         db.create_all()
     
+    # Rate limits must not carry over between tests
+    flask_app.extensions['admission'].reset()
+    # Test responses are not always closed, which is what returns a download's transfer slot;
+    # a fresh scheduler leaves slots still held to be released into the old one
+    transfer_utils.configure(flask_app)
+    
     yield flask_app
     
+    # Job workers of this test must not run against the next test's database
+    flask_app.extensions['jobs'].shutdown()
     # Teardown: close and remove the temporary database
     os.close(db_fd)
     os.unlink(db_path)
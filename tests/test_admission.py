@@ -0,0 +1,88 @@
+"""Tests for admission control in front of password checks."""
+import io
+
+from admission_utils import AdmissionController, MemoryBackend, SQLiteBackend, init_app
+
+
+def test_buckets_and_backoff():
+    """Bursts are limited per IP and per file; repeated failures back off."""
+    controller = AdmissionController(MemoryBackend(), ip_rate=0.01, ip_burst=2, file_rate=0.01, file_burst=3,
+                                     failure_threshold=2, backoff_base=60)
+    assert controller.check('10.0.0.1', 'a').allowed
+    assert controller.check('10.0.0.1', 'a').allowed
+    refused = controller.check('10.0.0.1', 'a')
+    assert not refused.allowed and refused.reason == 'ip_limited' and refused.retry_after > 0
+
+    # A second address still hits the per-file bucket
+    assert controller.check('10.0.0.2', 'a').allowed
+    assert controller.check('10.0.0.2', 'a').reason == 'file_limited'
+
+    controller.record_result('10.0.0.3', 'b', False)
+    assert controller.check('10.0.0.3', 'b').allowed
+    controller.record_result('10.0.0.3', 'b', False)
+    assert controller.check('10.0.0.3', 'b').reason == 'backoff'
+    controller.record_result('10.0.0.3', 'b', True)
+    assert controller.check('10.0.0.3', 'b').allowed
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    """Controllers on the same SQLite file (e.g. two workers) share their buckets."""
+    path = str(tmp_path / 'admission.db')
+    first = AdmissionController(SQLiteBackend(path), ip_rate=0.01, ip_burst=1)
+    second = AdmissionController(SQLiteBackend(path), ip_rate=0.01, ip_burst=1)
+    assert first.check('10.0.0.1').allowed
+    assert second.check('10.0.0.1').reason == 'ip_limited'
+
+
+def test_several_workers_default_to_a_shared_backend(tmp_path, monkeypatch):
+    """Buckets are per process with one worker and shared through SQLite with several."""
+    from flask import Flask
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('ADMISSION_BACKEND', raising=False)
+    monkeypatch.setenv('GUNICORN_WORKERS', '1')
+    assert isinstance(init_app(Flask(__name__)).backend, MemoryBackend)
+    monkeypatch.setenv('GUNICORN_WORKERS', '3')
+    controller = init_app(Flask(__name__))
+    assert isinstance(controller.backend, SQLiteBackend)
+    assert controller.backend.path == str(tmp_path / 'admission.db')
+
+
+def test_throttled_request_skips_bcrypt(client, app, monkeypatch):
+    """Over-limit attempts get 429 with Retry-After and never reach the password check."""
+    import app as app_module
+
+    upload = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(b'Throttled'), 'throttled.txt'), 'password': 'right'},
+        content_type='multipart/form-data'
+    ).get_json()
+
+    checks = []
+    original_check = app_module.check_password
+    monkeypatch.setattr(app_module, 'check_password', lambda *args: checks.append(args) or original_check(*args))
+    controller = app.extensions['admission']
+    monkeypatch.setattr(controller, 'failure_threshold', 2)
+    monkeypatch.setattr(controller, 'backoff_base', 60)
+
+    for _attempt in range(2):
+        assert client.post(f"/api/files/{upload['file_uuid']}", json={'password': 'wrong'}).status_code == 403
+    response = client.post(f"/api/files/{upload['file_uuid']}", json={'password': 'wrong'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert len(checks) == 2
+
+
+def test_zip_of_many_files_charges_the_ip_once_per_password_check(client, app):
+    """A ZIP of more files than the IP burst is admitted: one batch password means one bcrypt run."""
+    import zipfile
+    controller = app.extensions['admission']
+    count = int(controller.ip_burst) + 5
+    file_ids = [result['file_uuid'] for result in client.post(
+        '/api/upload/batch',
+        data={'files': [(io.BytesIO(b'member %d' % i), f'member{i}.txt') for i in range(count)], 'password': 'zip-many'},
+        content_type='multipart/form-data'
+    ).get_json()['files']]
+
+    response = client.post('/api/download/zip', json={'file_ids': file_ids, 'password': 'zip-many'})
+    assert response.status_code == 200
+    assert len(zipfile.ZipFile(io.BytesIO(response.get_data())).namelist()) == count
@@ -0,0 +1,27 @@
+"""Tests for the application factory and bootstrap steps."""
+import os
+import tempfile
+
+from sqlalchemy import inspect
+
+
+def test_create_app_and_bootstrap_steps():
+    """create_app() touches nothing; bootstrap() runs the requested steps and times them."""
+    from app import create_app, bootstrap, db
+
+    db_fd, db_path = tempfile.mkstemp()
+    try:
+        app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{db_path}", 'UPLOAD_FOLDER': tempfile.mkdtemp()})
+        with app.app_context():
+            assert 'uploaded_file' not in inspect(db.engine).get_table_names()
+
+        timings = bootstrap(app, steps=('schema', 'warmup'))
+        assert list(timings) == ['schema', 'warmup']
+        with app.app_context():
+            assert 'uploaded_file' in inspect(db.engine).get_table_names()
+
+        response = app.test_client().get('/')
+        assert response.status_code == 200
+    finally:
+        os.close(db_fd)
+        os.unlink(db_path)
@@ -0,0 +1,37 @@
+"""Tests for the benchmark helpers."""
+from benchmarks.bench_crypto import compare_results, parse_size, format_size
+
+
+def test_parse_and_format_size():
+    """Human readable sizes round-trip."""
+    assert parse_size('64KB') == 64 * 1024
+    assert parse_size('1gb') == 1024 ** 3
+    assert format_size(16 * 1024 ** 2) == '16MB'
+
+
+def test_compare_results_flags_regressions():
+    """Only changes in the bad direction beyond the threshold are reported."""
+    baseline = {'results': {
+        'encrypt_file[1MB]': {'value': 100.0, 'higher_is_better': True},
+        'bcrypt_verify': {'value': 0.2, 'higher_is_better': False},
+        'decrypt_db_field': {'value': 1000.0, 'higher_is_better': True}
+    }}
+    current = {'results': {
+        'encrypt_file[1MB]': {'value': 80.0, 'higher_is_better': True},
+        'bcrypt_verify': {'value': 0.3, 'higher_is_better': False},
+        'decrypt_db_field': {'value': 1200.0, 'higher_is_better': True}
+    }}
+
+    regressions = compare_results(baseline, current, threshold=0.1)
+    assert sorted(name for name, *_ in regressions) == ['bcrypt_verify', 'encrypt_file[1MB]']
+
+
+def test_load_test_helpers():
+    """Size mixes parse with weights and percentiles use nearest rank."""
+    from benchmarks.load_test import parse_size_mix, percentile
+
+    assert parse_size_mix('1KB:50,1MB:10') == [(1024, 50.0), (1024 ** 2, 10.0)]
+    values = list(range(1, 101))
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([], 0.5) is None
@@ -13,6 +13,7 @@ from crypto_utils import (
     decrypt_db_field, 
     encrypt_file, 
     decrypt_file,
+    iter_decrypt_file,
     derive_key_from_password,
     encrypt_with_password,
     decrypt_with_password
@@ -93,6 +94,60 @@ class TestEncryption:
             if 'decrypted_path' in locals() and os.path.exists(decrypted_path):
                 os.remove(decrypted_path)
     
+    def test_segmented_file_encryption(self, tmp_path, monkeypatch):
+        """Files are encrypted in segments; tampering and legacy tokens are handled"""
+        import crypto_utils
+        from cryptography.fernet import Fernet, InvalidToken
+        
+        key = base64.urlsafe_b64encode(b'0' * 32)
+        monkeypatch.setenv('MASTER_ENCRYPTION_KEY', key.decode())
+        monkeypatch.setattr(crypto_utils, 'SEGMENT_SIZE', 1024)
+        
+        content = os.urandom(5000)
+        plain_path = tmp_path / 'plain.bin'
+        plain_path.write_bytes(content)
+        encrypted_path = encrypt_file(str(plain_path))
+        
+        chunks = list(iter_decrypt_file(encrypted_path))
+        assert [len(chunk) for chunk in chunks] == [1024, 1024, 1024, 1024, 904]
+        assert b''.join(chunks) == content
+        
+        # Dropping the final segment must not decrypt silently
+        with open(encrypted_path, 'rb') as f:
+            data = f.read()
+        truncated = tmp_path / 'truncated.bin.encrypted'
+        truncated.write_bytes(data[:len(crypto_utils.SEGMENT_MAGIC) + 4 + len(Fernet(key).encrypt(b'x' * 1033))])
+        with pytest.raises(InvalidToken):
+            list(iter_decrypt_file(str(truncated)))
+        
+        # Files written as a single token are still readable
+        legacy = tmp_path / 'legacy.bin.encrypted'
+        legacy.write_bytes(Fernet(key).encrypt(content))
+        assert b''.join(iter_decrypt_file(str(legacy))) == content
+    
+    @pytest.mark.parametrize('mode', ['thread', 'process'])
+    def test_parallel_file_encryption(self, tmp_path, monkeypatch, mode):
+        """Segments processed on a worker pool come back in order"""
+        import crypto_utils
+        
+        monkeypatch.setenv('MASTER_ENCRYPTION_KEY', base64.urlsafe_b64encode(b'0' * 32).decode())
+        monkeypatch.setattr(crypto_utils, 'SEGMENT_SIZE', 1024)
+        monkeypatch.setattr(crypto_utils, 'CRYPTO_PARALLEL_MODE', mode)
+        monkeypatch.setattr(crypto_utils, 'CRYPTO_WORKERS', 2)
+        monkeypatch.setattr(crypto_utils, 'CRYPTO_READ_AHEAD', 3)
+        monkeypatch.setattr(crypto_utils, 'CRYPTO_PARALLEL_MIN_SIZE', 0)
+        crypto_utils.shutdown_segment_executor()
+        
+        try:
+            content = os.urandom(20 * 1024 + 17)
+            plain_path = tmp_path / 'plain.bin'
+            plain_path.write_bytes(content)
+            encrypted_path = encrypt_file(str(plain_path))
+            assert encrypted_path.endswith('.encrypted')
+            assert b''.join(iter_decrypt_file(encrypted_path)) == content
+        finally:
+            crypto_utils.shutdown_segment_executor()
+    
     def test_password_derived_encryption(self):
         """Test encryption and decryption with password-derived keys"""
         original_data = b"Secret data protected with a password"
@@ -0,0 +1,78 @@
+"""Tests for the server-sent events push channel."""
+import io
+import json
+
+from events_utils import EventBus, MemoryBackend, SQLiteBackend, RESYNC, init_app
+
+
+def test_slow_subscriber_gets_resync_instead_of_unbounded_queue():
+    """Publishing never blocks; an overflowing subscriber queue collapses into one resync event."""
+    bus = EventBus(MemoryBackend(), max_queue=3, max_subscribers=1)
+    slow = bus.subscribe()
+    assert bus.subscribe() is None
+
+    for index in range(5):
+        bus.publish('upload', file_uuid=str(index))
+    events = [slow.get(timeout=0) for _ in range(3)]
+    assert events[0] is RESYNC
+    assert [event['data']['file_uuid'] for event in events[1:]] == ['3', '4']
+    slow.close()
+    assert bus.subscriber_count == 0
+
+    # Resuming from a known id replays what was missed, an unknown one gets a resync
+    last_id = events[1]['id']
+    resumed = bus.subscribe(last_event_id=last_id)
+    assert resumed.get(timeout=0)['data']['file_uuid'] == '4'
+    resumed.close()
+    assert bus.subscribe(last_event_id=1).get(timeout=0) is RESYNC
+
+
+def test_sqlite_backend_fans_out_across_buses(tmp_path):
+    """Buses sharing a SQLite backend file (e.g. two workers) see each other's events."""
+    path = str(tmp_path / 'events.db')
+    publisher = EventBus(SQLiteBackend(path, poll_interval=0.01))
+    listener = EventBus(SQLiteBackend(path, poll_interval=0.01))
+    subscription = listener.subscribe()
+    publisher.publish('delete', file_uuid='gone')
+    event = subscription.get(timeout=5)
+    assert event['type'] == 'delete' and event['data'] == {'file_uuid': 'gone'}
+
+
+def test_defaults_follow_gunicorn_settings(tmp_path, monkeypatch):
+    """Several workers share events through SQLite; streams may take half of a gthread worker's threads, none of a sync one."""
+    from flask import Flask
+    monkeypatch.chdir(tmp_path)
+    for name in ('EVENTS_BACKEND', 'EVENTS_MAX_SUBSCRIBERS', 'GUNICORN_WORKER_CLASS'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('GUNICORN_WORKERS', '5')
+    monkeypatch.setenv('GUNICORN_THREADS', '4')
+    bus = init_app(Flask(__name__))
+    assert isinstance(bus.backend, SQLiteBackend)
+    assert bus.max_subscribers == 2
+
+    # A stream would hold a sync worker's only thread
+    monkeypatch.setenv('GUNICORN_WORKER_CLASS', 'sync')
+    monkeypatch.setenv('GUNICORN_THREADS', '1')
+    bus = init_app(Flask(__name__))
+    assert bus.max_subscribers == 0 and bus.subscribe() is None
+
+
+def test_event_stream_pushes_uploads(client, app):
+    """An upload reaches an open /api/events stream as a text/event-stream message."""
+    app.config['EVENTS_HEARTBEAT'] = 0.05
+    response = client.get('/api/events', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    stream = iter(response.response)
+    assert next(stream).startswith(b'retry:')
+
+    upload = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(b'Pushed'), 'pushed.txt'), 'password': 'events-pass'},
+        content_type='multipart/form-data'
+    ).get_json()
+    message = next(chunk for chunk in stream if not chunk.startswith(b':'))
+    fields = dict(line.split(': ', 1) for line in message.decode().strip().split('\n'))
+    assert fields['event'] == 'upload'
+    assert json.loads(fields['data'])['file_uuid'] == upload['file_uuid']
+    response.close()
+    assert app.extensions['events'].subscriber_count == 0
@@ -0,0 +1,156 @@
+"""Tests for the file metadata captured at upload time."""
+import hashlib
+import io
+import os
+
+PDF = b'%PDF-1.7\n' + b'0' * 3000
+
+
+def upload(client, name, data):
+    response = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(data), name), 'password': 'meta-pass'},
+        content_type='multipart/form-data'
+    ).get_json()
+    assert response['success'] is True
+    return response['file_uuid']
+
+
+def test_upload_records_size_type_and_checksum(client, app):
+    """Sizes, content type and SHA-256 come from the single sniffing pass."""
+    file_uuid = upload(client, 'report.pdf', PDF)
+
+    with app.app_context():
+        from app import UploadedFile, stored_file_size
+        record = UploadedFile.query.get(file_uuid)
+        assert record.file_size == len(PDF)
+        assert record.sha256 == hashlib.sha256(PDF).hexdigest()
+        assert record.mime_type == 'application/pdf'
+        assert record.stored_size == stored_file_size(record.file_path) > len(PDF)
+        assert record.storage_status == 'present'
+
+
+def test_listing_trusts_storage_status_until_reconciled(client, app):
+    """/api/logs reads no file system state; the reconciler notices a deleted file."""
+    file_uuid = upload(client, 'notes.txt', b'listed')
+    for name in os.listdir(app.config['UPLOAD_FOLDER']):
+        if name.startswith(file_uuid):
+            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], name))
+
+    assert [f['id'] for f in client.get('/api/logs').get_json()['files']] == [file_uuid]
+
+    with app.app_context():
+        from app import reconcile_storage
+        assert reconcile_storage() == {'checked': 1, 'missing': 1, 'restored': 0, 'backfilled': 0}
+
+    assert client.get('/api/logs').get_json()['files'] == []
+
+
+def test_head_and_metadata_need_no_file_io(client, app, monkeypatch):
+    """HEAD and the metadata endpoint answer from the record with an opaque ETag; GET sends the same validators."""
+    file_uuid = upload(client, 'report.pdf', PDF)
+    digest = hashlib.sha256(PDF).hexdigest()
+
+    import app as app_module
+
+    def no_file_access(*args, **kwargs):
+        raise AssertionError('file accessed')
+
+    monkeypatch.setattr(app_module, 'decrypt_file', no_file_access)
+    monkeypatch.setattr(app_module, 'find_stored_file', no_file_access)
+
+    head = client.head(f'/api/download/{file_uuid}?authenticated=true')
+    assert head.status_code == 200
+    assert head.headers['Content-Length'] == str(len(PDF))
+    assert head.headers['Content-Type'] == 'application/pdf'
+    etag = head.headers['ETag']
+    assert len(etag) == 66 and digest not in etag
+    assert 'Last-Modified' in head.headers
+    assert client.head(f'/api/download/{file_uuid}').status_code == 401
+
+    # No password is needed here, so the plaintext digest is not disclosed
+    metadata = client.get(f'/api/files/{file_uuid}/metadata').get_json()
+    assert metadata['size'] == len(PDF) and metadata['etag'] == etag and metadata['downloadable'] is True
+    assert 'sha256' not in metadata and digest not in str(metadata)
+
+    monkeypatch.undo()
+    download = client.get(f'/api/download/{file_uuid}?authenticated=true')
+    assert download.data == PDF
+    assert download.headers['ETag'] == head.headers['ETag']
+
+
+def test_reconcile_survives_a_concurrent_delete(client, app, monkeypatch):
+    """A batch whose last record is deleted during the commit is skipped, not fatal."""
+    file_uuids = sorted(upload(client, f'file{i}.txt', b'reconciled') for i in range(2))
+
+    with app.app_context():
+        from sqlalchemy import text
+        from sqlalchemy.orm.exc import StaleDataError
+        from app import db, reconcile_storage, UploadedFile
+        real_commit = db.session.commit
+        commits = []
+
+        def racing_commit():
+            commits.append(1)
+            if len(commits) == 1:
+                with db.engine.begin() as connection:
+                    connection.execute(text("DELETE FROM uploaded_file WHERE id = :id"), {'id': file_uuids[-1]})
+                raise StaleDataError('deleted meanwhile')
+            real_commit()
+
+        monkeypatch.setattr(db.session, 'commit', racing_commit)
+        assert reconcile_storage()['checked'] == 2
+        assert [record.id for record in UploadedFile.query.all()] == file_uuids[:1]
+
+
+def test_head_of_a_record_without_size_is_not_a_download(client, app, monkeypatch):
+    """HEAD of an old encrypted upload without a recorded size omits Content-Length and leaves no trace."""
+    file_uuid = upload(client, 'old.pdf', PDF)
+    import app as app_module
+    with app.app_context():
+        record = app_module.UploadedFile.query.get(file_uuid)
+        record.file_size = None
+        app_module.db.session.commit()
+
+    def no_download(*args, **kwargs):
+        raise AssertionError('treated as a download')
+
+    monkeypatch.setattr(app_module, 'decrypt_file', no_download)
+    monkeypatch.setattr(app_module, 'decrypt_to_buffer', no_download)
+    monkeypatch.setattr(app_module, 'publish_activity', no_download)
+    monkeypatch.setattr(app_module, 'admit_transfer', no_download)
+
+    head = client.head(f'/api/download/{file_uuid}?authenticated=true')
+    assert head.status_code == 200
+    assert 'Content-Length' not in head.headers
+    assert head.headers['Content-Type'] == 'application/pdf'
+    with app.app_context():
+        assert app_module.UploadedFile.query.get(file_uuid).download_count == 0
+
+
+def test_recovered_orphans_get_their_metadata(client, app):
+    """Files repaired by check-files carry size, checksum and type like regular uploads."""
+    import uuid
+    from crypto_utils import encrypt_file
+    folder = app.config['UPLOAD_FOLDER']
+    plain_id, encrypted_id = str(uuid.uuid4()), str(uuid.uuid4())
+    with open(os.path.join(folder, f'{plain_id}_notes.txt'), 'wb') as f:
+        f.write(b'plain orphan')
+    source = os.path.join(folder, 'source.tmp')
+    with open(source, 'wb') as f:
+        f.write(PDF)
+    with app.app_context():
+        encrypt_file(source, os.path.join(folder, f'{encrypted_id}_report.pdf.encrypted'))
+    os.remove(source)
+
+    response = client.get('/api/admin/check-files', headers={'X-Admin-Key': 'admin-key'})
+    assert response.status_code == 200
+
+    with app.app_context():
+        from app import UploadedFile
+        plain = UploadedFile.query.get(plain_id)
+        assert (plain.file_size, plain.sha256) == (12, hashlib.sha256(b'plain orphan').hexdigest())
+        assert plain.file_type is not None and plain.storage_status == 'present'
+        encrypted = UploadedFile.query.get(encrypted_id)
+        assert (encrypted.file_size, encrypted.sha256) == (len(PDF), hashlib.sha256(PDF).hexdigest())
+        assert encrypted.mime_type == 'application/pdf' and encrypted.stored_size > len(PDF)
@@ -45,4 +45,56 @@ def test_upload_no_password(client):
     assert response.status_code == 200
     data = json.loads(response.data)
     assert 'message' in data
-    assert data['success'] is False 
\ No newline at end of file
+    assert data['success'] is False 
+
+def test_batch_upload(client, app):
+    """Several files share one password; invalid files are reported per file."""
+    response = client.post(
+        '/api/upload/batch',
+        data={
+            'files': [
+                (io.BytesIO(b'First file'), 'first.txt'),
+                (io.BytesIO(b'Second file'), 'second.txt'),
+                (io.BytesIO(b'Not allowed'), 'script.exe')
+            ],
+            'password': 'batchpassword'
+        },
+        content_type='multipart/form-data'
+    )
+
+    data = json.loads(response.data)
+    assert data['success'] is True
+    assert [result['success'] for result in data['files']] == [True, True, False]
+
+    for result in data['files'][:2]:
+        verify = client.post(f"/api/files/{result['file_uuid']}", json={'password': 'batchpassword'})
+        assert verify.get_json()['success'] is True
+
+def test_zip_download(client, app):
+    """Several files are streamed as one ZIP archive after their passwords are checked."""
+    import zipfile
+
+    uploads = client.post(
+        '/api/upload/batch',
+        data={
+            'files': [
+                (io.BytesIO(b'First file'), 'same.txt'),
+                (io.BytesIO(b'Second file'), 'same.txt')
+            ],
+            'password': 'zippassword'
+        },
+        content_type='multipart/form-data'
+    ).get_json()['files']
+    file_ids = [result['file_uuid'] for result in uploads]
+
+    denied = client.post('/api/download/zip', json={'file_ids': file_ids, 'password': 'wrong'})
+    assert denied.status_code == 403
+
+    response = client.post('/api/download/zip', json={'files': [{'id': file_id, 'password': 'zippassword'} for file_id in file_ids]})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+
+    archive = zipfile.ZipFile(io.BytesIO(response.get_data()))
+    assert archive.namelist() == ['same.txt', 'same (1).txt']
+    assert archive.read('same.txt') == b'First file'
+    assert archive.read('same (1).txt') == b'Second file'
@@ -0,0 +1,55 @@
+"""Tests for the production gunicorn configuration."""
+import os
+import runpy
+import logging
+import multiprocessing
+from types import SimpleNamespace
+
+import crypto_utils
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+def test_config_defaults_and_post_fork(monkeypatch):
+    """Worker count follows the worker class; post_fork drops inherited caches."""
+    monkeypatch.setenv('GUNICORN_WORKER_CLASS', 'sync')
+    monkeypatch.delenv('METRICS_DIR', raising=False)
+    monkeypatch.delenv('GUNICORN_WORKERS', raising=False)
+    config = runpy.run_path(CONFIG_PATH)
+    assert config['workers'] == 2 * multiprocessing.cpu_count() + 1
+    # Workers aggregate their metrics unless told otherwise
+    assert os.environ['METRICS_DIR'].endswith(f"fileupload-metrics-{os.getpid()}")
+    assert config['preload_app'] is True
+    assert config['max_requests'] and config['max_requests_jitter']
+
+    assert config['threads'] == 1
+
+    monkeypatch.setenv('GUNICORN_WORKER_CLASS', 'gthread')
+    monkeypatch.setenv('GUNICORN_WORKERS', '3')
+    monkeypatch.delenv('GUNICORN_THREADS', raising=False)
+    config = runpy.run_path(CONFIG_PATH)
+    assert config['workers'] == 3 and config['threads'] == 4
+
+    crypto_utils._key_cache['stale'] = b'key'
+    server = SimpleNamespace(log=logging.getLogger('gunicorn-test'))
+    config['post_fork'](server, SimpleNamespace(pid=os.getpid()))
+    assert crypto_utils._key_cache == {}
+
+
+def test_on_starting_exports_the_layout_and_resizes_the_preloaded_app(app, monkeypatch):
+    """The layout gunicorn runs with (command line included) reaches an app loaded before the hook."""
+    for name in ('GUNICORN_WORKERS', 'GUNICORN_THREADS', 'GUNICORN_WORKER_CLASS', 'METRICS_DIR'):
+        monkeypatch.delenv(name, raising=False)
+    for name in ('admission', 'events', 'transfers'):
+        monkeypatch.setitem(app.extensions, name, app.extensions[name])
+    config = runpy.run_path(CONFIG_PATH)
+
+    # e.g. gunicorn -c gunicorn.conf.py --workers 1 --threads 8 app:app
+    cfg = SimpleNamespace(workers=1, threads=8, worker_class_str='gthread')
+    config['on_starting'](SimpleNamespace(cfg=cfg, log=logging.getLogger('gunicorn-test')))
+
+    assert (os.environ['GUNICORN_WORKERS'], os.environ['GUNICORN_THREADS']) == ('1', '8')
+    assert os.environ['GUNICORN_WORKER_CLASS'] == 'gthread'
+    transfers = app.extensions['transfers']
+    assert transfers.classes['small'].limit == 8 and transfers.classes['large'].limit == 4
+    assert app.extensions['events'].max_subscribers == 4
@@ -0,0 +1,47 @@
+"""Tests for per-file data keys and master key rotation."""
+import io
+import base64
+
+OLD_KEY = base64.urlsafe_b64encode(b'1' * 32).decode()
+NEW_KEY = base64.urlsafe_b64encode(b'2' * 32).decode()
+
+
+def test_rotation_rewraps_data_keys_without_touching_files(client, app, monkeypatch):
+    """After rotation the file downloads with only the new master key configured."""
+    from app import UploadedFile, rotate_master_key, find_stored_file
+
+    monkeypatch.setenv('MASTER_ENCRYPTION_KEY', OLD_KEY)
+    upload = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(b'Envelope encrypted content'), 'envelope.txt'), 'password': 'rotate-me'},
+        content_type='multipart/form-data'
+    ).get_json()
+    file_uuid = upload['file_uuid']
+
+    with app.app_context():
+        record = UploadedFile.query.get(file_uuid)
+        old_wrapped_key = record.wrapped_key
+        stored_path = find_stored_file(file_uuid, record.file_path)
+        assert old_wrapped_key
+    with open(stored_path, 'rb') as f:
+        stored_bytes = f.read()
+
+    # Rotate: new key current, old key still accepted for decryption
+    monkeypatch.setenv('MASTER_ENCRYPTION_KEY', NEW_KEY)
+    monkeypatch.setenv('MASTER_ENCRYPTION_KEY_PREVIOUS', OLD_KEY)
+    with app.app_context():
+        counts = rotate_master_key(batch_size=1)
+        assert counts['rotated'] == 1 and counts['failed'] == 0
+
+    # Retire the old key entirely
+    monkeypatch.delenv('MASTER_ENCRYPTION_KEY_PREVIOUS')
+    with app.app_context():
+        record = UploadedFile.query.get(file_uuid)
+        assert record.wrapped_key != old_wrapped_key
+        assert record.file_name == 'envelope.txt'
+    with open(stored_path, 'rb') as f:
+        assert f.read() == stored_bytes
+
+    response = client.get(f'/api/download/{file_uuid}?authenticated=true')
+    assert response.status_code == 200
+    assert response.data == b'Envelope encrypted content'
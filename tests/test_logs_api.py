@@ -0,0 +1,50 @@
+"""Tests for incremental /api/logs polling."""
+import io
+
+
+def upload(client, name):
+    return client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(b'Logged content'), name), 'password': 'logs-pass'},
+        content_type='multipart/form-data'
+    ).get_json()['file_uuid']
+
+
+def test_unchanged_poll_gets_304(client, app):
+    """The weak ETag follows the change counter, so repeated polls are answered without a body."""
+    upload(client, 'first.txt')
+    response = client.get('/api/logs')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+
+    assert client.get('/api/logs', headers={'If-None-Match': etag}).status_code == 304
+
+    upload(client, 'second.txt')
+    assert client.get('/api/logs', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_since_cursor_returns_only_changes(client, app):
+    """A cursor yields the files and log events added after it; a deletion forces a full reload."""
+    first = upload(client, 'first.txt')
+    full = client.get('/api/logs').get_json()
+    assert full['full'] is True
+    assert first in [file['id'] for file in full['files']]
+
+    second = upload(client, 'second.txt')
+    delta = client.get('/api/logs', query_string={'since': full['cursor']}).get_json()
+    assert delta['full'] is False
+    assert [file['id'] for file in delta['files']] == [second]
+    assert len(delta['upload_logs']) == 1 and second in delta['upload_logs'][0]
+
+    client.post(f"/api/files/{first}", json={'password': 'logs-pass'})
+    counted = client.get('/api/logs', query_string={'since': delta['cursor']}).get_json()
+    assert [(file['id'], file['download_count']) for file in counted['files']] == [(first, 1)]
+
+    with app.app_context():
+        from app import db, UploadedFile
+        db.session.delete(UploadedFile.query.get(second))
+        db.session.commit()
+    reloaded = client.get('/api/logs', query_string={'since': counted['cursor']}).get_json()
+    assert reloaded['full'] is True
+    assert [file['id'] for file in reloaded['files']] == [first]
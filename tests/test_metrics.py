@@ -0,0 +1,75 @@
+"""Tests for the metrics registry and the /metrics endpoint."""
+import os
+import tempfile
+
+from metrics_utils import Registry, Counter, Gauge, Histogram, generate_latest
+
+
+def test_registry_merges_process_snapshots():
+    """Snapshots written by other processes are summed into one scrape."""
+    directory = tempfile.mkdtemp()
+    registry = Registry(directory=directory)
+    uploads = Counter('uploads', 'Uploads', registry=registry)
+    latency = Histogram('latency_seconds', 'Latency', ['route'], registry=registry, buckets=(0.1, 1.0, float('inf')))
+
+    uploads.inc(3)
+    latency.labels('/api/upload').observe(0.05)
+    registry.flush()
+
+    # Pretend the snapshot belongs to another worker and this process was just forked
+    os.rename(os.path.join(directory, f"metrics_{os.getpid()}.json"), os.path.join(directory, 'metrics_1.json'))
+    registry.reset_after_fork()
+    uploads.inc(2)
+
+    output = generate_latest(registry)
+    assert 'uploads_total 5' in output
+    assert 'latency_seconds_bucket{route="/api/upload",le="0.1"} 1' in output
+    assert 'latency_seconds_count{route="/api/upload"} 1' in output
+
+
+def test_snapshots_of_exited_workers_are_retired():
+    """A dead worker's counters stay in the totals, but its file is folded away and its gauges dropped."""
+    import json
+    import subprocess
+    directory = tempfile.mkdtemp()
+    registry = Registry(directory=directory)
+    uploads = Counter('uploads', 'Uploads', registry=registry)
+    busy = Gauge('busy', 'Busy', registry=registry)
+    exited = subprocess.Popen(['true'])
+    exited.wait()
+    with open(os.path.join(directory, f"metrics_{exited.pid}.json"), 'w') as f:
+        json.dump({'uploads': [[[], 7]], 'busy': [[[], 3]]}, f)
+
+    for _scrape in range(2):
+        output = generate_latest(registry)
+        assert 'uploads_total 7' in output
+        assert 'busy 3' not in output
+    assert sorted(name for name in os.listdir(directory) if name.endswith('.json')) == ['metrics_retired.json']
+
+
+def test_shared_gauge_is_not_summed_across_processes():
+    """A gauge of node-wide state reports the same value once however many workers read it."""
+    directory = tempfile.mkdtemp()
+    registry = Registry(directory=directory)
+    jobs = Gauge('jobs', 'Jobs', ['status'], registry=registry, aggregate='max')
+    waiting = Gauge('waiting', 'Waiting', registry=registry)
+    jobs.labels('queued').set(4)
+    waiting.set(1)
+    registry.flush()
+    # The parent process (still alive) stands in for another worker
+    os.rename(os.path.join(directory, f"metrics_{os.getpid()}.json"), os.path.join(directory, f"metrics_{os.getppid()}.json"))
+
+    output = generate_latest(registry)
+    assert 'jobs{status="queued"} 4' in output
+    assert 'waiting 2' in output
+
+
+def test_metrics_requires_admin(client):
+    """The metrics endpoint is only available with the admin key."""
+    assert client.get('/metrics').status_code == 401
+
+    client.get('/api/logs')
+    response = client.get('/metrics', headers={'X-Admin-Key': 'admin-key'})
+    assert response.status_code == 200
+    assert b'http_request_duration_seconds_bucket{method="GET",route="/api/logs"' in response.data
+    assert b'jobs{status="queued"}' in response.data
@@ -0,0 +1,43 @@
+"""Tests for the versioned schema migrations."""
+import os
+import tempfile
+
+from sqlalchemy import create_engine, inspect, text
+
+from db_utils import upgrade, current_version, MIGRATIONS
+
+
+def test_upgrade_adds_indexes_to_existing_table():
+    """A database created before migrations existed is brought up to date once."""
+    db_fd, db_path = tempfile.mkstemp()
+    engine = create_engine(f"sqlite:///{db_path}")
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE uploaded_file (id VARCHAR(36) PRIMARY KEY, upload_date DATETIME, download_count INTEGER)"
+            ))
+
+        applied = upgrade(engine)
+        assert applied == [migration.version for migration in MIGRATIONS]
+        assert current_version(engine) == MIGRATIONS[-1].version
+
+        indexes = {index['name'] for index in inspect(engine).get_indexes('uploaded_file')}
+        assert 'ix_uploaded_file_upload_date' in indexes
+
+        # Nothing left to do on the second run
+        assert upgrade(engine) == []
+    finally:
+        engine.dispose()
+        os.close(db_fd)
+        os.unlink(db_path)
+
+
+def test_listing_query_uses_upload_date_index(app):
+    """The logs listing is served from the upload_date index instead of a full scan."""
+    from app import db
+
+    with app.app_context():
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM uploaded_file ORDER BY upload_date DESC"
+        )).fetchall()
+    assert 'ix_uploaded_file_upload_date' in ' '.join(str(row[-1]) for row in plan)
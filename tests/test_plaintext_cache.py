@@ -0,0 +1,76 @@
+"""Tests for the opt-in plaintext cache of hot files."""
+import io
+import os
+import time
+
+import pytest
+
+from plaintext_cache import PlaintextCache
+
+
+def write_bytes(data):
+    def write(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+    return write
+
+
+def test_budget_evicts_least_popular_and_wipes(tmp_path):
+    """Over budget, the entry with the lowest download count goes; entries being read are wiped later."""
+    counts = {'hot': 50, 'cold': 1}
+    cache = PlaintextCache(str(tmp_path / 'cache'), max_bytes=250, popularity=lambda keys: counts)
+    cache.fill('hot', 100, write_bytes(b'h' * 100)).close()
+    reading = cache.fill('cold', 100, write_bytes(b'c' * 100))
+
+    new = cache.fill('new', 100, write_bytes(b'n' * 100))
+    assert new.read() == b'n' * 100
+    new.close()
+    assert cache.open('cold') is None
+    assert cache.open('hot').read() == b'h' * 100
+
+    # The evicted entry is still intact for its reader and is wiped once released
+    assert reading.read() == b'c' * 100
+    assert len(os.listdir(cache.trash)) == 1
+    reading.close()
+    cache.sweep()
+    assert os.listdir(cache.trash) == []
+
+
+def test_entries_expire(tmp_path):
+    cache = PlaintextCache(str(tmp_path / 'cache'), max_bytes=1000, ttl=60)
+    cache.fill('file', 10, write_bytes(b'x' * 10)).close()
+    path = os.path.join(cache.directory, 'file.plain')
+    os.utime(path, (time.time(), time.time() - 61))
+    assert cache.open('file') is None
+    assert not os.path.exists(path)
+
+
+@pytest.fixture
+def cache(app, tmp_path):
+    from app import download_counts
+    app.extensions['plaintext_cache'] = PlaintextCache(str(tmp_path / 'cache'), max_bytes=10 ** 6,
+                                                       min_downloads=0, popularity=download_counts)
+    yield app.extensions['plaintext_cache']
+    app.extensions['plaintext_cache'] = None
+
+
+def test_repeat_downloads_skip_decryption(client, app, cache, monkeypatch):
+    data = b'cached content ' * 100
+    file_uuid = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(data), 'hot.txt'), 'password': 'cache-pass'},
+        content_type='multipart/form-data'
+    ).get_json()['file_uuid']
+
+    assert client.get(f'/api/download/{file_uuid}?authenticated=true').data == data
+
+    import app as app_module
+
+    def no_decrypt(*args, **kwargs):
+        raise AssertionError('decrypted again')
+
+    monkeypatch.setattr(app_module, 'decrypt_file', no_decrypt)
+    response = client.get(f'/api/download/{file_uuid}?authenticated=true')
+    assert response.data == data
+    assert response.headers['Content-Length'] == str(len(data))
@@ -0,0 +1,34 @@
+"""Tests for the on-demand request profiler."""
+import os
+import tempfile
+
+
+def test_profile_on_demand(client, app):
+    """An admin request with X-Profile is profiled and listed through the admin API."""
+    app.config['PROFILE_DIR'] = tempfile.mkdtemp()
+    # A profile someone else dropped there is neither listed nor a reason to fail
+    with open(os.path.join(app.config['PROFILE_DIR'], 'manual.prof'), 'wb') as f:
+        f.write(b'')
+    headers = {'X-Admin-Key': 'admin-key'}
+
+    response = client.get('/api/logs', headers={**headers, 'X-Profile': '1'})
+    name = response.headers['X-Profile-Id']
+
+    listing = client.get('/api/admin/profiles', headers=headers).get_json()
+    assert [profile['name'] for profile in listing['profiles']] == [name]
+
+    summary = client.get(f'/api/admin/profiles/{name}?format=text', headers=headers)
+    assert summary.status_code == 200
+    assert b'function calls' in summary.data
+
+    # Without admin credentials the header is ignored
+    assert 'X-Profile-Id' not in client.get('/api/logs', headers={'X-Profile': '1'}).headers
+
+
+def test_profiler_is_released_without_after_request(app):
+    """A request that ends before after_request still releases the profiler."""
+    from profiling_utils import _profile_lock
+    with app.test_request_context('/api/logs', headers={'X-Admin-Key': 'admin-key', 'X-Profile': '1'}):
+        app.preprocess_request()
+        assert _profile_lock.locked()
+    assert not _profile_lock.locked()
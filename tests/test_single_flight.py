@@ -0,0 +1,103 @@
+"""Tests for single-flight decryption of concurrent downloads."""
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from flight_utils import SingleFlight, SharedBuffer
+from transfer_utils import TransferClass, TransferScheduler
+
+
+def wait_for_callers(flights, key, count):
+    deadline = time.time() + 5
+    while flights._flights[key].callers < count and time.time() < deadline:
+        time.sleep(0.005)
+
+
+def test_concurrent_callers_share_one_private_buffer():
+    """One execution serves every caller; the buffer has no name and closes after the last reader."""
+    flights = SingleFlight()
+    calls = []
+
+    def produce():
+        calls.append(1)
+        wait_for_callers(flights, 'file', 4)
+        buffer = SharedBuffer()
+        with open(buffer.path, 'wb') as f:
+            f.write(b'plaintext' * 1000)
+        buffer.seal()
+        return buffer
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('file', produce))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _buffer, shared in results) == [False, True, True, True]
+    buffer = results[0][0]
+    assert all(result is buffer for result, _shared in results)
+    assert not os.path.exists(buffer.path)
+
+    readers = [buffer.reader(chunk_size=1000) for _ in results]
+    for reader in readers:
+        assert b''.join(reader) == b'plaintext' * 1000
+        reader.close()
+    with pytest.raises(OSError):
+        os.fstat(buffer.fd)
+    assert flights.in_flight() == 0
+
+
+def test_errors_reach_every_caller():
+    flights = SingleFlight()
+
+    def fail():
+        raise IOError('disk gone')
+
+    with pytest.raises(IOError):
+        flights.do('file', fail)
+    assert flights.in_flight() == 0
+
+
+def test_thundering_herd_decrypts_once(client, app, monkeypatch):
+    """Concurrent downloads of one file get the full content from a single decryption."""
+    data = b'herd ' * 5000
+    file_uuid = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(data), 'herd.txt'), 'password': 'herd-pass'},
+        content_type='multipart/form-data'
+    ).get_json()['file_uuid']
+
+    import app as app_module
+    real_decrypt = app_module.decrypt_file
+    calls = []
+
+    def slow_decrypt(*args, **kwargs):
+        calls.append(1)
+        wait_for_callers(app_module.decrypt_flights, file_uuid, 5)
+        return real_decrypt(*args, **kwargs)
+
+    monkeypatch.setattr(app_module, 'decrypt_file', slow_decrypt)
+    # All five downloads must be admitted at once to join the flight
+    monkeypatch.setitem(app.extensions, 'transfers', TransferScheduler(
+        large_bytes=1024 * 1024, small=TransferClass('small', 5, 0, 0), large=TransferClass('large', 1, 0, 0)
+    ))
+    bodies = []
+
+    def download():
+        response = app.test_client().get(f'/api/download/{file_uuid}?authenticated=true')
+        bodies.append((response.status_code, response.data, response.headers.get('Content-Length')))
+        response.close()
+
+    threads = [threading.Thread(target=download) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert bodies == [(200, data, str(len(data)))] * 5
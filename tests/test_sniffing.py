@@ -0,0 +1,71 @@
+"""Tests for single-pass upload content sniffing."""
+import io
+import os
+
+import pytest
+
+from sniff_utils import UploadSniffer, UploadRejected, copy_sniffed
+
+PNG = b'\x89PNG\r\n\x1a\n' + os.urandom(5000)
+
+
+def sniff(filename, data, max_size=10 * 1024 * 1024, chunk_size=1000):
+    return copy_sniffed(io.BytesIO(data), io.BytesIO(), UploadSniffer(filename, max_size), chunk_size)
+
+
+def test_signatures_match_extensions():
+    """Each allowed type is recognised by its magic bytes, not by its name."""
+    assert sniff('image.png', PNG) == len(PNG)
+    assert sniff('doc.pdf', b'\r\n%PDF-1.7\n' + b'x' * 3000)
+    assert sniff('legacy.xls', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + bytes(600))
+    assert sniff('notes.txt', b'plain text')
+    assert sniff('wide.txt', '﻿wide text'.encode('utf-16'))
+
+    for filename, data in [('image.jpg', PNG), ('fake.png', b'MZ\x90\x00' + bytes(4000)), ('tool.txt', b'MZ\x90\x00' + bytes(100))]:
+        with pytest.raises(UploadRejected) as rejected:
+            sniff(filename, data)
+        assert rejected.value.reason == 'type'
+
+
+def test_ooxml_requires_content_types_part():
+    """A .docx must be a ZIP archive containing [Content_Types].xml anywhere in its body."""
+    import zipfile
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as document:
+        document.writestr('word/document.xml', 'x' * 5000)
+        document.writestr('[Content_Types].xml', '<Types/>')
+    assert sniff('report.docx', archive.getvalue(), chunk_size=7)
+
+    plain_zip = io.BytesIO()
+    with zipfile.ZipFile(plain_zip, 'w') as other:
+        other.writestr('data.bin', 'x' * 5000)
+    assert sniff('bundle.zip', plain_zip.getvalue())
+    with pytest.raises(UploadRejected):
+        sniff('report.docx', plain_zip.getvalue())
+
+
+def test_whole_body_is_scanned_across_chunk_boundaries():
+    """Active content is found past the first KiBs and when split between chunks, and size is enforced."""
+    data = b'a' * 9998 + b'<SCRIPT>alert(1)</script>'
+    with pytest.raises(UploadRejected) as rejected:
+        sniff('notes.txt', data, chunk_size=10000)
+    assert rejected.value.reason == 'content'
+
+    with pytest.raises(UploadRejected) as rejected:
+        sniff('image.png', PNG, max_size=4096)
+    assert rejected.value.reason == 'size'
+
+
+def test_rejected_upload_leaves_no_file(client, app):
+    """A spoofed extension is refused by the upload endpoint and nothing stays in the uploads folder."""
+    before = set(os.listdir(app.config['UPLOAD_FOLDER']))
+    response = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(b'#!/bin/sh\x00rm -rf /'), 'photo.png'), 'password': 'secret'},
+        content_type='multipart/form-data'
+    )
+    data = response.get_json()
+    assert data['success'] is False
+    assert data['message'] == 'Invalid file type'
+    assert set(os.listdir(app.config['UPLOAD_FOLDER'])) == before
@@ -0,0 +1,53 @@
+"""Tests for precompressed static asset serving and the cached SPA shell."""
+import gzip
+import os
+import tempfile
+
+import static_utils
+
+
+def test_compress_assets_writes_gzip_siblings():
+    """Compressible assets get a smaller .gz sibling, images are skipped."""
+    root = tempfile.mkdtemp()
+    with open(os.path.join(root, 'main.12345678.js'), 'w') as f:
+        f.write('console.log("hello");\n' * 200)
+    with open(os.path.join(root, 'logo.png'), 'wb') as f:
+        f.write(b'\x89PNG' + b'\x00' * 1024)
+
+    static_utils.compress_assets(root)
+
+    assert os.path.exists(os.path.join(root, 'main.12345678.js.gz'))
+    assert not os.path.exists(os.path.join(root, 'logo.png.gz'))
+    with gzip.open(os.path.join(root, 'main.12345678.js.gz'), 'rb') as f:
+        assert f.read().startswith(b'console.log')
+
+
+def test_hashed_asset_is_immutable(client):
+    """Content-hashed bundle files are served with an immutable cache policy."""
+    response = client.get('/static/react/static/css/main.d9ff70d7.css')
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_spa_shell_etag_revalidation(client):
+    """The SPA shell carries an ETag and answers 304 when it is unchanged."""
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    etag = response.headers['ETag']
+
+    revalidated = client.get('/', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+
+
+def test_missing_assets_are_not_cached(client):
+    """Requests for assets that do not exist leave the sibling cache untouched."""
+    static_utils.clear_caches()
+    for i in range(5):
+        assert client.get(f'/static/react/static/js/missing.{i}.js').status_code == 404
+    assert client.get('/static/react/static/../../../app.py').status_code == 404
+    assert static_utils._sibling_cache == {}
+
+    client.get('/static/react/static/css/main.d9ff70d7.css')
+    assert len(static_utils._sibling_cache) == 1
@@ -0,0 +1,56 @@
+"""Tests for the maintained storage statistics."""
+import io
+import os
+
+ADMIN = {'X-Admin-Key': 'admin-key'}
+
+
+def upload(client, name, data):
+    response = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(data), name), 'password': 'stats-pass'},
+        content_type='multipart/form-data'
+    ).get_json()
+    assert response['success'] is True
+    return response['file_uuid']
+
+
+def test_stats_follow_uploads_downloads_and_deletes(client, app):
+    """Totals, per-type and per-day rows change in the same transaction as the uploads."""
+    assert client.get('/api/admin/stats').status_code == 401
+
+    kept = upload(client, 'notes.txt', b'x' * 100)
+    removed = upload(client, 'more.txt', b'y' * 50)
+    assert client.post(f'/api/files/{kept}', data={'password': 'stats-pass'}).status_code == 200
+
+    stats = client.get('/api/admin/stats', headers=ADMIN).get_json()
+    assert stats['totals'] == {'files': 2, 'bytes': 150, 'downloads': 1}
+    assert stats['by_type']['txt'] == {'files': 2, 'bytes': 150, 'downloads': 1}
+    assert stats['by_day'][-1]['files'] == 2 and stats['by_day'][-1]['downloads'] == 1
+
+    # A record whose file is gone is removed on the next download attempt
+    for name in os.listdir(app.config['UPLOAD_FOLDER']):
+        if name.startswith(removed):
+            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], name))
+    assert client.get(f'/api/download/{removed}?authenticated=true').status_code == 404
+
+    stats = client.get('/api/admin/stats', headers=ADMIN).get_json()
+    assert stats['totals'] == {'files': 1, 'bytes': 100, 'downloads': 1}
+    assert stats['by_day'][-1]['downloads'] == 1
+
+
+def test_recompute_corrects_drift(client, app):
+    """The periodic recompute rebuilds the aggregates from uploaded_file."""
+    upload(client, 'notes.txt', b'x' * 10)
+
+    with app.app_context():
+        from app import db, StorageStat, recompute_storage_stats
+        db.session.query(StorageStat).filter_by(scope='total').update({'files': 99, 'file_bytes': 0})
+        db.session.add(StorageStat(scope='type', key='pdf', files=3, file_bytes=30, downloads=0))
+        db.session.commit()
+
+        assert recompute_storage_stats() == {'files': 1, 'bytes': 10, 'downloads': 0}
+        db.session.commit()
+
+    stats = client.get('/api/admin/stats', headers=ADMIN).get_json()
+    assert stats['by_type'] == {'txt': {'files': 1, 'bytes': 10, 'downloads': 0}}
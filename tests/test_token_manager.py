@@ -0,0 +1,82 @@
+"""Tests for TokenManager verification caching and revocation."""
+import jwt
+import pytest
+from flask import Flask
+
+from auth_utils import TokenManager, MemoryRevocations, SQLiteRevocations
+
+
+@pytest.fixture
+def token_manager():
+    """A TokenManager on a bare app with the default per-process revocation list."""
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test-secret'
+    return TokenManager(app)
+
+
+def test_verified_token_is_cached(token_manager, monkeypatch):
+    """A second check of the same token skips the signature verification but not the type check."""
+    token = token_manager.generate_download_token('file-1', password_verified=True)
+    assert token_manager.verify_token(token, 'download')['file_uuid'] == 'file-1'
+
+    # A second check must not run the signature verification again
+    def fail(*args, **kwargs):
+        raise AssertionError("jwt.decode called for a cached token")
+    monkeypatch.setattr(jwt, 'decode', fail)
+    payload = token_manager.verify_token(token, 'download')
+    assert payload['password_verified'] is True
+    assert token_manager.verify_token(token, 'access') is None
+
+
+def test_cache_respects_expiry_and_size(token_manager):
+    """The cache is bounded by JWT_VERIFY_CACHE_SIZE and never holds expired tokens."""
+    token_manager.app.config['JWT_VERIFY_CACHE_SIZE'] = 2
+    tokens = [token_manager.generate_access_token(file_uuid=f"file-{i}") for i in range(3)]
+    for token in tokens:
+        assert token_manager.verify_token(token, 'access')
+    assert len(token_manager._cache) == 2
+
+    token_manager.app.config['JWT_ACCESS_TOKEN_EXPIRES'] = -1
+    expired = token_manager.generate_access_token()
+    assert token_manager.verify_token(expired) is None
+    assert len(token_manager._cache) == 2
+
+
+def test_revoked_token_is_rejected(token_manager):
+    """A revoked token fails verification even though its verified payload was cached."""
+    token = token_manager.generate_access_token(admin=True)
+    other = token_manager.generate_access_token(admin=True)
+    assert token_manager.verify_token(token, 'access')
+
+    assert token_manager.revoke_token(token) is True
+    assert token_manager.verify_token(token, 'access') is None
+    assert token_manager.verify_token(other, 'access')
+    assert token_manager.revoke_token('not-a-token') is False
+
+
+def test_sqlite_revocations_reach_other_workers(tmp_path):
+    """Managers sharing a SQLite revocation file (e.g. two workers) reject each other's revoked tokens."""
+    path = str(tmp_path / 'revocations.db')
+    managers = []
+    for _worker in range(2):
+        app = Flask(__name__)
+        app.config['JWT_SECRET_KEY'] = 'test-secret'
+        managers.append(TokenManager(app, revocations=SQLiteRevocations(path)))
+    first, second = managers
+
+    token = first.generate_access_token()
+    assert second.verify_token(token, 'access')
+    assert first.revoke_token(token) is True
+    assert second.verify_token(token, 'access') is None
+
+
+def test_several_workers_default_to_shared_revocations(tmp_path, monkeypatch):
+    """Revocations stay in memory with one worker and go through SQLite with several."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('JWT_REVOCATION_BACKEND', raising=False)
+    monkeypatch.setenv('GUNICORN_WORKERS', '1')
+    assert isinstance(TokenManager(Flask(__name__)).revocations, MemoryRevocations)
+    monkeypatch.setenv('GUNICORN_WORKERS', '3')
+    revocations = TokenManager(Flask(__name__)).revocations
+    assert isinstance(revocations, SQLiteRevocations)
+    assert revocations.path == str(tmp_path / 'revocations.db')
@@ -0,0 +1,86 @@
+"""Tests for size-class admission of uploads and downloads."""
+import io
+import threading
+import time
+
+from transfer_utils import TransferClass, TransferScheduler
+
+
+def scheduler(large_limit=1, large_queue=0, timeout=0.05):
+    return TransferScheduler(
+        large_bytes=1000,
+        small=TransferClass('small', 2, 2, timeout),
+        large=TransferClass('large', large_limit, large_queue, timeout)
+    )
+
+
+def test_classes_have_separate_slots():
+    """A full large class rejects large transfers without affecting small ones."""
+    transfers = scheduler()
+    large, small = transfers.classes['large'], transfers.classes['small']
+    assert transfers.classify(5000) == 'large'
+    assert transfers.classify(10) == transfers.classify(None) == 'small'
+
+    assert large.acquire()
+    assert not large.acquire()
+    assert small.acquire() and small.acquire()
+    large.release()
+    assert large.acquire()
+
+
+def test_queued_transfer_gets_a_released_slot():
+    large = TransferClass('large', 1, 1, timeout=5)
+    assert large.acquire()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(large.acquire()))
+    waiter.start()
+    while large.waiting == 0:
+        time.sleep(0.005)
+    # The queue is full: a third transfer is turned away at once
+    assert not large.acquire()
+    large.release()
+    waiter.join()
+    assert results == [True] and large.active == 1 and large.waiting == 0
+
+
+def test_overloaded_class_answers_503_and_slots_are_returned(client, app, monkeypatch):
+    monkeypatch.setitem(app.extensions, 'transfers', scheduler())
+    large = app.extensions['transfers'].classes['large']
+    data = b'x' * 5000
+
+    response = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(data), 'large.txt'), 'password': 'slot-pass'},
+        content_type='multipart/form-data'
+    )
+    file_uuid = response.get_json()['file_uuid']
+    response.close()
+    download = client.get(f'/api/download/{file_uuid}?authenticated=true')
+    assert download.data == data
+    download.close()
+    assert large.active == 0
+
+    assert large.acquire()
+    busy = client.get(f'/api/download/{file_uuid}?authenticated=true')
+    assert busy.status_code == 503 and 'Retry-After' in busy.headers
+    # Small transfers and HEAD requests still get through
+    small = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(b'small'), 'small.txt'), 'password': 'slot-pass'},
+        content_type='multipart/form-data'
+    )
+    assert small.get_json()['success'] is True
+    assert client.head(f'/api/download/{file_uuid}?authenticated=true').status_code == 200
+    large.release()
+
+
+def test_slots_outlive_a_reconfigured_scheduler(app):
+    """A slot taken before the scheduler is replaced is returned to its own class."""
+    import transfer_utils
+    old = app.extensions['transfers'].classes['large']
+    assert old.acquire()
+    new = transfer_utils.configure(app).classes['large']
+    old.release()
+    assert old.active == 0 and new.active == 0
+    assert new.acquire()
+    new.release()
@@ -0,0 +1,83 @@
+"""Tests for the durable job queue and asynchronous upload processing."""
+import io
+import time
+
+from job_queue import JobQueue
+
+
+def test_queue_retries_and_recovers_expired_leases(tmp_path):
+    """Failed jobs come back after their delay; a job whose worker died is claimed again."""
+    queue = JobQueue(str(tmp_path / 'jobs.db'), lease_seconds=60, retry_delay=0)
+    job_id = queue.enqueue('work', {'n': 1})
+    assert queue.claim() == (job_id, 'work', {'n': 1}, 1)
+    assert queue.claim() is None
+
+    queue.retry(job_id, 1, 'boom')
+    assert queue.claim()[3] == 2
+    queue.fail(job_id, 'boom again')
+    assert queue.counts() == {'failed': 1}
+
+    crashed = JobQueue(str(tmp_path / 'leases.db'), lease_seconds=0)
+    job_id = crashed.enqueue('work', {})
+    crashed.claim()
+    time.sleep(0.01)
+    assert crashed.claim()[0] == job_id
+    crashed.complete(job_id)
+    assert crashed.counts() == {}
+
+
+def test_periodic_jobs_keep_one_run_queued(tmp_path):
+    """Delayed unique jobs are not claimable early and are queued once however many workers start."""
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    assert queue.enqueue('tick', {}, delay=60, unique=True)
+    assert queue.enqueue('tick', {}, delay=60, unique=True) is None
+    assert queue.claim() is None
+    assert queue.counts() == {'queued': 1}
+
+
+def test_async_upload_becomes_downloadable(client, app):
+    """The upload returns before encryption; downloads wait until the job has run."""
+    app.config['ASYNC_UPLOADS'] = True
+    upload = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(b'Processed later'), 'later.txt'), 'password': 'async-pass'},
+        content_type='multipart/form-data'
+    ).get_json()
+    assert upload['success'] is True
+    file_uuid = upload['file_uuid']
+
+    deadline = time.time() + 10
+    status = client.get(f"/api/files/{file_uuid}/status").get_json()
+    while status['status'] == 'processing' and time.time() < deadline:
+        early = client.post(f"/api/files/{file_uuid}", json={'password': 'async-pass'})
+        assert early.status_code in (200, 409)
+        time.sleep(0.05)
+        status = client.get(f"/api/files/{file_uuid}/status").get_json()
+    assert status['status'] == 'ready' and status['downloadable'] is True
+
+    assert client.post(f"/api/files/{file_uuid}", json={'password': 'wrong'}).status_code == 403
+    assert client.post(f"/api/files/{file_uuid}", json={'password': 'async-pass'}).get_json()['success'] is True
+    download = client.get(f"/api/download/{file_uuid}?authenticated=true")
+    assert download.get_data() == b'Processed later'
+
+
+def test_upload_fails_when_processing_cannot_be_queued(client, app, monkeypatch):
+    """A record nothing would ever process is marked failed and its plaintext removed."""
+    import os
+    app.config['ASYNC_UPLOADS'] = True
+
+    def broken_enqueue(*args, **kwargs):
+        raise OSError('queue unavailable')
+
+    monkeypatch.setattr(app.extensions['jobs'], 'enqueue', broken_enqueue)
+    upload = client.post(
+        '/api/upload',
+        data={'file': (io.BytesIO(b'Never queued'), 'lost.txt'), 'password': 'async-pass'},
+        content_type='multipart/form-data'
+    ).get_json()
+    assert upload['success'] is False
+
+    with app.app_context():
+        from app import UploadedFile
+        assert [record.status for record in UploadedFile.query.all()] == ['failed']
+    assert os.listdir(app.config['UPLOAD_FOLDER']) == []
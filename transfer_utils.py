@@ -0,0 +1,178 @@
+import os
+import threading
+
+from flask import current_app, g, jsonify
+from werkzeug.wsgi import ClosingIterator
+
+from metrics_utils import QUEUE_DEPTH, TRANSFER_ADMISSIONS
+
+
+class TransferClass:
+    """
+    Concurrency limit and bounded wait queue for one size class of transfers.
+
+    A transfer takes a slot for as long as its response is being sent. When
+    all slots are taken, up to queue_size transfers wait at most timeout
+    seconds for one; the rest are rejected at once. Waiting holds a worker
+    thread, so queues are kept short.
+    """
+
+    def __init__(self, name, limit, queue_size, timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot; returns False if the class is overloaded"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.queue_size:
+                    return False
+                self.waiting += 1
+                QUEUE_DEPTH.labels(f'transfers_{self.name}').set(self.waiting)
+            try:
+                if not self._slots.acquire(timeout=self.timeout):
+                    return False
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+                    QUEUE_DEPTH.labels(f'transfers_{self.name}').set(self.waiting)
+        with self._lock:
+            self.active += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+
+class _Slot:
+    """A taken slot, released exactly once"""
+
+    def __init__(self, transfer_class):
+        self.transfer_class = transfer_class
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.transfer_class.release()
+
+
+class TransferScheduler:
+    """
+    Small and large transfers, each with its own slots and queue.
+
+    Large uploads and downloads can only occupy the large class's slots, so
+    the remaining worker threads stay free for small transfers and for
+    requests that are not transfers at all (status checks, listings, the SPA).
+    """
+
+    def __init__(self, large_bytes, small, large):
+        self.large_bytes = large_bytes
+        self.classes = {'small': small, 'large': large}
+
+    def classify(self, size):
+        """'large' from large_bytes up, 'small' otherwise (also when the size is unknown)"""
+        return 'large' if size is not None and size >= self.large_bytes else 'small'
+
+    def admit(self, size):
+        """
+        Take a slot in the size class of a transfer.
+
+        The slot is released when the response has been sent (or when the
+        request ends without one).
+
+        Args:
+            size: Bytes to be transferred, e.g. Content-Length or the stored file size
+
+        Returns:
+            Response: 503 with Retry-After if the class is overloaded, None if admitted
+        """
+        name = self.classify(size)
+        transfer_class = self.classes[name]
+        if not transfer_class.acquire():
+            TRANSFER_ADMISSIONS.labels(name, 'rejected').inc()
+            current_app.logger.warning(f"Rejected {name} transfer of {size} bytes: {transfer_class.active} active, {transfer_class.waiting} waiting")
+            response = jsonify({'success': False, 'message': "Server busy, please retry shortly"})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(max(1, int(transfer_class.timeout)))
+            return response
+        TRANSFER_ADMISSIONS.labels(name, 'admitted').inc()
+        g.transfer_slot = _Slot(transfer_class)
+        return None
+
+
+def admit_transfer(size):
+    """TransferScheduler.admit() of the current application"""
+    return current_app.extensions['transfers'].admit(size)
+
+
+def configure(app):
+    """
+    Create the app's TransferScheduler from TRANSFER_* environment variables.
+
+    Defaults derive from GUNICORN_THREADS (threads per worker): large
+    transfers get half of them, small ones all of them. Called again when
+    the worker layout is only known after the app was built (preload).
+
+    Args:
+        app: Flask application instance
+
+    Returns:
+        TransferScheduler: The scheduler, also stored in app.extensions['transfers']
+    """
+    threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+    timeout = float(os.environ.get('TRANSFER_QUEUE_TIMEOUT', 2))
+    scheduler = TransferScheduler(
+        large_bytes=int(os.environ.get('TRANSFER_LARGE_BYTES', 1024 * 1024)),
+        small=TransferClass('small', int(os.environ.get('TRANSFER_SMALL_CONCURRENCY', threads)),
+                            int(os.environ.get('TRANSFER_SMALL_QUEUE', threads)), timeout),
+        large=TransferClass('large', int(os.environ.get('TRANSFER_LARGE_CONCURRENCY', max(1, threads // 2))),
+                            int(os.environ.get('TRANSFER_LARGE_QUEUE', 1)), timeout)
+    )
+    app.extensions['transfers'] = scheduler
+    return scheduler
+
+
+def init_app(app):
+    """
+    Attach a TransferScheduler (see configure()) and release its slots once responses are sent.
+
+    Args:
+        app: Flask application instance
+
+    Returns:
+        TransferScheduler: The scheduler, also stored in app.extensions['transfers']
+    """
+    scheduler = configure(app)
+
+    @app.after_request
+    def _release_after_response(response):
+        slot = g.pop('transfer_slot', None)
+        if slot is None:
+            return response
+        if response.direct_passthrough:
+            # Handed to the server as is, without the response's close callbacks
+            response.response = ClosingIterator(response.response, slot.release)
+        elif response.is_streamed:
+            # The body is still to be sent; hold the slot until the server closes the response
+            response.call_on_close(slot.release)
+        else:
+            slot.release()
+        return response
+
+    @app.teardown_request
+    def _release_on_teardown(exc):
+        # Only set here if no response was produced
+        slot = g.pop('transfer_slot', None)
+        if slot is not None:
+            slot.release()
+
+    return scheduler
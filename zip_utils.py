@@ -0,0 +1,89 @@
+import os
+import zipfile
+import datetime
+
+# Members with these extensions are already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = {'.zip', '.jpg', '.jpeg', '.png', '.gif', '.pdf', '.docx', '.xlsx', '.pptx'}
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+class _StreamSink:
+    """
+    Write-only, non-seekable file object that collects what ZipFile writes.
+
+    ZipFile falls back to data descriptors when it cannot seek, so members can
+    be written without knowing their size in advance.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_file(path, chunk_size=FILE_CHUNK_SIZE):
+    """Yield the contents of a plain file chunk by chunk"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def unique_name(name, used):
+    """Return name, or name with a counter suffix if it is already in used"""
+    base, ext = os.path.splitext(name)
+    candidate = name
+    counter = 1
+    while candidate in used:
+        candidate = f"{base} ({counter}){ext}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+def stream_zip(members):
+    """
+    Build a ZIP archive on the fly.
+
+    Args:
+        members: Iterable of (archive name, iterable of byte chunks) pairs. The
+            chunk iterables are consumed lazily, one member at a time.
+
+    Yields:
+        bytes: Pieces of the archive; memory use is bounded by one chunk plus
+        the compressor state, regardless of the archive size
+    """
+    sink = _StreamSink()
+    used = set()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in members:
+            info = zipfile.ZipInfo(unique_name(name, used), date_time=datetime.datetime.now().timetuple()[:6])
+            info.external_attr = 0o644 << 16
+            if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            # force_zip64 because the member size is not known before it is written
+            with archive.open(info, mode='w', force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory, written when the archive is closed
+    yield sink.drain()